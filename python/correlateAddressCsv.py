@@ -7,6 +7,12 @@ import sys
 import os
 import xopen
 import fcntl
+import io
+import collections
+import multiprocessing
+import concurrent.futures
+import tempfile
+import numpy
 
 F_SETPIPE_SZ = 1031 if not hasattr(fcntl, "F_SETPIPE_SZ") else fcntl.F_SETPIPE_SZ
 F_GETPIPE_SZ = 1032 if not hasattr(fcntl, "F_GETPIPE_SZ") else fcntl.F_GETPIPE_SZ
@@ -18,6 +24,7 @@ correlateISelector = []
 parser = argparse.ArgumentParser(description="Correlate address csv binary")
 parser.add_argument("input", nargs="?", help="input csv")
 parser.add_argument("-o", "--output", help="output csv", default=None)
+parser.add_argument("--format", choices=['csv', 'columnar'], help="output format, columnar stores label ids and a dictionary per label (default: %(default)s)", default='csv')
 parser.add_argument("-b", "--binary", help="correlate to this single binary (only static!)")
 parser.add_argument("-v", "--vmmap", help="use vmmap to correlate binaries")
 parser.add_argument("-s", "--search-path", help="search paths for vmmap binaries", default=[], type=str, nargs="+")
@@ -33,6 +40,9 @@ parser.add_argument("--filter-unknown", help="filter out unknown addresses", def
 parser.add_argument("--only-filter-unknown", action="store_true", help="only filter addresses which are found in binary/vmmap", default=False)
 parser.add_argument("--include-comments", help="do not remove comments from input", default=False, action="store_true")
 parser.add_argument("--disable-cache", action="store_true", help="do not create or use prepared address caches", default=False)
+parser.add_argument("--memo", action="store_true", help="memoize correlated addresses next to the caches across runs (default: PPERF_MEMO)", default=False)
+parser.add_argument("-j", "--jobs", help="correlate chunks of rows in parallel worker processes (default: %(default)s)", type=int, default=1)
+parser.add_argument("--chunk-rows", help="rows per correlated block (default: %(default)s)", type=int, default=20000)
 parser.add_argument("--delimiter", default=';', help="correlate selector (default: '%(default)s')", type=str)
 
 
@@ -67,6 +77,11 @@ if args.kallsyms and (not os.path.isfile(args.kallsyms)):
     parser.print_help()
     sys.exit(1)
 
+if args.format == 'columnar' and not args.output:
+    print("ERROR: columnar output requires an output file!", file=sys.stderr)
+    parser.print_help()
+    sys.exit(1)
+
 if args.no_header and args.address_column:
     print("ERROR: cannot specify a address column without a header row in the file!", file=sys.stderr)
     parser.print_help()
@@ -88,6 +103,10 @@ if args.only_filter_unknown:
     args.filter_unknown = True
 
 correlateISelector = [i for i, x in enumerate(correlateSelectorNames) if x in correlateSelector]
+# Memos are kept per set of selected labels
+memoSelector = [correlateSelectorNames[i] for i in correlateISelector]
+# Disassembly is only loaded from the caches if it was selected
+selectAsm = 'asm' in correlateSelector
 args.only_filter_unknown = len(correlateSelector) == 0
 
 sampleParser = None
@@ -95,6 +114,9 @@ sampleParser = None
 if args.disable_cache:
     profileLib.disableCache = True
 
+if args.memo:
+    profileLib.sampleMemo = True
+
 sampleParser = profileLib.sampleParser()
 
 if not args.binary:
@@ -128,7 +150,9 @@ else:
 
 csvFile = csv.reader(fInput, delimiter=args.delimiter)
 
-if (args.output):
+if args.format == 'columnar':
+    outputFile = io.StringIO()
+elif (args.output):
     outputFile = xopen.xopen(args.output, 'w')
 else:
     outputFile = sys.stdout
@@ -137,6 +161,7 @@ outputCsv = csv.writer(outputFile, delimiter=args.delimiter)
 
 headerCol = args.address_icolumn
 colCount = None
+inputNames = None
 
 if not args.no_header:
     for header in csvFile:
@@ -155,63 +180,389 @@ if not args.no_header:
         sample = profileLib.SAMPLE.names + ['asm']
         outputCsv.writerow(header[:headerCol + 1] + selector(sample) + header[headerCol + 1:])
         colCount = len(header)
+        inputNames = header
         break
 
 invalidLabels = [args.label_none] * len(correlateISelector)
 
 seenPCs = set()
 sampleBuffer = dict()
+labelBuffer = dict()
 
-if args.only_filter_unknown:
-  for line in csvFile:
-    if line[0].startswith('#'):
-      if args.include_comments:
-        outputFile.write(args.delimiter.join(line) + '\n');
-      continue
-
-    if sampleParser.isPCKnown(int(line[headerCol], 0)):
-        outputCsv.writerow(line)
-else:
-  for line in csvFile:
-    if line[0].startswith('#'):
-      if args.include_comments:
-        outputFile.write(args.delimiter.join(line) + '\n');
-      continue
 
-    if colCount is None:
-      colCount = len(line)
-
-    pc = int(line[headerCol], 0)
-    found = sampleParser.isPCKnown(pc)
+def resolveLabels(pc):
+    # Returns whether a pc was found and its labels, memoized labels are
+    # looked up without loading the cache of the binary
+    binary, srcpc = sampleParser.resolvePC(pc)
+    found = binary is not False
+    if pc not in sampleBuffer:
+        if not found:
+            sampleBuffer[pc] = invalidLabels
+        elif binary['kernel']:
+            # Kernel addresses are only labeled with their symbol
+            sampleBuffer[pc] = selector(sampleParser.getSampleFromPC(pc) + [None])
+        else:
+            memo = sampleParser.getMemo(binary['path'], memoSelector)
+            if memo is not None and srcpc in memo:
+                sampleBuffer[pc] = memo[srcpc]
+            else:
+                tCache = sampleParser.cache.getCache(binary['path'])
+                sampleBuffer[pc] = selector(tCache['cache'][srcpc] + [tCache['asm'][srcpc] if selectAsm else None])
+                if memo is not None:
+                    memo.add(srcpc, sampleBuffer[pc])
+    return found, sampleBuffer[pc]
+
+
+def correlateRows(rows, outputFile):
+    # Returns the column count of the first sample row and the pcs seen
+    outputCsv = csv.writer(outputFile, delimiter=args.delimiter)
+    rowColCount = None
+    rowPCs = set()
+    if args.only_filter_unknown:
+      for line in rows:
+        if line[0].startswith('#'):
+          if args.include_comments:
+            outputFile.write(args.delimiter.join(line) + '\n');
+          continue
+
+        if sampleParser.isPCKnown(int(line[headerCol], 0)):
+            outputCsv.writerow(line)
+    else:
+      for line in rows:
+        if line[0].startswith('#'):
+          if args.include_comments:
+            outputFile.write(args.delimiter.join(line) + '\n');
+          continue
 
-    if args.filter_unknown and not found:
-        continue
+        if rowColCount is None:
+          rowColCount = len(line)
 
-    if args.fill_addresses:
-        seenPCs.add(pc)
+        pc = int(line[headerCol], 0)
+        found, labels = resolveLabels(pc)
 
-    if pc not in sampleBuffer:
-      if found:
-        tCache = sampleParser.cache.getCache(sampleParser.getBinaryFromPC(pc)['path'])
-        sampleBuffer[pc] = selector(tCache['cache'][pc] + [tCache['asm'][pc]])
-      else:
-        sampleBuffer[pc] = invalidLabels
+        if args.filter_unknown and not found:
+            continue
 
-    outputCsv.writerow(line[:headerCol + 1] + sampleBuffer[pc] + line[headerCol + 1:])
+        if args.fill_addresses:
+            rowPCs.add(pc)
+
+        outputCsv.writerow(line[:headerCol + 1] + labels + line[headerCol + 1:])
+    return rowColCount, rowPCs
+
+
+def correlateChunk(chunk):
+    # Rows with quoted fields go through the csv reader and writer
+    output = io.StringIO()
+    rowColCount, rowPCs = correlateRows(csv.reader(io.StringIO(chunk), delimiter=args.delimiter), output)
+    sampleParser.storeMemos()
+    return output.getvalue(), rowColCount, rowPCs
+
+
+def formatLabels(labels):
+    # Labels are written behind an empty column so the csv writer quotes them just like inside of a row
+    if len(labels) == 0:
+        return ''
+    output = io.StringIO()
+    csv.writer(output, delimiter=args.delimiter, lineterminator='').writerow([''] + labels)
+    return output.getvalue()
+
+
+def correlateBlock(chunk):
+    # Chunks without any quoting are correlated as plain text, every distinct address
+    # is resolved once per block and its labels are scattered back to the rows
+    if '"' in chunk or chunk.count('\r') != chunk.count('\r\n'):
+        return correlateChunk(chunk)
+    lines = chunk.replace('\r\n', '\n').split('\n')
+    if len(lines[-1]) == 0:
+        lines.pop()
+    if '' in lines:
+        return correlateChunk(chunk)
+
+    output = [''] * len(lines)
+    if args.include_comments:
+        for i, line in enumerate(lines):
+            if line.startswith('#'):
+                output[i] = line + '\n'
+    rows = [i for i, line in enumerate(lines) if not line.startswith('#')]
+    rowColCount = None
+    rowPCs = set()
+    if len(rows) == 0:
+        return ''.join(output), rowColCount, rowPCs
+
+    fields = [lines[i].split(args.delimiter, headerCol + 1) for i in rows]
+    addresses, inverse = numpy.unique(numpy.array([x[headerCol] for x in fields]), return_inverse=True)
+    keep = numpy.ones(len(addresses), dtype=bool)
+    labels = numpy.empty(len(addresses), dtype=object)
+    for i, address in enumerate(addresses):
+        pc = int(address, 0)
+        if args.only_filter_unknown:
+            keep[i] = sampleParser.isPCKnown(pc)
+            continue
+        if pc not in labelBuffer:
+            found, values = resolveLabels(pc)
+            labelBuffer[pc] = (found, formatLabels(values))
+        found, labels[i] = labelBuffer[pc]
+        if args.filter_unknown and not found:
+            keep[i] = False
+        elif args.fill_addresses:
+            rowPCs.add(pc)
+
+    if args.only_filter_unknown:
+        for i, k in zip(rows, keep[inverse]):
+            if k:
+                output[i] = lines[i] + '\r\n'
+    else:
+        rowColCount = lines[rows[0]].count(args.delimiter) + 1
+        for i, row, k, label in zip(rows, fields, keep[inverse], labels[inverse]):
+            if k:
+                line = lines[i]
+                split = len(line) - len(row[-1]) - 1 if len(row) > headerCol + 1 else len(line)
+                output[i] = line[:split] + label + line[split:] + '\r\n'
+    sampleParser.storeMemos()
+    return ''.join(output), rowColCount, rowPCs
+
+
+def numberStrings(values):
+    return values.astype(str) if values.dtype.kind in 'iu' else numpy.array([str(x) for x in values.tolist()])
+
+
+def parseColumn(values):
+    # Columns are only parsed if every value is written exactly like its number,
+    # all others like '007' or '+5' stay strings
+    for dtype in [numpy.int64, numpy.uint64, numpy.float64]:
+        try:
+            parsed = values.astype(dtype)
+        except (ValueError, OverflowError):
+            continue
+        if numpy.array_equal(numberStrings(parsed), values):
+            return parsed
+    return values
+
+
+def correlateColumns(chunk):
+    # Columnar output keeps the parsed input columns of the rows and the
+    # labels of every distinct address once, label ids are assigned in order
+    rows = [x for x in csv.reader(io.StringIO(chunk), delimiter=args.delimiter) if not x[0].startswith('#')]
+    rowColCount = None
+    rowPCs = set()
+    if len(rows) == 0:
+        return None, rowColCount, rowPCs
+    if not args.only_filter_unknown:
+        rowColCount = len(rows[0])
+
+    addresses, inverse = numpy.unique(numpy.array([x[headerCol] for x in rows]), return_inverse=True)
+    keep = numpy.ones(len(addresses), dtype=bool)
+    pcs = numpy.zeros(len(addresses), dtype=numpy.uint64)
+    labels = []
+    for i, address in enumerate(addresses):
+        pc = int(address, 0)
+        pcs[i] = pc
+        if args.only_filter_unknown:
+            keep[i] = sampleParser.isPCKnown(pc)
+            labels.append([])
+            continue
+        found, values = resolveLabels(pc)
+        labels.append(values)
+        if args.filter_unknown and not found:
+            keep[i] = False
+        elif args.fill_addresses:
+            rowPCs.add(pc)
+
+    mask = keep[inverse]
+    rows = [row for row, k in zip(rows, mask) if k]
+    if any(len(x) != len(rows[0]) for x in rows):
+        raise Exception('rows with different column counts cannot be stored columnar')
+    columns = [parseColumn(numpy.array(x)) for i, x in enumerate(zip(*rows)) if i != headerCol]
+    sampleParser.storeMemos()
+    return {'columns': columns, 'pcs': pcs[inverse[mask]], 'labels': labels, 'index': inverse[mask]}, rowColCount, rowPCs
+
+
+class columnSpill:
+    # Chunks of one output column are spilled to a temporary file next to the
+    # output and read back once the type of the whole column is known
+    def __init__(self, folder):
+        self.file = tempfile.TemporaryFile(dir=folder)
+        self.parts = 0
+        self.count = 0
+        self.kinds = set()
+        self.range = [0, 0]
+
+    def append(self, values):
+        numpy.save(self.file, values, allow_pickle=False)
+        if values.dtype.kind in 'iu':
+            self.range = [min(int(values.min()), self.range[0]), max(int(values.max()), self.range[1])] if self.count > 0 else [int(values.min()), int(values.max())]
+        self.parts += 1
+        self.count += len(values)
+        self.kinds.add(values.dtype.kind)
+
+    def chunks(self):
+        self.file.seek(0)
+        for _ in range(self.parts):
+            yield numpy.load(self.file, allow_pickle=False)
+
+
+labelMapper = profileLib.listmapper(list(range(len(memoSelector))))
+columnarSpills = None
+
+
+def collectColumns(result):
+    # Labels are mapped to ids in the main process so every chunk shares the same dictionaries
+    global columnarSpills
+    if result is None or len(result['pcs']) == 0:
+        return
+    if columnarSpills is None:
+        folder = os.path.dirname(os.path.abspath(args.output))
+        columnarSpills = [columnSpill(folder) for _ in range(len(result['columns']) + 1 + len(memoSelector))]
+    ids = numpy.array([labelMapper.mapValues(x) for x in result['labels']], dtype=numpy.int64).reshape(len(result['labels']), len(memoSelector))
+    ids = ids[result['index']]
+    for spill, values in zip(columnarSpills, result['columns'] + [result['pcs']] + [ids[:, i] for i in range(len(memoSelector))]):
+        spill.append(values)
+
+
+def integerType(low, high):
+    # Smallest integer type that holds every value, None if there is none
+    for dtype in [numpy.int8, numpy.int16, numpy.int32, numpy.int64, numpy.uint64]:
+        if low >= numpy.iinfo(dtype).min and high <= numpy.iinfo(dtype).max:
+            return dtype
+    return None
+
+
+def encodeColumn(spill):
+    # Integer and float columns are stored as numbers, all others and columns
+    # mixing both as ids into a string table
+    if spill.kinds <= {'i', 'u'} and integerType(*spill.range) is not None:
+        return profileLib.columnChunks(integerType(*spill.range), spill.count, spill.chunks()), None
+    if spill.kinds == {'f'}:
+        return profileLib.columnChunks(numpy.float64, spill.count, spill.chunks()), None
+    table = set()
+    for values in spill.chunks():
+        table.update(numberStrings(values).tolist() if values.dtype.kind != 'U' else values.tolist())
+    table = sorted(table)
+    search = numpy.array(table, dtype=str)
+    ids = (numpy.searchsorted(search, x if x.dtype.kind == 'U' else numberStrings(x)) for x in spill.chunks())
+    return profileLib.columnChunks(integerType(0, len(table)), spill.count, ids), table
+
+
+def writeColumnar(path):
+    spills = columnarSpills if columnarSpills is not None else []
+    width = len(spills) - len(memoSelector) if len(spills) > 0 else (len(inputNames) if inputNames is not None else headerCol + 1)
+    names = inputNames if inputNames is not None else [str(i) for i in range(width)]
+    columns = {}
+    strings = []
+    for i, name in enumerate([x for i, x in enumerate(names) if i != headerCol]):
+        if len(spills) > 0:
+            columns[name], table = encodeColumn(spills[i])
+        else:
+            columns[name], table = numpy.empty(0, dtype=numpy.int8), None
+        if table is not None:
+            columns[name + '.offsets'], columns[name + '.data'] = profileLib.columnarFile.encodeStrings(table)
+            strings.append(name)
+    address = spills[width - 1] if len(spills) > 0 else None
+    columns[names[headerCol]] = profileLib.columnChunks(numpy.uint64, address.count, address.chunks()) if address is not None else numpy.empty(0, dtype=numpy.uint64)
+    maps = labelMapper.retrieveMaps()
+    for i, name in enumerate(memoSelector):
+        # Empty labels are stored as -1, those of unknown addresses as -2
+        dictionary = [x for x in maps[i] if x is not None and x != args.label_none]
+        positions = {x: j for j, x in enumerate(dictionary)}
+        positions[None], positions[args.label_none] = -1, -2
+        translate = numpy.array([positions[x] for x in maps[i]] if len(maps[i]) > 0 else [-1], dtype=numpy.int64)
+        dtype = integerType(-2, len(dictionary))
+        if len(spills) > 0:
+            columns[name] = profileLib.columnChunks(dtype, spills[width + i].count, map(translate.__getitem__, spills[width + i].chunks()))
+        else:
+            columns[name] = numpy.empty(0, dtype=dtype)
+        if len(dictionary) > 0 and all(isinstance(x, int) and not isinstance(x, bool) for x in dictionary):
+            columns[name + '.values'] = numpy.array(dictionary, dtype=integerType(min(dictionary), max(dictionary)))
+        else:
+            columns[name + '.offsets'], columns[name + '.data'] = profileLib.columnarFile.encodeStrings([str(x) for x in dictionary])
+            strings.append(name)
+    meta = {
+        'version': profileLib.correlatedVersion,
+        'rows': len(columns[names[headerCol]]),
+        'columns': names[:headerCol + 1] + memoSelector + names[headerCol + 1:],
+        'address': names[headerCol],
+        'labels': memoSelector,
+        'strings': strings,
+        'unknown': args.label_none,
+    }
+    profileLib.columnarFile.write(path, meta, columns)
+
+
+def readChunks(fInput, rows):
+    # Chunks only end on rows that are not inside of a quoted field
+    chunk = []
+    quoted = False
+    for line in fInput:
+        chunk.append(line)
+        if line.count('"') % 2 == 1:
+            quoted = not quoted
+        if len(chunk) >= rows and not quoted:
+            yield ''.join(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        yield ''.join(chunk)
+
+
+correlateWork = correlateColumns if args.format == 'columnar' else correlateBlock
+
+
+def collectChunk(result):
+    global colCount
+    output, rowColCount, rowPCs = result
+    if args.format == 'columnar':
+        collectColumns(output)
+    else:
+        outputFile.write(output)
+    colCount = rowColCount if colCount is None else colCount
+    seenPCs.update(rowPCs)
 
 
-  if args.fill_addresses:
-      caches = []
-      if colCount is None:
-          colCount = headerCol
-      for binary in sampleParser.binaries:
+if args.jobs <= 1:
+    for chunk in readChunks(fInput, args.chunk_rows):
+        collectChunk(correlateWork(chunk))
+else:
+    # Caches are loaded before the workers are forked so all of them share the same mappings,
+    # with memos the workers only load caches for addresses that are not memoized yet
+    for binary in sampleParser.binaries:
+        if not binary['kernel'] and not profileLib.sampleMemo:
+            sampleParser.cache.openOrCreateCache(binary['path'])
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context('fork')) as pool:
+        pending = collections.deque()
+        chunks = readChunks(fInput, args.chunk_rows)
+
+        # Chunks are written in input order, only a few of them are in flight at any time
+        for chunk in chunks:
+            pending.append(pool.submit(correlateWork, chunk))
+            if len(pending) >= args.jobs * 4:
+                collectChunk(pending.popleft().result())
+        while len(pending) > 0:
+            collectChunk(pending.popleft().result())
+
+if args.fill_addresses and not args.only_filter_unknown:
+    caches = []
+    if colCount is None:
+        colCount = headerCol
+    for binary in sampleParser.binaries:
+      if not binary['kernel']:
         sampleParser.cache.openOrCreateCache(binary['path'])
 
-      for cache in sampleParser.cache.caches.values():
-        for pc in [x for x in cache['cache'] if x not in seenPCs]:
-          sample = cache['cache'][pc] + [cache['asm'][pc]]
-          outputCsv.writerow(([args.fill_columns] * headerCol) + [f'0x{pc:x}'] + [args.label_none if x is None else x for x in selector(sample)] + ([args.fill_columns] * (colCount - 1 - headerCol)))
-
-
-if (args.output):
+    for cache in sampleParser.cache.caches.values():
+      fillPCs = [x for x in cache['cache'] if x not in seenPCs]
+      fillLabels = []
+      for pc in fillPCs:
+        sample = cache['cache'][pc] + [cache['asm'][pc] if selectAsm else None]
+        fillLabels.append([args.label_none if x is None else x for x in selector(sample)])
+        if args.format != 'columnar':
+          outputCsv.writerow(([args.fill_columns] * headerCol) + [f'0x{pc:x}'] + fillLabels[-1] + ([args.fill_columns] * (colCount - 1 - headerCol)))
+      if args.format == 'columnar':
+        collectColumns({
+          'columns': [parseColumn(numpy.full(len(fillPCs), args.fill_columns)) for _ in range(colCount - 1)],
+          'pcs': numpy.array(fillPCs, dtype=numpy.uint64),
+          'labels': fillLabels,
+          'index': numpy.arange(len(fillPCs))
+        })
+
+if args.format == 'columnar':
+    writeColumnar(args.output)
+elif (args.output):
     outputFile.close()
@@ -1,17 +1,85 @@
 #!/usr/bin/env python3
 import argparse
 import profileLib
+import os
+import sys
+import time
+import concurrent.futures
+import multiprocessing
 
 parser = argparse.ArgumentParser(description="Create cache for elf files")
-parser.add_argument("elfs", help="executables to create cache", nargs="+")
+parser.add_argument("elfs", help="executables, directories or vmmaps of the executables to create caches for", nargs="*")
 parser.add_argument("-f", "--force", default=False, action="store_true", help="forces rebuild of cache")
 parser.add_argument("-n", "--name", help="choose a different name for this executable", default=None)
 parser.add_argument("-d", "--dynmap", help="provide dynamic branch informations as csv", default=None)
 parser.add_argument("-s", "--search-path", help="add search path for source code files", action="append", default=[])
+parser.add_argument("-b", "--binary-search-path", help="add search path for binaries listed in vmmaps", action="append", default=[])
 parser.add_argument("--unwind-inline", help="unwind inlined functions", action="store_true", default=False)
 parser.add_argument("--with-sources", help="do not include source code", action="store_true", default=False)
 parser.add_argument("--no-basic-block-reconstruction", help="do not try to reconstruct basic blocks", action="store_true", default=False)
-args = parser.parse_args()
+parser.add_argument("-j", "--jobs", help="parallel jobs used to build caches, multiple binaries are built concurrently (default: %(default)s)", type=int, default=profileLib.cacheJobs)
+parser.add_argument("--no-incremental", help="rerun every stage instead of reusing the ones whose inputs did not change", action="store_true", default=False)
+parser.add_argument("--backend", help="backend used to correlate addresses to sources (default: %(default)s)", choices=['binutils', 'elf'], default=profileLib.cacheBackend)
+parser.add_argument("--cache-size", help="limit the size of the cache folder including caches published into shared memory, least recently used caches are evicted (e.g. 10G, default: %(default)s)", default=profileLib.cacheSize)
+parser.add_argument("--collect", help="evict caches until the cache folder fits into the size limit", action="store_true", default=False)
+parser.add_argument("--stats", help="print cache hit, miss and eviction statistics", action="store_true", default=False)
+args = parser.parse_intermixed_args()
+
+
+def isElf(path):
+    try:
+        with open(path, 'rb') as fp:
+            if fp.read(4) != b'\x7fELF':
+                return False
+        return profileLib.elfFile(path).type in [profileLib.elfFile.ET_EXEC, profileLib.elfFile.ET_DYN]
+    except Exception:
+        return False
+
+
+def findElfs(path):
+    # Directories are searched recursively, other files that are not elfs are read as vmmap
+    if os.path.isdir(path):
+        found = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if not os.path.islink(os.path.join(root, name)) and isElf(os.path.join(root, name)):
+                    found.append(os.path.join(root, name))
+        return found
+    if not os.path.isfile(path):
+        print(f'WARNING: could not find {path}', file=sys.stderr)
+        return []
+    if isElf(path):
+        return [path]
+    found = []
+    for line in open(path, 'r'):
+        line = line.strip().split(' ', 2)
+        if len(line) < 3 or line[2].startswith('['):
+            continue
+        candidates = [os.path.join(x, line[2].lstrip('/')) for x in args.binary_search_path] + [line[2]]
+        candidates = [x for x in candidates if os.path.isfile(x)]
+        if len(candidates) == 0:
+            print(f'WARNING: could not find {line[2]} from vmmap {path}', file=sys.stderr)
+        else:
+            found.append(candidates[0])
+    return found
+
+
+def buildCache(elf, jobs):
+    # Runs in a worker process when multiple binaries are built concurrently
+    profileLib.unwindInline = args.unwind_inline or profileLib.unwindInline
+    start = time.time()
+    cache = profileLib.elfCache()
+    cache.createCache(elf, name=args.name, sourceSearchPaths=args.search_path, dynmapfile=args.dynmap, includeSource=args.with_sources, basicblockReconstruction=not args.no_basic_block_reconstruction, jobs=jobs, backend=args.backend, incremental=not args.no_incremental)
+    cacheFile = cache.getCacheFile(elf)
+    cache.closeCache(elf)
+    return cacheFile, time.time() - start
+
+
+try:
+    profileLib.cacheSize = profileLib.parseSize(args.cache_size)
+except ValueError:
+    parser.error(f"invalid cache size {args.cache_size}")
 
 if args.unwind_inline:
     profileLib.unwindInline = True
@@ -21,9 +89,64 @@ if profileLib.disableCache:
 
 cache = profileLib.elfCache();
 
-for elf in args.elfs:
-    if cache.cacheAvailable(elf) and not args.force:
+elfs = []
+seen = set()
+for path in args.elfs:
+    for elf in findElfs(path):
+        if os.path.realpath(elf) not in seen:
+            seen.add(os.path.realpath(elf))
+            elfs.append(elf)
+
+pending = []
+for elf in elfs:
+    try:
+        # Up to date caches are only checked for, not loaded
+        available = cache.cacheAvailable(elf, load=False)
+    except Exception:
+        available = False
+    if available and not args.force:
         print(f'INFO: cache for file {elf} already available at {cache.getCacheFile(elf)}, force rebuild via --force')
     else:
-        cache.createCache(elf, name=args.name, sourceSearchPaths = args.search_path, dynmapfile=args.dynmap, includeSource=args.with_sources, basicblockReconstruction=not args.no_basic_block_reconstruction);
-    cache.closeCache(elf)
+        pending.append(elf)
+
+failed = 0
+
+
+def report(i, elf, build):
+    global failed
+    try:
+        cacheFile, duration = build()
+        print(f'INFO: [{i + 1}/{len(pending)}] created cache for {elf} in {duration:.1f}s at {cacheFile}')
+    except Exception as e:
+        failed += 1
+        print(f'ERROR: [{i + 1}/{len(pending)}] could not create cache for {elf}, {e}', file=sys.stderr)
+
+
+start = time.time()
+# Jobs are split between binaries that are built at the same time
+workers = max(1, min(args.jobs, len(pending)))
+if workers > 1:
+    # Workers are forked, the arguments and the loop above are not rerun in them
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = {pool.submit(buildCache, elf, max(1, args.jobs // workers)): elf for elf in pending}
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            report(i, futures[future], future.result)
+else:
+    for i, elf in enumerate(pending):
+        report(i, elf, lambda: buildCache(elf, args.jobs))
+
+if len(pending) > 1:
+    print(f'INFO: created {len(pending) - failed} of {len(pending)} caches in {time.time() - start:.1f}s')
+
+if args.collect and not profileLib.disableCache:
+    evicted = profileLib.cacheManager().collect()
+    print(f'INFO: evicted {len(evicted)} files from {profileLib.cacheFolder}')
+
+if args.stats:
+    manager = profileLib.cacheManager()
+    stats = manager.statistics()
+    print(f"INFO: cache folder {manager.folder} uses {manager.size() / (1 << 20):.1f} MiB{f' of {manager.limit / (1 << 20):.1f} MiB' if manager.limit > 0 else ''}")
+    print(f"INFO: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions ({stats['evictedBytes'] / (1 << 20):.1f} MiB)")
+
+if failed > 0:
+    sys.exit(1)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import xopen
+import pickle
+import numpy
+import profileLib
+
+aggregateKeyNames = ['pc', 'binary', 'file', 'function', 'basicblock', 'line', 'instruction', 'meta']
+
+parser = argparse.ArgumentParser(description="Correlate and aggregate a binary PPerf profile in a single pass")
+parser.add_argument("profile", help="profile from PPerf")
+parser.add_argument("-o", "--output", default=None, help="output CSV (default stdout)")
+parser.add_argument("-a", "--aggregate", default=None, help="write the aggregated profile (pickled, compressed by extension)")
+parser.add_argument("-s", "--search-path", help="search paths for vmmap binaries", default=[], type=str, nargs="+")
+parser.add_argument("-ks", "--kallsyms", help="kernel symbols")
+parser.add_argument("-k", "--key", default=['binary', 'function'], choices=aggregateKeyNames, nargs='+', help="aggregate samples by these labels (default: %(default)s)")
+parser.add_argument("-d", "--delimiter", default=";", help="output delimiter (default %(default)s)")
+parser.add_argument("--label-delimiter", default=":", help="delimiter between the labels of a key (default %(default)s)")
+parser.add_argument("--label-none", default=profileLib.LABEL_UNKNOWN, help="label unknown samples (default %(default)s)")
+parser.add_argument("-p", "--pmu-type", default="double", choices=[x for x in profileLib.supportedPmuTypes.keys() if x != 'binary'], help="unpack pmu data as type (default %(default)s)")
+parser.add_argument("-l", "--little-endian", action="store_true", help="parse profile using little endianess")
+parser.add_argument("-b", "--big-endian", action="store_true", help="parse profile using big endianess")
+parser.add_argument("--from", dest="fromTime", type=float, default=None, help="only aggregate samples from this time in seconds on")
+parser.add_argument("--to", dest="toTime", type=float, default=None, help="only aggregate samples up to this time in seconds")
+parser.add_argument("-t", "--tids", type=int, nargs='+', default=None, help="only aggregate these thread ids, intervals are still split between all threads")
+parser.add_argument("--memo", action="store_true", help="memoize correlated addresses next to the caches across runs (default: PPERF_MEMO)", default=False)
+parser.add_argument("--disable-cache", action="store_true", help="do not create or use prepared address caches", default=False)
+
+args = parser.parse_args()
+
+if not os.path.isfile(args.profile):
+    print("ERROR: profile not found!", file=sys.stderr)
+    parser.print_help()
+    sys.exit(1)
+
+if args.kallsyms and not os.path.isfile(args.kallsyms):
+    print("ERROR: kallsyms not found!", file=sys.stderr)
+    parser.print_help()
+    sys.exit(1)
+
+if args.disable_cache:
+    profileLib.disableCache = True
+
+if args.memo:
+    profileLib.sampleMemo = True
+
+endianess = '<' if args.little_endian else '>' if args.big_endian else '='
+profile = profileLib.profileReader(args.profile, pmuType=args.pmu_type, endianess=endianess)
+
+if (profile.sampleCount == 0):
+    raise Exception("input file does not contain any samples")
+
+# The VMMaps are stored behind the samples, the reader starts over afterwards.
+# Compressed profiles are decompressed twice, the index skips the sample scan
+sampleParser = profileLib.sampleParser()
+sampleParser.addSearchPath(args.search_path)
+sampleParser.loadVMMap(fromBuffer=profile.getVMMapBuffer())
+if args.kallsyms:
+    sampleParser.loadKallsyms(args.kallsyms)
+profile.rewind()
+
+startWallTimeUs = profile.getStartTime()
+fromWallTimeUs = None if args.fromTime is None else startWallTimeUs + int(round(args.fromTime * 1000000.0))
+toWallTimeUs = None if args.toTime is None else startWallTimeUs + int(round(args.toTime * 1000000.0))
+
+# Accumulators are indexed by label, a label is the tuple of the key columns
+labelIndex = {}
+labelSamples = []
+accumulated = {x: numpy.zeros(0, dtype=numpy.float64) for x in ['time', 'wall', 'energy', 'samples', 'execs']}
+
+# Label of every thread in its last sample, carried between batches
+lastLabel = {}
+
+
+def accumulate(name, labels, weights):
+    # Accumulators grow with the number of labels
+    if len(accumulated[name]) < len(labelSamples):
+        accumulated[name] = numpy.concatenate([accumulated[name], numpy.zeros(len(labelSamples) - len(accumulated[name]))])
+    accumulated[name] += numpy.bincount(labels, weights=weights, minlength=len(labelSamples))
+
+
+for batch in profile.batches(fromWallTimeUs, toWallTimeUs, args.tids, deltas=True):
+    records = len(batch['pc'])
+    if records == 0:
+        continue
+
+    correlated = sampleParser.parsePCs(batch['pc'], batch['tid'])
+    keys = numpy.stack([correlated[x].astype(numpy.int64) for x in args.key], axis=1)
+    uniqueKeys, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    representatives = numpy.zeros(len(uniqueKeys), dtype=numpy.int64)
+    representatives[inverse] = numpy.arange(records)
+    translate = numpy.empty(len(uniqueKeys), dtype=numpy.int64)
+    for i, key in enumerate(map(tuple, uniqueKeys.tolist())):
+        if key not in labelIndex:
+            labelIndex[key] = len(labelSamples)
+            r = int(representatives[i])
+            labelSamples.append([int(correlated['pc'][r]), int(correlated['binary'][r]), int(correlated['file'][r]), int(correlated['function'][r]), int(correlated['basicblock'][r]),
+                                 int(correlated['line'][r]) or None, int(correlated['instruction'][r]), None, int(correlated['meta'][r]) if correlated['meta'][r] >= 0 else None])
+        translate[i] = labelIndex[key]
+    labels = translate[inverse]
+
+    # Label changes are counted per thread in sample order
+    order = numpy.lexsort((batch['sample'], batch['tid']))
+    tids = batch['tid'][order]
+    orderedLabels = labels[order]
+    threadStart = numpy.ones(records, dtype=bool)
+    threadStart[1:] = tids[1:] != tids[:-1]
+    previousLabels = numpy.concatenate([[-1], orderedLabels[:-1]])
+    for i in numpy.flatnonzero(threadStart).tolist():
+        previousLabels[i] = lastLabel.get(int(tids[i]), -1)
+    for i in (numpy.flatnonzero(threadStart[1:]).tolist() + [records - 1]):
+        lastLabel[int(tids[i])] = int(orderedLabels[i])
+    executions = numpy.empty(records, dtype=numpy.float64)
+    executions[order] = orderedLabels != previousLabels
+
+    # The wall time and energy of an interval is split between all threads of
+    # the sample by their cpu time, also those filtered out
+    sampleOfRecord = numpy.repeat(numpy.arange(len(batch['time'])), batch['threads'])
+    wallShares = batch['wallDelta'][sampleOfRecord] * batch['share']
+    energy = wallShares * batch['pmu'].astype(numpy.float64)[sampleOfRecord]
+
+    accumulate('time', labels, batch['cpuDelta'])
+    accumulate('wall', labels, wallShares)
+    accumulate('energy', labels, energy)
+    accumulate('samples', labels, None)
+    accumulate('execs', labels, executions)
+
+profile.close()
+sampleParser.storeMemos()
+
+for name in accumulated:
+    if len(accumulated[name]) < len(labelSamples):
+        accumulated[name] = numpy.concatenate([accumulated[name], numpy.zeros(len(labelSamples) - len(accumulated[name]))])
+
+formatter = profileLib.sampleFormatter(sampleParser.getMaps())
+aggregatedSamples = []
+for i, sample in enumerate(labelSamples):
+    wall = accumulated['wall'][i]
+    aggregated = [None] * 7
+    aggregated[profileLib.AGGSAMPLE.time] = float(accumulated['time'][i])
+    aggregated[profileLib.AGGSAMPLE.power] = float(accumulated['energy'][i] / wall) if wall > 0 else 0.0
+    aggregated[profileLib.AGGSAMPLE.energy] = float(accumulated['energy'][i])
+    aggregated[profileLib.AGGSAMPLE.samples] = int(accumulated['samples'][i])
+    aggregated[profileLib.AGGSAMPLE.execs] = int(accumulated['execs'][i])
+    aggregated[profileLib.AGGSAMPLE.label] = formatter.formatSample(formatter.remapSample(sample), displayKeys=list(args.key), delimiter=args.label_delimiter, labelNone=args.label_none)
+    aggregated[profileLib.AGGSAMPLE.mappedSample] = sample
+    aggregatedSamples.append(aggregated)
+
+aggregatedSamples.sort(key=lambda x: x[profileLib.AGGSAMPLE.time], reverse=True)
+
+if args.aggregate:
+    aggregatedProfile = {
+        'version': profileLib.aggProfileVersion,
+        'samples': aggregatedSamples,
+        'maps': sampleParser.getMaps(),
+        'cacheMap': sampleParser.getCacheMap(),
+        'key': args.key,
+        'pmu': profile.pmuName,
+        'time': profile.wallTime / 1000000.0,
+        'latencyTime': profile.latencyTime / 1000000.0,
+        'sampleCount': profile.sampleCount,
+    }
+    with xopen.xopen(args.aggregate, 'wb') as fp:
+        pickle.dump(aggregatedProfile, fp, pickle.HIGHEST_PROTOCOL)
+
+if args.output:
+    outputCSV = xopen.xopen(args.output, "w")
+else:
+    outputCSV = sys.stdout
+
+outputCSV.write(args.delimiter.join(['label', 'time', 'power', 'energy', 'samples', 'execs']) + "\n")
+for x in aggregatedSamples:
+    outputCSV.write(args.delimiter.join(map(str, [x[profileLib.AGGSAMPLE.label], x[profileLib.AGGSAMPLE.time], x[profileLib.AGGSAMPLE.power], x[profileLib.AGGSAMPLE.energy], x[profileLib.AGGSAMPLE.samples], x[profileLib.AGGSAMPLE.execs]])) + "\n")
+
+if args.output:
+    outputCSV.close()
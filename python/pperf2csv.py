@@ -3,72 +3,45 @@
 import argparse
 import os
 import sys
-import bz2
 import xopen
-import struct
 import binascii
-
-supportedPmuTypes = {
-  'float' : {'code' : 'f', 'size' : 4},
-  'double': {'code' : 'd', 'size' : 8},
-  'int8_t' : {'code': 'b', 'size' : 1},
-  'int16_t': {'code': 'h', 'size' : 2},
-  'int32_t' : {'code': 'i', 'size' : 4},
-  'int64_t' : {'code': 'q', 'size' : 8},
-  'uint8_t' : {'code': 'B', 'size' : 1},
-  'uint16_t': {'code': 'H', 'size' : 2},
-  'uint32_t' : {'code': 'I', 'size' : 4},
-  'uint64_t' : {'code': 'Q', 'size' : 8},
-  'binary' : {'code': 's', 'size': 0}
-}
-
-pmuTypeUnpackCodes = ['f', 'd', 'b', 'h', 'i', 'q', 'B', 'H', 'I', 'Q', 's']
+import itertools
+import numpy
+import profileLib
 
 parser = argparse.ArgumentParser(description="Convert a binary PPerf profile to a CSV")
 parser.add_argument("profile", help="profile from PPerf")
 parser.add_argument("-o", "--output", default=None, help="output CSV (default stdout)")
 parser.add_argument("-v", "--vmmap", default=None, help="output VMMaps (default skipped)")
 parser.add_argument("-d", "--delimiter", default=";", help="ouput delimiter (default %(default)s")
-parser.add_argument("-p", "--pmu-type", default="double", choices=supportedPmuTypes.keys(), help="unpack pmu data as type (default %(default)s)")
+parser.add_argument("-p", "--pmu-type", default="double", choices=profileLib.supportedPmuTypes.keys(), help="unpack pmu data as type (default %(default)s)")
 parser.add_argument("--no-comment", action="store_true", help="do not include comments with global profile information")
 parser.add_argument("-l", "--little-endian", action="store_true", help="parse profile using little endianess")
 parser.add_argument("-b", "--big-endian", action="store_true", help="parse profile using big endianess")
+parser.add_argument("--type", choices=['full', 'flat'], default='full', help="create a full profile or a flat histogram per thread and address (default %(default)s)")
+parser.add_argument("--block-rows", type=int, default=1 << 16, help="rows formatted at once (default %(default)s)")
+parser.add_argument("--from", dest="fromTime", type=float, default=None, help="only output samples from this time in seconds on")
+parser.add_argument("--to", dest="toTime", type=float, default=None, help="only output samples up to this time in seconds")
+parser.add_argument("-t", "--tids", type=int, nargs='+', default=None, help="only output these thread ids, flat profiles still split intervals between all threads")
+parser.add_argument("--build-index", action="store_true", help="create the sample index next to the profile, used to seek to --from")
+parser.add_argument("--index-every", type=int, default=1024, help="index every nth sample (default %(default)s)")
 
 args = parser.parse_args()
 
 if not os.path.isfile(args.profile):
     raise Exception ("input file not found!")
 
-binProfile = xopen.xopen(args.profile, mode='rb').read()
 endianess = '<' if args.little_endian else '>' if args.big_endian else '='
-binOffset = 0
-
-pmuCode = supportedPmuTypes[args.pmu_type]['code']
-pmuSize = supportedPmuTypes[args.pmu_type]['size']
-
-try:
-    (magic,) = struct.unpack_from(endianess + "I", binProfile, binOffset)
-    binOffset += 4
-except Exception as e:
-    raise Exception("unexpected end of input file")
-
-if not (0 <= magic <= 3):
-    raise Exception("PPerf magic number in invalid range")
+profile = profileLib.profileReader(args.profile, pmuType=args.pmu_type, endianess=endianess)
 
-try:
-    (wallTimeUs, latencyTimeUs, sampleCount, profilePmuSize, vmmapCount) = struct.unpack_from(endianess + 'QQQII', binProfile, binOffset)
-    binOffset += 8 + 8 + 8 + 4 + 4
-except Exception as e:
-    raise Exception("unexpected end of input file")
-
-if (sampleCount == 0):
+if (profile.sampleCount == 0):
     raise Exception("input file does not contain any samples")
 
-if pmuSize == 0:
-  pmuSize = profilePmuSize
-  pmuCode = f'{pmuSize}{pmuCode}'
-elif pmuSize != profilePmuSize:
-  raise Exception(f"incorrect pmu type specified to unpack, profile contains pmu data type of {profilePmuSize} byte(s)")
+if args.type == 'flat' and args.pmu_type == 'binary':
+    raise Exception("flat profiles cannot integrate binary pmu data")
+
+if args.build_index:
+    profile.buildIndex(args.index_every)
 
 if args.output:
   outputCSV = xopen.xopen(args.output, "w")
@@ -76,49 +49,89 @@ else:
   outputCSV = sys.stdout
 
 if not args.no_comment:
-  outputCSV.write(f"# total_time({float(wallTimeUs) / 1000000.0}), latency_time({float(latencyTimeUs) / 1000000.0}), samples({sampleCount}))\n")
-
-outputCSV.write(args.delimiter.join(['time', 'cpu_time', 'thread_id', 'address', 'pmu_' + ['custom', 'current', 'voltage', 'power'][magic]]) + "\n")
+  outputCSV.write(f"# total_time({float(profile.wallTime) / 1000000.0}), latency_time({float(profile.latencyTime) / 1000000.0}), samples({profile.sampleCount}))\n")
 
-startWallTimeUs = None
-lastWallTimeUs = None
-
-for i in range(sampleCount):
-    try:
-        (wallTimeUs, pmuValue, threadCount, ) = struct.unpack_from(endianess + "Q" + pmuCode + "I", binProfile, binOffset)
-        binOffset += 8 + pmuSize + 4
-    except Exception as e:
-        raise Exception("unexcepted end of input file")
-
-    if lastWallTimeUs is not None and wallTimeUs < lastWallTimeUs:
-      raise Exception("unexpected sample time wall time (smaller than previous' samples)")
-
-    normWallTimeUs = (wallTimeUs - startWallTimeUs) if startWallTimeUs is not None else 0
-    startWallTimeUs = startWallTimeUs if startWallTimeUs is not None else wallTimeUs
-    lastWallTimeUs = wallTimeUs
-
-    for j in range(threadCount):
-        try:
-          (threadId, address, cpuTimeNs, ) = struct.unpack_from(endianess + "IQQ", binProfile, binOffset)
-          binOffset += 4 + 8 + 8
-        except Exception as e:
-          raise Exception("unexcepted end of input file")
-        outputCSV.write(args.delimiter.join(map(str, [normWallTimeUs / 1000000.0, cpuTimeNs / 1000000000.0, threadId, f"0x{address:x}", pmuValue if args.pmu_type != 'binary' else '0x' + binascii.hexlify(pmuValue).decode('utf-8')])) + "\n")
+if args.type == 'flat':
+    outputCSV.write(args.delimiter.join(['time', 'cpu_time', 'thread_id', 'address', 'samples', 'energy']) + "\n")
+else:
+    outputCSV.write(args.delimiter.join(['time', 'cpu_time', 'thread_id', 'address', 'pmu_' + profile.pmuName]) + "\n")
+
+# Times are relative to the first sample of the profile like in the output
+startWallTimeUs = profile.getStartTime()
+fromWallTimeUs = None if args.fromTime is None else startWallTimeUs + int(round(args.fromTime * 1000000.0))
+toWallTimeUs = None if args.toTime is None else startWallTimeUs + int(round(args.toTime * 1000000.0))
+rowFormat = args.delimiter.replace('%', '%%').join(['%s', '%s', '%d', '0x%x', '%s']) + '\n'
+flatFormat = args.delimiter.replace('%', '%%').join(['%s', '%s', '%d', '0x%x', '%d', '%s']) + '\n'
+flatColumns = ['time', 'cpu_time', 'samples', 'energy']
+
+
+def groupFlat(tids, pcs, values):
+    # Sums the value columns of equal thread and address pairs
+    order = numpy.lexsort((pcs, tids))
+    tids = tids[order]
+    pcs = pcs[order]
+    starts = numpy.ones(len(order), dtype=bool)
+    starts[1:] = (tids[1:] != tids[:-1]) | (pcs[1:] != pcs[:-1])
+    starts = numpy.flatnonzero(starts)
+    return tids[starts], pcs[starts], {x: numpy.add.reduceat(values[x][order], starts) for x in values}
+
+
+flatTids = numpy.zeros(0, dtype=numpy.uint32)
+flatPCs = numpy.zeros(0, dtype=numpy.uint64)
+flatValues = {x: numpy.zeros(0, dtype=numpy.float64) for x in flatColumns}
+
+for batch in profile.batches(fromWallTimeUs, toWallTimeUs, args.tids, deltas=args.type == 'flat'):
+    if args.type == 'flat':
+        # Every thread record gets its share of the interval that ended with
+        # its sample, energy integrates the pmu value over that time
+        if len(batch['pc']) == 0:
+            continue
+        sampleOfRecord = numpy.repeat(numpy.arange(len(batch['time'])), batch['threads'])
+        wallShares = batch['wallDelta'][sampleOfRecord] * batch['share']
+        batchValues = {
+            'time': wallShares,
+            'cpu_time': batch['cpuDelta'],
+            'samples': numpy.ones(len(batch['pc']), dtype=numpy.float64),
+            'energy': wallShares * batch['pmu'].astype(numpy.float64)[sampleOfRecord],
+        }
+        # Partial histograms of the batches are merged as they come, so memory
+        # is bounded by the distinct addresses instead of the samples
+        flatTids, flatPCs, flatValues = groupFlat(numpy.concatenate([flatTids, batch['tid']]), numpy.concatenate([flatPCs, batch['pc']]),
+                                                  {x: numpy.concatenate([flatValues[x], batchValues[x]]) for x in flatColumns})
+        continue
+
+    threadStarts = numpy.concatenate([[0], numpy.cumsum(batch['threads'], dtype=numpy.int64)])
+
+    # Rows are formatted by python in blocks so the values are written exactly
+    # like str() does, values of a sample are formatted once for all threads
+    blockSamples = max(1, args.block_rows // max(1, int(batch['threads'].max())))
+    for start in range(0, len(batch['time']), blockSamples):
+        end = min(start + blockSamples, len(batch['time']))
+        threads = slice(int(threadStarts[start]), int(threadStarts[end]))
+        counts = batch['threads'][start:end].tolist()
+        times = map(str, ((batch['time'][start:end] - numpy.uint64(startWallTimeUs)) / 1000000.0).tolist())
+        if args.pmu_type == 'binary':
+            pmuValues = ['0x' + binascii.hexlify(x.tobytes()).decode('utf-8') for x in batch['pmu'][start:end]]
+        else:
+            pmuValues = map(str, batch['pmu'][start:end].astype(numpy.float64 if batch['pmu'].dtype.kind == 'f' else batch['pmu'].dtype).tolist())
+        times = itertools.chain.from_iterable(map(itertools.repeat, times, counts))
+        pmuValues = itertools.chain.from_iterable(map(itertools.repeat, pmuValues, counts))
+        values = itertools.chain.from_iterable(zip(times, (batch['cputime'][threads] / 1000000000.0).tolist(), batch['tid'][threads].tolist(), batch['pc'][threads].tolist(), pmuValues))
+        outputCSV.write((rowFormat * (threads.stop - threads.start)) % tuple(values))
+
+if args.type == 'flat':
+    for start in range(0, len(flatPCs), args.block_rows):
+        block = slice(start, start + args.block_rows)
+        values = itertools.chain.from_iterable(zip(flatValues['time'][block].tolist(), flatValues['cpu_time'][block].tolist(), flatTids[block].tolist(), flatPCs[block].tolist(),
+                                                   flatValues['samples'][block].astype(numpy.int64).tolist(), flatValues['energy'][block].tolist()))
+        outputCSV.write((flatFormat * len(flatPCs[block])) % tuple(values))
 
 if args.output:
   outputCSV.close()
 
 if args.vmmap is not None:
-  vmmaps = []
-  for i in range(vmmapCount):
-      try:
-          (addr, size, label,) = struct.unpack_from(endianess + "QQ256s", binProfile, binOffset)
-          binOffset += 256 + 16
-      except Exception as e:
-          raise Exception("unexpected end of input file!")
-      vmmaps.append([addr, size, label.decode('utf-8').rstrip('\0')])
-
-  vmmapsString = '\n'.join([f"{x[0]:x} {x[1]:x} {x[2]}" for x in vmmaps])
   outputVMMaps = xopen.xopen(args.vmmap, "w")
-  outputVMMaps.write(vmmapsString)
+  outputVMMaps.write(profile.getVMMapBuffer())
   outputVMMaps.close()
+
+profile.close()
@@ -7,10 +7,23 @@ import subprocess
 import hashlib
 import pickle
 import pathlib
-from filelock import FileLock
+from filelock import FileLock, Timeout
 from datetime import datetime
 import tempfile
 import csv
+import json
+import mmap
+import struct
+import collections
+import collections.abc
+import threading
+import bisect
+import concurrent.futures
+import numpy
+import zlib
+import atexit
+import multiprocessing.util
+import shutil
 from copy import copy
 
 LABEL_UNKNOWN = '_unknown'
@@ -18,15 +31,31 @@ LABEL_FOREIGN = '_foreign'
 LABEL_KERNEL  = '_kernel'
 LABEL_UNSUPPORTED = '_unsupported'
 
-cacheVersion = 'c0.3'
+cacheVersion = 'c0.5'
 profileVersion = '0.5'
 aggProfileVersion = 'agg0.9'
 annProfileVersion = 'ann0.1'
+correlatedVersion = 'cor0.2'
 
 unwindInline = True if 'UNWIND_INLINE' in os.environ and os.environ['UNWIND_INLINE'] == '1' else False
 disableCache = True if 'DISABLE_CACHE' in os.environ and os.environ['DISABLE_CACHE'] == '1' else False
+# Caches are published into shared memory by the first process and attached by all others
+sharedCache = True if 'PPERF_SHARED' in os.environ and os.environ['PPERF_SHARED'] == '1' else False
 crossCompile = "" if 'CROSS_COMPILE' not in os.environ else os.environ['CROSS_COMPILE']
 cacheFolder = str(pathlib.Path.home()) + "/.cache/pperf/" if 'PPERF_CACHE' not in os.environ or len(os.environ['PPERF_CACHE']) == 0 else os.environ['PPERF_CACHE']
+cacheJobs = int(os.environ['PPERF_JOBS']) if 'PPERF_JOBS' in os.environ and len(os.environ['PPERF_JOBS']) > 0 else (os.cpu_count() or 1)
+# binutils correlates addresses with addr2line, elf reads the symbol table and DWARF in process
+cacheBackend = 'binutils' if 'PPERF_BACKEND' not in os.environ or len(os.environ['PPERF_BACKEND']) == 0 else os.environ['PPERF_BACKEND']
+# Number of resolved pcs every sampleParser keeps, 0 keeps all of them
+sampleCacheSize = 1 << 20 if 'PPERF_SAMPLE_CACHE' not in os.environ or len(os.environ['PPERF_SAMPLE_CACHE']) == 0 else int(os.environ['PPERF_SAMPLE_CACHE'])
+# Size limit of the cache folder (e.g. 10G), least recently used caches are evicted beyond it
+cacheSize = 0 if 'PPERF_CACHE_SIZE' not in os.environ or len(os.environ['PPERF_CACHE_SIZE']) == 0 else os.environ['PPERF_CACHE_SIZE']
+# Samples resolved from a cache are memoized in the cache folder across runs
+sampleMemo = True if 'PPERF_MEMO' in os.environ and os.environ['PPERF_MEMO'] == '1' else False
+# Shared caches are published as files into this memory backed folder
+sharedMemoryFolder = '/dev/shm' if 'PPERF_SHM' not in os.environ or len(os.environ['PPERF_SHM']) == 0 else os.environ['PPERF_SHM']
+# Code sections are only disassembled in parallel shards beyond this size
+shardSize = 64 * 1024
 _toolchainVersion = None
 
 
@@ -54,6 +83,21 @@ class SAMPLE:
     invalid = [None, None, None, None, None, None, None, None, None]
 
 
+supportedPmuTypes = {
+  'float' : {'code' : 'f', 'size' : 4, 'dtype': 'f4'},
+  'double': {'code' : 'd', 'size' : 8, 'dtype': 'f8'},
+  'int8_t' : {'code': 'b', 'size' : 1, 'dtype': 'i1'},
+  'int16_t': {'code': 'h', 'size' : 2, 'dtype': 'i2'},
+  'int32_t' : {'code': 'i', 'size' : 4, 'dtype': 'i4'},
+  'int64_t' : {'code': 'q', 'size' : 8, 'dtype': 'i8'},
+  'uint8_t' : {'code': 'B', 'size' : 1, 'dtype': 'u1'},
+  'uint16_t': {'code': 'H', 'size' : 2, 'dtype': 'u2'},
+  'uint32_t' : {'code': 'I', 'size' : 4, 'dtype': 'u4'},
+  'uint64_t' : {'code': 'Q', 'size' : 8, 'dtype': 'u8'},
+  'binary' : {'code': 's', 'size': 0, 'dtype': 'V'}
+}
+
+
 class META:
     normalInstruction    = 0
     branchInstruction    = 1
@@ -77,6 +121,13 @@ def getToolchainVersion():
 
 
 def getElfArchitecture(elf: str):
+    # Known machines are named like readelf does without running it
+    try:
+        machine = elfFile(elf).machine
+        if machine in elfFile.machineNames:
+            return elfFile.machineNames[machine]
+    except Exception:
+        pass
     readelf = subprocess.run(f'readelf -h {elf}', shell=True, stdout=subprocess.PIPE)
     readelf.check_returncode()
     for line in readelf.stdout.decode('utf-8').split('\n'):
@@ -86,6 +137,258 @@ def getElfArchitecture(elf: str):
     return None
 
 
+class elfFile:
+    # Minimal in process ELF reader, only the headers and notes are read from
+    # disc so this is cheap even for multi-hundred-MB binaries
+    PT_LOAD = 1
+    PT_NOTE = 4
+    PF_X = 0x1
+    PF_W = 0x2
+    PF_R = 0x4
+    SHT_SYMTAB = 2
+    SHT_NOTE = 7
+    SHT_NOBITS = 8
+    SHT_DYNSYM = 11
+    SHF_ALLOC = 0x2
+    SHF_COMPRESSED = 0x800
+    STT_NOTYPE = 0
+    STT_OBJECT = 1
+    STT_FUNC = 2
+    STT_SECTION = 3
+    STT_FILE = 4
+    STT_COMMON = 5
+    STT_TLS = 6
+    STT_RELC = 8
+    STT_SRELC = 9
+    STB_LOCAL = 0
+    STV_HIDDEN = 2
+    NT_GNU_BUILD_ID = 3
+    ET_EXEC = 2
+    ET_DYN = 3
+    EM_ARM = 40
+    EM_AARCH64 = 183
+    EM_RISCV = 243
+    # Machine names as printed by readelf
+    machineNames = {
+        3: 'Intel 80386',
+        8: 'MIPS R3000',
+        20: 'PowerPC',
+        21: 'PowerPC64',
+        22: 'IBM S/390',
+        40: 'ARM',
+        43: 'Sparc v9',
+        62: 'Advanced Micro Devices X86-64',
+        183: 'AArch64',
+        243: 'RISC-V',
+        258: 'LoongArch',
+    }
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as fp:
+            ident = fp.read(16)
+            if len(ident) < 16 or ident[:4] != b'\x7fELF' or ident[4] not in [1, 2] or ident[5] not in [1, 2]:
+                raise Exception(f'{path} is not an ELF file')
+            self.bits = 64 if ident[4] == 2 else 32
+            self.endianess = '<' if ident[5] == 1 else '>'
+            if self.bits == 64:
+                header = struct.unpack(self.endianess + 'HHIQQQIHHHHHH', fp.read(48))
+            else:
+                header = struct.unpack(self.endianess + 'HHIIIIIHHHHHH', fp.read(36))
+            (self.type, self.machine, _, self.entry, self.phoff, self.shoff, _, _, self.phentsize, self.phnum, self.shentsize, self.shnum, self.shstrndx) = header
+
+            self.programHeaders = []
+            if self.phoff != 0 and self.phnum != 0:
+                fp.seek(self.phoff)
+                data = fp.read(self.phentsize * self.phnum)
+                for i in range(self.phnum):
+                    if self.bits == 64:
+                        (pType, flags, offset, vaddr, paddr, filesz, memsz, align) = struct.unpack_from(self.endianess + 'IIQQQQQQ', data, i * self.phentsize)
+                    else:
+                        (pType, offset, vaddr, paddr, filesz, memsz, flags, align) = struct.unpack_from(self.endianess + 'IIIIIIII', data, i * self.phentsize)
+                    self.programHeaders.append({'type': pType, 'flags': flags, 'offset': offset, 'vaddr': vaddr, 'paddr': paddr, 'filesz': filesz, 'memsz': memsz, 'align': align})
+
+            self.sectionHeaders = []
+            if self.shoff != 0 and self.shnum != 0:
+                fp.seek(self.shoff)
+                data = fp.read(self.shentsize * self.shnum)
+                for i in range(self.shnum):
+                    if self.bits == 64:
+                        (name, sType, flags, addr, offset, size, link, info, align, entsize) = struct.unpack_from(self.endianess + 'IIQQQQIIQQ', data, i * self.shentsize)
+                    else:
+                        (name, sType, flags, addr, offset, size, link, info, align, entsize) = struct.unpack_from(self.endianess + 'IIIIIIIIII', data, i * self.shentsize)
+                    self.sectionHeaders.append({'name': name, 'type': sType, 'flags': flags, 'addr': addr, 'offset': offset, 'size': size, 'link': link, 'info': info, 'align': align, 'entsize': entsize})
+
+    def read(self, offset: int, size: int):
+        with open(self.path, 'rb') as fp:
+            fp.seek(offset)
+            return fp.read(size)
+
+    def notes(self):
+        # Notes are found through the program headers, stripped section headers are the fallback
+        regions = [(x['offset'], x['filesz']) for x in self.programHeaders if x['type'] == self.PT_NOTE]
+        if len(regions) == 0:
+            regions = [(x['offset'], x['size']) for x in self.sectionHeaders if x['type'] == self.SHT_NOTE]
+        for (offset, size) in regions:
+            data = self.read(offset, size)
+            i = 0
+            while i + 12 <= len(data):
+                (nameSize, descSize, nType) = struct.unpack_from(self.endianess + 'III', data, i)
+                i += 12
+                name = data[i:i + nameSize].rstrip(b'\0')
+                i += -(-nameSize // 4) * 4
+                desc = data[i:i + descSize]
+                i += -(-descSize // 4) * 4
+                yield (name, nType, desc)
+
+    def sectionName(self, section: dict):
+        if self.shstrndx >= len(self.sectionHeaders):
+            return None
+        strtab = self.sectionHeaders[self.shstrndx]
+        data = self.read(strtab['offset'] + section['name'], 256)
+        return data.split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+    def section(self, name: str):
+        for section in self.sectionHeaders:
+            if self.sectionName(section) == name:
+                return section
+        return None
+
+    def sectionData(self, section: dict):
+        # Compressed debug sections are inflated, only zlib is supported
+        if section['type'] == self.SHT_NOBITS:
+            return b''
+        data = self.read(section['offset'], section['size'])
+        if section['flags'] & self.SHF_COMPRESSED:
+            if self.bits == 64:
+                (chType, _, chSize, _) = struct.unpack_from(self.endianess + 'IIQQ', data)
+                data = data[24:]
+            else:
+                (chType, chSize, _) = struct.unpack_from(self.endianess + 'III', data)
+                data = data[12:]
+            if chType != 1:
+                raise Exception(f'unsupported compression of section {self.sectionName(section)} in {self.path}')
+            data = zlib.decompress(data)
+        elif data[:4] == b'ZLIB' and self.sectionName(section).startswith('.zdebug'):
+            data = zlib.decompress(data[12:])
+        return data
+
+    def symbols(self, defined=True):
+        # Static symbols are preferred, stripped binaries only provide dynamic ones
+        tables = [x for x in self.sectionHeaders if x['type'] == self.SHT_SYMTAB and x['size'] > x['entsize']]
+        if len(tables) == 0:
+            tables = [x for x in self.sectionHeaders if x['type'] == self.SHT_DYNSYM]
+        for table in tables:
+            data = self.read(table['offset'], table['size'])
+            strtab = self.sectionHeaders[table['link']]
+            strings = self.read(strtab['offset'], strtab['size'])
+            entsize = table['entsize'] if table['entsize'] > 0 else (24 if self.bits == 64 else 16)
+            # The first entry is always the undefined symbol
+            for i in range(entsize, len(data) - entsize + 1, entsize):
+                if self.bits == 64:
+                    (name, info, other, shndx, value, size) = struct.unpack_from(self.endianess + 'IBBHQQ', data, i)
+                else:
+                    (name, value, size, info, other, shndx) = struct.unpack_from(self.endianess + 'IIIBBH', data, i)
+                if shndx == 0 and defined:
+                    continue
+                yield {'name': strings[name:strings.index(b'\0', name)].decode('utf-8', 'replace'), 'value': value, 'size': size, 'type': info & 0xf, 'bind': info >> 4, 'other': other, 'shndx': shndx}
+
+    def buildId(self):
+        for (name, nType, desc) in self.notes():
+            if name == b'GNU' and nType == self.NT_GNU_BUILD_ID and len(desc) > 0:
+                return desc.hex()
+        return None
+
+
+_elfDigests = {}
+_elfLayouts = {}
+
+
+def _fileFingerprint(path: str):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def getElfLayout(elf: str):
+    # Returns whether an elf is static (ET_EXEC) and the virtual address of its
+    # first readable and executable load segment, or None if it has none
+    fingerprint = _fileFingerprint(elf)
+    if fingerprint not in _elfLayouts:
+        layout = None
+        try:
+            header = elfFile(elf)
+            for segment in header.programHeaders:
+                if segment['type'] == elfFile.PT_LOAD and segment['flags'] & (elfFile.PF_R | elfFile.PF_X) == (elfFile.PF_R | elfFile.PF_X):
+                    layout = (header.type == elfFile.ET_EXEC, segment['vaddr'])
+                    break
+        except Exception:
+            pass
+        _elfLayouts[fingerprint] = layout
+    return _elfLayouts[fingerprint]
+
+
+def getElfDigest(elf: str):
+    # The GNU build-id identifies the build, the file size is added since
+    # stripping a binary keeps its build-id. Binaries without a build-id are
+    # hashed in chunks once and remembered by their stat fingerprint.
+    global cacheFolder
+    fingerprint = _fileFingerprint(elf)
+    if fingerprint in _elfDigests:
+        return _elfDigests[fingerprint]
+
+    buildId = None
+    try:
+        buildId = elfFile(elf).buildId()
+    except Exception:
+        pass
+
+    if buildId is not None:
+        digest = hashlib.md5(f'{buildId}:{fingerprint[2]}'.encode('utf-8')).hexdigest()
+    else:
+        indexFile = os.path.abspath(f'{cacheFolder}/digests')
+        index = {}
+        if os.path.isfile(indexFile):
+            try:
+                index = pickle.load(open(indexFile, mode='rb'))
+            except Exception:
+                index = {}
+        if fingerprint in index:
+            digest = index[fingerprint]
+        else:
+            hasher = hashlib.md5()
+            with open(elf, 'rb') as afile:
+                for chunk in iter(lambda: afile.read(1 << 20), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            if not disableCache and os.path.isdir(cacheFolder):
+                with FileLock(indexFile + '.lock'):
+                    if os.path.isfile(indexFile):
+                        try:
+                            index = pickle.load(open(indexFile, mode='rb'))
+                        except Exception:
+                            index = {}
+                    # Drop stale fingerprints of the same path
+                    index = {k: v for k, v in index.items() if k[0] != fingerprint[0]}
+                    index[fingerprint] = digest
+                    tmpIndexFile = f'{indexFile}.{os.getpid()}.tmp'
+                    pickle.dump(index, open(tmpIndexFile, 'wb'), pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmpIndexFile, indexFile)
+
+    _elfDigests[fingerprint] = digest
+    return digest
+
+
+def parseSize(stringSize):
+    # Sizes are given in bytes or with a K, M, G or T suffix
+    if isinstance(stringSize, int):
+        return stringSize
+    stringSize = stringSize.strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if len(stringSize) > 0 and stringSize[-1] in units:
+        return int(float(stringSize[:-1]) * units[stringSize[-1]])
+    return int(stringSize)
+
+
 def parseRange(stringRange):
     result = []
     for part in stringRange.split(','):
@@ -99,6 +402,2163 @@ def parseRange(stringRange):
     return result
 
 
+class columnarFile:
+    # Versioned on-disk container of numpy columns. The file starts with a
+    # small json header describing every column, followed by the aligned raw
+    # column data. Opening only reads the header and maps the data, pages are
+    # read on first access and multiple processes share the same page cache.
+    # The mapping stays valid if the file is evicted from the cache folder.
+    #
+    # [ 8 bytes ] magic
+    # [ 4 bytes ] header length (little endian)
+    # [ x bytes ] json header {'meta': {...}, 'columns': {name: {dtype, offset, count}}}
+    # [ ...     ] column data, every column aligned to 64 bytes
+    magic = b'PPERFCOL'
+    alignment = 64
+
+    def __init__(self, path=None, buffer=None):
+        if path is None and buffer is None:
+            raise Exception("Not enough arguments")
+        self.path = path
+        self._buffer = buffer
+        self._mmap = None
+        self._arrays = {}
+        if buffer is None:
+            with open(path, 'rb') as fp:
+                head = fp.read(12)
+                header = fp.read(struct.unpack('<I', head[8:])[0]) if len(head) == 12 and head[:8] == self.magic else None
+                if header is not None:
+                    self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._buffer = self._mmap
+        else:
+            head = bytes(buffer[:12])
+            header = bytes(buffer[12:12 + struct.unpack('<I', head[8:])[0]]) if len(head) == 12 and head[:8] == self.magic else None
+        if header is None:
+            raise Exception(f"not a columnar file {path if path is not None else ''}")
+        header = json.loads(header.decode('utf-8'))
+        self.meta = header['meta']
+        self.columns = header['columns']
+
+    @classmethod
+    def readMeta(cls, path):
+        # Only reads the header, the file is not mapped
+        with open(path, 'rb') as fp:
+            head = fp.read(12)
+            header = fp.read(struct.unpack('<I', head[8:])[0]) if len(head) == 12 and head[:8] == cls.magic else None
+        if header is None:
+            raise Exception(f"not a columnar file {path}")
+        return json.loads(header.decode('utf-8'))['meta']
+
+    def _data(self):
+        if self._buffer is None:
+            with open(self.path, 'rb') as fp:
+                self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buffer = self._mmap
+        return self._buffer
+
+    def column(self, name):
+        if name not in self._arrays:
+            if name not in self.columns:
+                raise Exception(f"column {name} does not exist in {self.path}")
+            column = self.columns[name]
+            if column['count'] == 0:
+                self._arrays[name] = numpy.empty(0, dtype=column['dtype'])
+            else:
+                self._arrays[name] = numpy.frombuffer(self._data(), dtype=column['dtype'], count=column['count'], offset=column['offset'])
+        return self._arrays[name]
+
+    def strings(self, name):
+        return stringTable(self, name)
+
+    def close(self):
+        self._arrays = {}
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Columns are still referenced elsewhere, the mapping is released with them
+                pass
+            self._mmap = None
+            self._buffer = None
+
+    @staticmethod
+    def encodeStrings(strings):
+        encoded = [x.encode('utf-8', 'surrogateescape') for x in strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.uint64)
+        numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+        return offsets, numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+
+    @classmethod
+    def write(cls, path, meta: dict, columns: dict):
+        offsets = {}
+        offset = 0
+        for name, data in columns.items():
+            offsets[name] = offset
+            offset += -(-data.nbytes // cls.alignment) * cls.alignment
+        # Column offsets depend on the header size, which depends on the offsets
+        dataStart = 0
+        while True:
+            layout = {name: {'dtype': data.dtype.str, 'offset': dataStart + offsets[name], 'count': len(data)} for name, data in columns.items()}
+            header = json.dumps({'meta': meta, 'columns': layout}).encode('utf-8')
+            required = -(-(12 + len(header)) // cls.alignment) * cls.alignment
+            if required <= dataStart:
+                break
+            dataStart = required
+
+        # Write to a temporary file first, readers must never see partial files
+        tmpfilename = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmpfilename, 'wb') as fp:
+                fp.write(cls.magic + struct.pack('<I', len(header)) + header)
+                for name, data in columns.items():
+                    fp.seek(layout[name]['offset'])
+                    written = 0
+                    for part in data.chunks if isinstance(data, columnChunks) else [data]:
+                        part = numpy.ascontiguousarray(part, dtype=data.dtype)
+                        fp.write(part.tobytes())
+                        written += part.nbytes
+                    if written != data.nbytes:
+                        raise Exception(f"column {name} is {written} instead of {data.nbytes} bytes")
+                fp.truncate(max([dataStart] + [x['offset'] + columns[n].nbytes for n, x in layout.items()]))
+            os.replace(tmpfilename, path)
+        except Exception:
+            os.remove(tmpfilename)
+            raise
+
+
+class columnChunks:
+    # Column that is written chunk by chunk by columnarFile.write, only its
+    # type and length are known upfront
+    def __init__(self, dtype, count: int, chunks):
+        self.dtype = numpy.dtype(dtype)
+        self.nbytes = self.dtype.itemsize * count
+        self.count = count
+        self.chunks = chunks
+
+    def __len__(self):
+        return self.count
+
+
+class stringTable:
+    # Interned strings of a columnar file, decoded lazily on access
+    def __init__(self, columnar: columnarFile, name: str):
+        self.offsets = columnar.column(name + '.offsets')
+        self.start = columnar.columns[name + '.data']['offset']
+        self.buffer = columnar._data() if len(self.offsets) > 1 else b''
+        self.decoded = {}
+
+    def __len__(self):
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            return None
+        if index not in self.decoded:
+            self.decoded[index] = bytes(self.buffer[self.start + int(self.offsets[index]):self.start + int(self.offsets[index + 1])]).decode('utf-8', 'surrogateescape')
+        return self.decoded[index]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class contentStore:
+    # Content addressed string tables shared by all elf caches in a folder,
+    # e.g. the lines of a header that many binaries include are stored once.
+    # Tables are named by the digest of their content and mapped on access
+    tables = {}
+
+    def __init__(self, folder=None):
+        global cacheFolder
+        self.folder = os.path.abspath(f'{cacheFolder}/store' if folder is None else folder)
+
+    def getFile(self, digest: str):
+        return f'{self.folder}/{digest}'
+
+    def put(self, strings: list):
+        offsets, data = columnarFile.encodeStrings(strings)
+        hasher = hashlib.md5(offsets.tobytes())
+        hasher.update(data.tobytes())
+        digest = hasher.hexdigest()
+        storeFile = self.getFile(digest)
+        if not os.path.isfile(storeFile):
+            os.makedirs(self.folder, exist_ok=True)
+            columnarFile.write(storeFile, {'version': cacheVersion}, {'strings.offsets': offsets, 'strings.data': data})
+        else:
+            # Refresh tables that are referenced again so they are not collected as unreferenced
+            cacheManager.touch(storeFile)
+        return digest
+
+    def get(self, digest: str):
+        storeFile = self.getFile(digest)
+        if storeFile not in self.tables:
+            if not os.path.isfile(storeFile):
+                raise Exception(f'could not find {digest} in content store {self.folder}')
+            self.tables[storeFile] = columnarFile(storeFile).strings('strings')
+        return self.tables[storeFile]
+
+
+class _cacheSamples(collections.abc.Mapping):
+    # Read only pc -> SAMPLE view on a columnar elf cache
+    def __init__(self, cache):
+        self.cache = cache
+        self.pcs = cache.column('pc')
+
+    def index(self, pc):
+        # The lookup key must match the column type, otherwise numpy converts the whole column
+        if pc < 0 or pc >= 1 << 64:
+            return None
+        i = int(numpy.searchsorted(self.pcs, numpy.uint64(pc)))
+        if i < len(self.pcs) and self.pcs[i] == pc:
+            return i
+        return None
+
+    def __getitem__(self, pc):
+        i = self.index(pc)
+        if i is None:
+            raise KeyError(pc)
+        strings = self.cache.stringTable
+        line = int(self.cache.column('line')[i])
+        return [pc, self.cache.meta['name'],
+                strings[int(self.cache.column('file')[i])],
+                strings[int(self.cache.column('function')[i])],
+                strings[int(self.cache.column('basicblock')[i])],
+                line if line != 0 else None,
+                strings[int(self.cache.column('instruction')[i])],
+                strings[int(self.cache.column('opcode')[i])],
+                int(self.cache.column('meta')[i])]
+
+    def __contains__(self, pc):
+        return self.index(pc) is not None
+
+    def __iter__(self):
+        return iter(self.pcs.tolist())
+
+    def __len__(self):
+        return len(self.pcs)
+
+
+class _cacheAsm(_cacheSamples):
+    # The disassembly lives in the content store and is only mapped on the first lookup
+    def __getitem__(self, pc):
+        i = self.index(pc)
+        if i is None:
+            raise KeyError(pc)
+        return self.cache.store.get(self.cache.meta['asm'])[int(self.cache.column('asm')[i])]
+
+
+class _cacheSource(collections.abc.Mapping):
+    def __init__(self, cache):
+        self.cache = cache
+        self.paths = {cache.stringTable[int(x)]: cache.stringTable[int(y)] for x, y in zip(cache.column('source.path'), cache.column('source.digest'))}
+
+    def __getitem__(self, path):
+        digest = self.paths[path]
+        if digest is None:
+            return None
+        return list(self.cache.store.get(digest))
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+
+class elfCacheFile(columnarFile):
+    # Columnar elf cache, provides the same interface as the in memory cache
+    # dictionary but decodes samples, asm and sources only on access
+    def __init__(self, path=None, buffer=None):
+        super().__init__(path, buffer)
+        if self.meta.get('version') != cacheVersion:
+            raise Exception(f"wrong version of cache located at {path}!")
+        self._views = {}
+        self.store = contentStore(None if path is None else os.path.join(os.path.dirname(os.path.abspath(path)), 'store'))
+
+    @property
+    def stringTable(self):
+        if 'strings' not in self._views:
+            self._views['strings'] = self.strings('strings')
+        return self._views['strings']
+
+    def __getitem__(self, key):
+        if key in self._views:
+            return self._views[key]
+        if key == 'cache':
+            self._views[key] = _cacheSamples(self)
+        elif key == 'asm':
+            self._views[key] = _cacheAsm(self)
+        elif key == 'source':
+            self._views[key] = _cacheSource(self)
+        elif key == 'date':
+            return datetime.fromisoformat(self.meta['date'])
+        else:
+            return self.meta[key]
+        return self._views[key]
+
+    def __contains__(self, key):
+        return key in ['cache', 'asm', 'source', 'date'] or key in self.meta
+
+    def close(self):
+        self._views = {}
+        super().close()
+
+    @classmethod
+    def create(cls, path, cache: dict):
+        pcs = sorted(cache['cache'].keys())
+        strings = {None: -1}
+
+        def intern(value):
+            if value not in strings:
+                strings[value] = len(strings) - 1
+            return strings[value]
+
+        columns = {
+            'pc': numpy.array(pcs, dtype=numpy.uint64),
+            'line': numpy.array([cache['cache'][pc][SAMPLE.line] or 0 for pc in pcs], dtype=numpy.uint32),
+            'meta': numpy.array([cache['cache'][pc][SAMPLE.meta] for pc in pcs], dtype=numpy.uint16),
+        }
+        for column in ['file', 'function', 'basicblock', 'instruction', 'opcode']:
+            index = SAMPLE.names.index(column)
+            columns[column] = numpy.array([intern(cache['cache'][pc][index]) for pc in pcs], dtype=numpy.int32)
+
+        # Disassembly and source code are kept out of the cache in the content store
+        store = contentStore(os.path.join(os.path.dirname(os.path.abspath(path)), 'store'))
+        asm = {}
+        columns['asm'] = numpy.array([asm.setdefault(cache['asm'][pc], len(asm)) for pc in pcs], dtype=numpy.int32)
+        columns['source.path'] = numpy.array([intern(x) for x in cache['source']], dtype=numpy.int32)
+        columns['source.digest'] = numpy.array([intern(None if x is None else store.put(x)) for x in cache['source'].values()], dtype=numpy.int32)
+        columns['strings.offsets'], columns['strings.data'] = cls.encodeStrings(list(strings)[1:])
+
+        meta = {k: cache[k] for k in ['version', 'binary', 'name', 'arch', 'toolchain', 'unwindInline']}
+        meta['date'] = cache['date'].isoformat()
+        meta['asm'] = store.put(list(asm))
+        cls.write(path, meta, columns)
+
+
+class correlatedFile(columnarFile):
+    # Samples written by correlateAddressCsv.py in the columnar format. Input
+    # columns whose values are all written exactly like numbers and the
+    # addresses are stored as numbers, other input columns as ids into a string
+    # table. Labels are ids into a dictionary per label, which holds numbers
+    # for numeric labels like the line. Label id -1 is an empty label and -2
+    # the label of unknown addresses (meta 'unknown')
+    def __init__(self, path=None, buffer=None):
+        super().__init__(path, buffer)
+        if self.meta.get('version') != correlatedVersion:
+            raise Exception(f"wrong version of correlated file {path if path is not None else ''}")
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def names(self):
+        return self.meta['columns']
+
+    def dictionary(self, name):
+        # None for numeric columns
+        if name in self.meta['strings']:
+            return self.strings(name)
+        if name in self.meta['labels']:
+            return self.column(name + '.values')
+        return None
+
+    def values(self, name):
+        # Decoded values of a column in row order
+        ids = self.column(name)
+        dictionary = self.dictionary(name)
+        if dictionary is None:
+            return ids.tolist()
+        dictionary = list(dictionary) if isinstance(dictionary, stringTable) else dictionary.tolist()
+        special = {-1: None, -2: self.meta['unknown']}
+        return [dictionary[x] if x >= 0 else special[x] for x in ids.tolist()]
+
+    def rows(self):
+        return zip(*[self.values(x) for x in self.names()])
+
+
+class profileReader:
+    # Streaming reader of binary PPerf profiles, plain or compressed. Samples
+    # are decoded in batches of numpy arrays from blocks of the file so memory
+    # stays constant. Every batch is a dict with per sample 'time' (us),
+    # 'pmu' and 'threads' (count) and per thread record 'sample' (index in
+    # the profile), 'tid', 'pc' and 'cputime' (ns). With deltas batches also
+    # hold per sample 'wallDelta' and per record 'cpuDelta' and 'share' (see
+    # _deltas). VMMaps follow the samples and are available once all batches
+    # were read or skipped.
+    #
+    # Uncompressed profiles are memory mapped and decoded in place, compressed
+    # profiles are read block by block.
+    #
+    # An index sidecar next to the profile records the offset and wall time of
+    # every nth sample, time windows then start reading close to their begin,
+    # and where the samples end, VMMaps are then read without locating them
+    pmuNames = ['custom', 'current', 'voltage', 'power']
+    # Leading bytes of the compressed formats xopen reads, profiles start with
+    # a magic number between 0 and 3
+    compressionMagics = [b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00', b'\x28\xb5\x2f\xfd']
+    # Records are packed, sizes are those of the standard sizes without alignment
+    header = struct.Struct('=IQQQII')
+    vmmapRecord = struct.Struct('=QQ256s')
+
+    def __init__(self, path: str, pmuType='double', endianess='=', blockSize=1 << 23):
+        if not os.path.isfile(path):
+            raise Exception(f"profile {path} not found")
+        if pmuType not in supportedPmuTypes:
+            raise Exception(f"unsupported pmu type {pmuType}")
+        self.path = path
+        self.endianess = endianess
+        self.blockSize = blockSize
+        self.mapping = None
+        self.data = None
+        with open(path, 'rb') as fp:
+            leading = fp.read(6)
+            if os.fstat(fp.fileno()).st_size >= self.header.size and not any(leading.startswith(x) for x in self.compressionMagics):
+                self.mapping = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping is not None:
+            self.file = None
+            self.data = numpy.frombuffer(self.mapping, dtype=numpy.uint8)
+            head = self.mapping[:self.header.size]
+        else:
+            self.file = xopen.xopen(path, mode='rb')
+            head = self.file.read(self.header.size)
+        if len(head) < self.header.size:
+            raise Exception("unexpected end of input file")
+        (self.magic, self.wallTime, self.latencyTime, self.sampleCount, self.pmuSize, self.vmmapCount) = struct.unpack(endianess + self.header.format[1:], head)
+        if not (0 <= self.magic <= 3):
+            raise Exception("PPerf magic number in invalid range")
+        self.pmuName = self.pmuNames[self.magic]
+
+        self.pmuType = pmuType
+        if supportedPmuTypes[pmuType]['size'] == 0:
+            pmuDtype = endianess + supportedPmuTypes[pmuType]['dtype'] + str(self.pmuSize)
+        elif supportedPmuTypes[pmuType]['size'] != self.pmuSize:
+            raise Exception(f"incorrect pmu type specified to unpack, profile contains pmu data type of {self.pmuSize} byte(s)")
+        else:
+            pmuDtype = endianess + supportedPmuTypes[pmuType]['dtype']
+        self.pmuDtype = numpy.dtype(pmuDtype)
+        self.countDtype = numpy.dtype(endianess + 'u4')
+        self.timeDtype = numpy.dtype(endianess + 'u8')
+        self.threadDtype = numpy.dtype([('tid', endianess + 'u4'), ('pc', endianess + 'u8'), ('cputime', endianess + 'u8')])
+        self.sampleHeaderSize = 8 + self.pmuSize + 4
+
+        # Position is the offset in the profile of the first byte of rest
+        self.position = self.header.size
+        self.samplesRead = 0
+        self.lastTime = None
+        self.rest = b''
+        self.vmmaps = None
+        self.lastDeltaTime = None
+        self.lastCpuTimes = {}
+        self.indexFile = f'{path}.idx'
+        self.index = self.loadIndex()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.mapping is not None:
+            self.data = None
+            try:
+                self.mapping.close()
+            except BufferError:
+                # Batches still reference the mapping, it is released with them
+                pass
+            self.mapping = None
+        if self.index is not None:
+            self.index.close()
+
+    def _scan(self, data, remaining):
+        # Complete samples at the start of data are located in runs with the
+        # same thread count. Thread counts rarely change, so the counts of the
+        # following samples are checked at strided positions with a growing
+        # window instead of one sample at a time
+        runs = []
+        offset = 0
+        window = 64
+        samples = 0
+        while samples < remaining and offset + self.sampleHeaderSize <= len(data):
+            count = int(data[offset + 8 + self.pmuSize:offset + self.sampleHeaderSize].view(self.countDtype)[0])
+            stride = self.sampleHeaderSize + self.threadDtype.itemsize * count
+            n = min(remaining - samples, window, (len(data) - offset) // stride)
+            if n == 0:
+                break
+            positions = offset + 8 + self.pmuSize + stride * numpy.arange(n, dtype=numpy.int64)
+            counts = data[positions[:, None] + numpy.arange(4)].view(self.countDtype).ravel()
+            changed = numpy.flatnonzero(counts != count)
+            run = int(changed[0]) if len(changed) > 0 else n
+            if len(runs) > 0 and runs[-1][1] == count and runs[-1][0] + runs[-1][2] * stride == offset:
+                runs[-1][2] += run
+            else:
+                runs.append([offset, count, run])
+            offset += stride * run
+            samples += run
+            window = window * 2 if run == n else 64
+        return runs, offset, samples
+
+    def _blocks(self):
+        # Blocks of complete samples with the profile offset of their first
+        # byte, the remainder of a block is kept for the next one
+        if self.mapping is not None:
+            yield from self._mappedBlocks()
+            return
+        while self.samplesRead < self.sampleCount:
+            block = self.file.read(self.blockSize)
+            data = numpy.frombuffer(self.rest + block, dtype=numpy.uint8)
+            position = self.position
+            runs, end, samples = self._scan(data, self.sampleCount - self.samplesRead)
+            if samples == 0 and len(block) == 0:
+                raise Exception("unexpected end of input file")
+            self.rest = data[end:].tobytes()
+            self.position += end
+            if samples > 0:
+                yield data, runs, samples, position
+
+    def _mappedBlocks(self):
+        # Blocks are views of the mapping, a block grows until it holds a sample
+        size = self.blockSize
+        while self.samplesRead < self.sampleCount:
+            position = self.position
+            data = self.data[position:position + size]
+            runs, end, samples = self._scan(data, self.sampleCount - self.samplesRead)
+            if samples == 0:
+                if position + len(data) >= len(self.data):
+                    raise Exception("unexpected end of input file")
+                size *= 2
+                continue
+            size = self.blockSize
+            self.position += end
+            yield data, runs, samples, position
+
+    def _seek(self, position: int, sample: int):
+        # Compressed streams might not be seekable, those are read up to the position
+        if self.mapping is not None:
+            pass
+        elif self.file.seekable():
+            self.file.seek(position)
+        else:
+            self.file.close()
+            self.file = xopen.xopen(self.path, mode='rb')
+            skipped = 0
+            while skipped < position:
+                read = len(self.file.read(min(self.blockSize, position - skipped)))
+                if read == 0:
+                    raise Exception("unexpected end of input file")
+                skipped += read
+        self.position = position
+        self.samplesRead = sample
+        self.lastTime = None
+        self.rest = b''
+        self.lastDeltaTime = None
+        self.lastCpuTimes = {}
+
+    def _decode(self, data, runs, samples):
+        time, pmu, threads, records = [], [], [], []
+        for (offset, count, run) in runs:
+            decoded = numpy.frombuffer(data, dtype=numpy.dtype([('time', self.timeDtype), ('pmu', self.pmuDtype), ('threads', self.countDtype), ('records', self.threadDtype, (count,))]), count=run, offset=offset)
+            time.append(decoded['time'])
+            pmu.append(decoded['pmu'])
+            threads.append(decoded['threads'])
+            records.append(decoded['records'].ravel())
+        batch = {
+            'time': numpy.concatenate(time).astype(numpy.uint64),
+            'pmu': numpy.concatenate(pmu),
+            'threads': numpy.concatenate(threads).astype(numpy.uint32),
+        }
+        if (self.lastTime is not None and batch['time'][0] < self.lastTime) or numpy.any(batch['time'][1:] < batch['time'][:-1]):
+            raise Exception("unexpected sample time wall time (smaller than previous' samples)")
+        self.lastTime = int(batch['time'][-1])
+        records = numpy.concatenate(records)
+        batch['sample'] = numpy.repeat(numpy.arange(self.samplesRead, self.samplesRead + samples, dtype=numpy.int64), batch['threads'])
+        for name in ['tid', 'pc', 'cputime']:
+            batch[name] = records[name].astype(numpy.uint32 if name == 'tid' else numpy.uint64)
+        if self.pmuDtype.kind != 'V':
+            batch['pmu'] = batch['pmu'].astype(self.pmuDtype.newbyteorder('='))
+        return batch
+
+    @staticmethod
+    def _filter(batch, keep, records):
+        # Samples and thread records are dropped by masks, samples keep their
+        # remaining thread records
+        sampleOfRecord = numpy.repeat(numpy.arange(len(batch['time'])), batch['threads'])
+        filtered = {x: batch[x][keep] for x in ['time', 'pmu', 'wallDelta'] if x in batch}
+        records = records & keep[sampleOfRecord]
+        filtered['threads'] = numpy.bincount(sampleOfRecord[records], minlength=len(keep)).astype(numpy.uint32)[keep]
+        for name in ['sample', 'tid', 'pc', 'cputime', 'cpuDelta', 'share']:
+            if name in batch:
+                filtered[name] = batch[name][records]
+        return filtered
+
+    def batches(self, fromTime=None, toTime=None, tids=None, deltas=False):
+        # Times are wall times of the profile in us, tids a list of thread ids.
+        # Deltas are computed within the time window over all threads, so the
+        # shares of the selected threads are those of an unfiltered read
+        if fromTime is not None and self.index is not None:
+            entry = int(numpy.searchsorted(self.index.column('time'), numpy.uint64(max(fromTime, 0)), side='left')) - 1
+            if entry >= 0 and int(self.index.column('sample')[entry]) > self.samplesRead:
+                self._seek(int(self.index.column('offset')[entry]), int(self.index.column('sample')[entry]))
+        for data, runs, samples, position in self._blocks():
+            batch = self._decode(data, runs, samples)
+            self.samplesRead += samples
+            if toTime is not None and batch['time'][0] > toTime:
+                return
+            keep = numpy.ones(samples, dtype=bool)
+            if fromTime is not None:
+                keep &= batch['time'] >= fromTime
+            if toTime is not None:
+                keep &= batch['time'] <= toTime
+            if not keep.any():
+                continue
+            if not keep.all():
+                batch = self._filter(batch, keep, numpy.ones(len(batch['tid']), dtype=bool))
+            if deltas:
+                batch['wallDelta'], batch['cpuDelta'], batch['share'] = self._deltas(batch)
+            if tids is not None:
+                batch = self._filter(batch, numpy.ones(len(batch['time']), dtype=bool), numpy.isin(batch['tid'], tids))
+            yield batch
+
+    def _deltas(self, batch):
+        # Returns the wall time of the interval that ended with every sample,
+        # the cpu time every thread record spent since the previous record of
+        # its thread and the share of the interval of every record, split by
+        # cpu time or equally if no thread of a sample advanced. Times are in
+        # seconds, the first sample read and the first record of a thread have none
+        sampleTimes = batch['time'].astype(numpy.float64)
+        if len(sampleTimes) == 0:
+            return numpy.zeros(0), numpy.zeros(0), numpy.zeros(0)
+        previousTimes = numpy.concatenate([[sampleTimes[0] if self.lastDeltaTime is None else self.lastDeltaTime], sampleTimes[:-1]])
+        wallDeltas = (sampleTimes - previousTimes) / 1000000.0
+        self.lastDeltaTime = sampleTimes[-1]
+
+        records = len(batch['tid'])
+        cpuDeltas = numpy.zeros(records, dtype=numpy.float64)
+        shares = numpy.zeros(records, dtype=numpy.float64)
+        if records == 0:
+            return wallDeltas, cpuDeltas, shares
+        order = numpy.lexsort((batch['sample'], batch['tid']))
+        tids = batch['tid'][order]
+        cpuTimes = batch['cputime'][order].astype(numpy.int64)
+        threadStart = numpy.ones(records, dtype=bool)
+        threadStart[1:] = tids[1:] != tids[:-1]
+        previousCpuTimes = numpy.concatenate([[0], cpuTimes[:-1]])
+        for i in numpy.flatnonzero(threadStart).tolist():
+            previousCpuTimes[i] = self.lastCpuTimes.get(int(tids[i]), cpuTimes[i])
+        for i in (numpy.flatnonzero(threadStart[1:]).tolist() + [records - 1]):
+            self.lastCpuTimes[int(tids[i])] = int(cpuTimes[i])
+        cpuDeltas[order] = numpy.maximum(cpuTimes - previousCpuTimes, 0) / 1000000000.0
+
+        sampleOfRecord = numpy.repeat(numpy.arange(len(batch['time'])), batch['threads'])
+        cpuPerSample = numpy.bincount(sampleOfRecord, weights=cpuDeltas, minlength=len(batch['time']))
+        threadsPerSample = numpy.maximum(batch['threads'], 1).astype(numpy.float64)
+        shares = numpy.where(cpuPerSample[sampleOfRecord] > 0, cpuDeltas / numpy.maximum(cpuPerSample[sampleOfRecord], 1e-300), 1.0 / threadsPerSample[sampleOfRecord])
+        return wallDeltas, cpuDeltas, shares
+
+    def rewind(self):
+        # Positions the reader at the first sample again
+        self._seek(self.header.size, 0)
+
+    def skip(self):
+        # Remaining samples are only located, not decoded. The index records
+        # where the samples end
+        if self.index is not None and 'vmmaps' in self.index.meta:
+            if self.samplesRead < self.sampleCount:
+                self._seek(int(self.index.meta['vmmaps']), self.sampleCount)
+            return
+        if self.index is not None and len(self.index.column('sample')) > 0 and int(self.index.column('sample')[-1]) > self.samplesRead:
+            self._seek(int(self.index.column('offset')[-1]), int(self.index.column('sample')[-1]))
+        for data, runs, samples, position in self._blocks():
+            self.samplesRead += samples
+
+    def getStartTime(self):
+        # Wall time of the first sample in us
+        if self.index is not None and len(self.index.column('time')) > 0:
+            return int(self.index.column('time')[0])
+        if self.sampleCount == 0:
+            return None
+        with xopen.xopen(self.path, mode='rb') as fp:
+            head = fp.read(self.header.size + 8)
+        if len(head) < self.header.size + 8:
+            raise Exception("unexpected end of input file")
+        return int(numpy.frombuffer(head, dtype=self.timeDtype, count=1, offset=self.header.size)[0])
+
+    def loadIndex(self):
+        # The index is only used if it belongs to the current profile file
+        if not os.path.isfile(self.indexFile):
+            return None
+        stat = os.stat(self.path)
+        try:
+            index = columnarFile(self.indexFile)
+        except Exception:
+            return None
+        if index.meta.get('version') != profileVersion or index.meta.get('size') != stat.st_size or index.meta.get('mtime') != stat.st_mtime_ns or index.meta.get('endianess') != self.endianess or index.meta.get('pmuSize') != self.pmuSize:
+            index.close()
+            return None
+        return index
+
+    def buildIndex(self, every=1024):
+        # Writes the index sidecar with the offset and wall time of every nth
+        # sample. The profile is scanned from its first sample, the reader is
+        # positioned at the first sample again afterwards
+        self.rewind()
+        offsets, samples, times = [], [], []
+        for data, runs, count, position in self._blocks():
+            first = self.samplesRead
+            for (offset, threads, run) in runs:
+                indices = numpy.arange(first, first + run, dtype=numpy.int64)
+                chosen = numpy.flatnonzero(indices % every == 0)
+                chosenOffsets = offset + (self.sampleHeaderSize + self.threadDtype.itemsize * threads) * chosen
+                offsets.append(position + chosenOffsets)
+                samples.append(indices[chosen])
+                times.append(data[chosenOffsets[:, None] + numpy.arange(8)].view(self.timeDtype).ravel())
+                first += run
+            self.samplesRead += count
+        stat = os.stat(self.path)
+        meta = {'version': profileVersion, 'every': every, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'endianess': self.endianess, 'pmuSize': self.pmuSize, 'vmmaps': self.position}
+        columns = {
+            'offset': numpy.concatenate(offsets + [numpy.empty(0, dtype=numpy.int64)]).astype(numpy.uint64),
+            'sample': numpy.concatenate(samples + [numpy.empty(0, dtype=numpy.int64)]).astype(numpy.uint64),
+            'time': numpy.concatenate(times + [numpy.empty(0, dtype=numpy.uint64)]).astype(numpy.uint64),
+        }
+        columnarFile.write(self.indexFile, meta, columns)
+        if self.index is not None:
+            self.index.close()
+        self.index = self.loadIndex()
+        self.rewind()
+
+    def getVMMaps(self):
+        # List of [address, size, label], all samples that were not read yet are skipped
+        if self.vmmaps is None:
+            self.skip()
+            if self.mapping is not None:
+                data = self.mapping[self.position:self.position + self.vmmapCount * self.vmmapRecord.size]
+            else:
+                data = self.rest + self.file.read(max(0, self.vmmapCount * self.vmmapRecord.size - len(self.rest)))
+            if len(data) < self.vmmapCount * self.vmmapRecord.size:
+                raise Exception("unexpected end of input file!")
+            self.vmmaps = []
+            for i in range(self.vmmapCount):
+                (addr, size, label,) = struct.unpack_from(self.endianess + self.vmmapRecord.format[1:], data, i * self.vmmapRecord.size)
+                self.vmmaps.append([addr, size, label.decode('utf-8').rstrip('\0')])
+        return self.vmmaps
+
+    def getVMMapBuffer(self):
+        # VMMaps in the format sampleParser.loadVMMap reads
+        return '\n'.join([f"{x[0]:x} {x[1]:x} {x[2]}" for x in self.getVMMaps()])
+
+
+_objdumpLine = re.compile(r'([0-9a-fA-F]+) <([^+]+)?\+?(0x[0-9a-f-A-F]+)?> ([0-9a-fA-F ]+)[\t]+([^<\t ]+)?(.+)?')
+_addr2lineDecode = re.compile('^(0x[0-9a-fA-F]+)\n(.+?)\n(.+)?:(([0-9]+)|(\?)).*$')
+
+
+class _serialPool:
+    # Stand-in for a process pool when running with a single job
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+def _workerPool(jobs: int):
+    if jobs <= 1:
+        return _serialPool()
+    return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+
+def _shardSection(elf: str, section: str, start: int, size: int, jobs: int):
+    # Splits a code section into address ranges that start at function
+    # symbols, those are always instruction boundaries
+    global shardSize
+    shardCount = min(jobs * 4, size // shardSize) if jobs > 1 else 1
+    if shardCount <= 1:
+        return [(elf, section, None, None)]
+    try:
+        elfData = elfFile(elf)
+        # Thumb functions are marked by the lowest bit of their address
+        mask = ~1 if elfData.machine == elfFile.EM_ARM else ~0
+        functions = sorted({x['value'] & mask for x in elfData.symbols() if x['type'] == elfFile.STT_FUNC and start < (x['value'] & mask) < start + size})
+    except Exception:
+        functions = []
+    cuts = []
+    for i in range(1, shardCount):
+        j = bisect.bisect_left(functions, start + (size * i) // shardCount)
+        if j < len(functions) and (len(cuts) == 0 or functions[j] > cuts[-1]):
+            cuts.append(functions[j])
+    bounds = [None] + cuts + [None]
+    return [(elf, section, bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def _objdumpShard(elf: str, section: str, start=None, stop=None):
+    global crossCompile
+    addressRange = (f' --start-address=0x{start:x}' if start is not None else '') + (f' --stop-address=0x{stop:x}' if stop is not None else '')
+    # We disassemble much more than needed however its necesarry for some profilers
+    sObjdump = f"{crossCompile}objdump -Dwz --prefix-addresses --show-raw-insn -j {section}{addressRange} {elf}"
+    # sObjdump = f"{crossCompile}objdump -Dz --prefix-addresses -j {section} {elf}"
+    pObjdump = subprocess.Popen(sObjdump, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+    # Remove trailing additional data that begins with '//'
+    # sObjdump = re.sub('[ \t]+(// ).+\n','\n', sObjdump)
+    # Remove trailing additional data that begins with '#'
+    # sObjdump = re.sub('[ \t]+(# ).+\n','\n', sObjdump)
+    result = []
+    for line in pObjdump.stdout:
+        match0 = _objdumpLine.match(line)
+        if match0:
+            instr = match0.group(5).rstrip('\n').strip()
+            asm = instr
+            if match0.group(6) is not None:
+                asm += match0.group(6).rstrip('\n').rstrip()
+            result.append((int(match0.group(1), 16), match0.group(3) is None, instr, match0.group(4).replace(' ', '').strip(), match0.group(1).strip(), asm))
+    pObjdump.stdout.close()
+    returnCode = pObjdump.wait()
+    if returnCode:
+        raise subprocess.CalledProcessError(returnCode, sObjdump)
+    return result
+
+
+def _addr2lineShard(elf: str, pcs: list, unwindInline: bool):
+    global crossCompile
+    result = []
+    tmpfile, tmpfilename = tempfile.mkstemp()
+    try:
+        with os.fdopen(tmpfile, 'w') as tmp:
+            tmp.write('\n'.join(map(lambda x: f'0x{x:x}', pcs)) + '\n')
+            tmp.close()
+            # addr2line by default outputs the file/line where the instruction originates from
+            # the -i option lets it print the chain of inlining which might be multiple files/lines
+            # We are only intersted in one result per address. We want either the function the
+            # address ends up in or the function it came from (when inlined). It will return the origin
+            # without -i and when -i is passed, the last result will be always the function this
+            # address was inlined to. That means this option is logically inverted for this script
+            # as we only take the last result per address.
+            pAddr2line = subprocess.run(f"{crossCompile}addr2line -Cafr{'i' if not unwindInline else ''} -e {elf} @{tmpfilename}", shell=True, stdout=subprocess.PIPE)
+            pAddr2line.check_returncode()
+            sAddr2line = pAddr2line.stdout.decode('utf-8').split("\n0x")
+            for entry in sAddr2line:
+                matchEntry = (entry if entry.startswith('0x') else '0x' + entry).split('\n')
+                while len(matchEntry) > 3 and len(matchEntry[-1]) == 0:
+                    matchEntry.pop()
+                matchEntry = '\n'.join([matchEntry[0], matchEntry[-2], matchEntry[-1]])
+
+                match = _addr2lineDecode.match(matchEntry)
+                if match:
+                    result.append((int(match.group(1), 16),
+                                   match.group(3) if match.group(3) is not None and len(match.group(3).strip('?')) != 0 else None,
+                                   match.group(2) if match.group(2) is not None and len(match.group(2).strip('?')) != 0 else None,
+                                   int(match.group(4)) if match.group(4) is not None and len(match.group(4).strip('?')) != 0 and int(match.group(4)) != 0 else None))
+                else:
+                    raise Exception(f'Could not decode the following addr2line entry\n{entry}')
+    finally:
+        os.remove(tmpfilename)
+    return result
+
+
+class elfSymbolFinder:
+    # Emulates the symbol table lookup of binutils (elf_find_function) which
+    # addr2line falls back to, including the file symbol handling and the
+    # reuse of the last found function for consecutive addresses
+    mappingSymbols = re.compile(r'^\$[adtx](\..*)?$')
+
+    def __init__(self, elf: elfFile):
+        self.sections = [(x['addr'], x['addr'] + x['size'], i) for i, x in enumerate(elf.sectionHeaders) if x['flags'] & elfFile.SHF_ALLOC and i > 0]
+        self.names = []
+        self.files = []
+        candidates = {}
+        fileName = None
+        fileState = 0
+        ignoreMapping = elf.machine in [elfFile.EM_ARM, elfFile.EM_AARCH64, elfFile.EM_RISCV]
+        for symbol in elf.symbols(defined=False):
+            if symbol['type'] == elfFile.STT_FILE:
+                fileName = symbol['name']
+                if fileState == 1:
+                    fileState = 2
+                continue
+            if fileState == 0:
+                fileState = 1
+            if symbol['type'] in [elfFile.STT_OBJECT, elfFile.STT_SECTION, elfFile.STT_COMMON, elfFile.STT_TLS, elfFile.STT_RELC, elfFile.STT_SRELC] or symbol['shndx'] == 0 or symbol['shndx'] >= 0xff00:
+                continue
+            if symbol['size'] == 0 and symbol['bind'] == elfFile.STB_LOCAL and symbol['type'] == elfFile.STT_NOTYPE and symbol['other'] & 0x3 == elfFile.STV_HIDDEN:
+                continue
+            if ignoreMapping and self.mappingSymbols.match(symbol['name']):
+                continue
+            index = len(self.names)
+            self.names.append(symbol['name'] if len(symbol['name']) > 0 else None)
+            self.files.append(fileName if fileName is not None and (symbol['bind'] == elfFile.STB_LOCAL or fileState != 2) else None)
+            if symbol['shndx'] not in candidates:
+                candidates[symbol['shndx']] = []
+            candidates[symbol['shndx']].append((symbol['value'], index, symbol['size'] if symbol['size'] > 0 else 1))
+        # Per section symbols ordered by address, equal addresses stay in symbol table order
+        self.candidates = {}
+        for shndx, symbols in candidates.items():
+            symbols.sort()
+            self.candidates[shndx] = ([x[0] for x in symbols], [x[1] for x in symbols], [x[2] for x in symbols])
+        self.lastSection = None
+        self.last = None
+
+    def _shrink(self, symbols, pc, start, size, after, before):
+        # Later symbols inside the current function limit its size
+        (values, indices, _) = symbols
+        for k in range(bisect.bisect_right(values, pc), bisect.bisect_left(values, start + size)):
+            if indices[k] > after and (before is None or indices[k] < before):
+                size = min(size, values[k] - start)
+        return size
+
+    def _find(self, symbols, pc):
+        (values, indices, sizes) = symbols
+        hi = bisect.bisect_right(values, pc)
+        if hi == 0:
+            return None
+        start = values[hi - 1]
+        current = bisect.bisect_left(values, start)
+        size = sizes[current]
+        for k in range(current + 1, hi):
+            size = self._shrink(symbols, pc, start, size, indices[current], indices[k])
+            if start + size <= pc:
+                better = sizes[k] > size
+            elif start + sizes[k] > pc:
+                better = sizes[k] < size
+            else:
+                better = False
+            if better:
+                current = k
+                size = sizes[k]
+        size = self._shrink(symbols, pc, start, size, indices[current], None)
+        return (indices[current], start, size)
+
+    def find(self, pc):
+        # Returns the function name, the file name and the address of the symbol
+        section = None
+        for (low, high, shndx) in self.sections:
+            if low <= pc < high:
+                section = shndx
+                break
+        if section is None:
+            return None
+        if section not in self.candidates:
+            self.lastSection = section
+            self.last = None
+            return None
+        if self.lastSection != section or self.last is None or pc < self.last[1] or pc >= self.last[1] + self.last[2]:
+            self.lastSection = section
+            self.last = self._find(self.candidates[section], pc)
+        if self.last is None:
+            return None
+        return (self.names[self.last[0]], self.files[self.last[0]], self.last[1])
+
+
+def _uleb128(data, pos):
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7f
+    shift = 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos + 1
+        shift += 7
+
+
+def _sleb128(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                result -= 1 << shift
+            return result, pos
+
+
+def _arangeAdd(ranges: list, low: int, high: int):
+    # Same merging as binutils, the first range defines the low address of a function
+    if low == high:
+        return
+    if len(ranges) == 0:
+        ranges.append([low, high])
+        return
+    for arange in ranges:
+        if low == arange[1]:
+            arange[1] = high
+            return
+        if high == arange[0]:
+            arange[0] = low
+            return
+    ranges.insert(1, [low, high])
+
+
+class dwarfInfo:
+    # In process reader for the parts of DWARF 2-5 that addr2line uses to
+    # correlate addresses: line programs, the ranges and names of functions
+    # and inlined subroutines and their call sites. Lookups follow the rules
+    # of binutils so both backends create identical caches.
+    DW_TAG_entry_point = 0x03
+    DW_TAG_inlined_subroutine = 0x1d
+    DW_TAG_subprogram = 0x2e
+    DW_TAG_compile_unit = 0x11
+    DW_AT_sibling = 0x01
+    DW_AT_name = 0x03
+    DW_AT_stmt_list = 0x10
+    DW_AT_low_pc = 0x11
+    DW_AT_high_pc = 0x12
+    DW_AT_language = 0x13
+    DW_AT_comp_dir = 0x1b
+    DW_AT_abstract_origin = 0x31
+    DW_AT_specification = 0x47
+    DW_AT_ranges = 0x55
+    DW_AT_call_file = 0x58
+    DW_AT_call_line = 0x59
+    DW_AT_linkage_name = 0x6e
+    DW_AT_str_offsets_base = 0x72
+    DW_AT_addr_base = 0x73
+    DW_AT_MIPS_linkage_name = 0x2007
+    DW_FORM_addr = 0x01
+    DW_FORM_implicit_const = 0x21
+    functionTags = {DW_TAG_entry_point, DW_TAG_inlined_subroutine, DW_TAG_subprogram}
+    # Subtrees of these entries may contain functions and are never skipped
+    scopeTags = {0x0b, 0x11, 0x1e, 0x25, 0x32, 0x39, 0x3c, DW_TAG_entry_point, DW_TAG_inlined_subroutine, DW_TAG_subprogram}
+    # Languages that binutils does not demangle, their DW_AT_name is taken as linkage name
+    plainLanguages = {0x0001, 0x0002, 0x0005, 0x0006, 0x0007, 0x0009, 0x000c, 0x000f, 0x0012, 0x001d, 0x8001, 0x8004, 0x8006, 0x8007, 0x8765}
+    stringForms = {0x08, 0x0e, 0x1a, 0x1d, 0x1f, 0x25, 0x26, 0x27, 0x28}
+    integerForms = {0x01, 0x05, 0x06, 0x07, 0x0b, 0x0c, 0x0d, 0x0f, 0x10, 0x11, 0x12, 0x13, 0x14, 0x15, 0x17, 0x19, 0x1b, 0x1c, 0x20, 0x21, 0x22, 0x23, 0x24, 0x29, 0x2a, 0x2b, 0x2c}
+    DW_FORM_rnglistx = 0x23
+    # Separate or shared debug information is left to binutils, as are GNU
+    # style compressed DWARF 5 range lists which binutils does not find
+    unsupportedSections = ['.gnu_debugaltlink', '.stab', '.debug', '.zdebug_rnglists']
+
+    def __init__(self, elf: elfFile):
+        self.elf = elf
+        self.endianess = 'little' if elf.endianess == '<' else 'big'
+        self.sections = {}
+        names = set()
+        for section in elf.sectionHeaders:
+            name = elf.sectionName(section)
+            names.add(name)
+            if name is not None and name.startswith('.zdebug'):
+                name = '.debug' + name[7:]
+            if name is not None and name not in self.sections:
+                self.sections[name] = section
+        self.supported = '.debug_info' in self.sections or not self._separateDebugInfo()
+        for name in self.unsupportedSections:
+            if name in names:
+                self.supported = False
+        self.data = {}
+        self.units = []
+        self.abbrevTables = {}
+        self.abstractInstances = {}
+        self.lineTables = {}
+        if self.supported and '.debug_info' in self.sections:
+            self._readUnits()
+
+    def _separateDebugInfo(self):
+        # binutils follows the build-id and debug link to separate debug files
+        buildId = self.elf.buildId()
+        if buildId is not None and os.path.isfile(f'/usr/lib/debug/.build-id/{buildId[:2]}/{buildId[2:]}.debug'):
+            return True
+        if '.gnu_debuglink' in self.sections:
+            link = self.elf.sectionData(self.sections['.gnu_debuglink']).split(b'\0', 1)[0].decode('utf-8', 'replace')
+            folder = os.path.dirname(os.path.abspath(self.elf.path))
+            for path in [f'{folder}/{link}', f'{folder}/.debug/{link}', f'/usr/lib/debug{folder}/{link}']:
+                if os.path.isfile(path) and os.path.abspath(path) != os.path.abspath(self.elf.path):
+                    return True
+        return False
+
+    def _section(self, name):
+        if name not in self.data:
+            self.data[name] = self.elf.sectionData(self.sections[name]) if name in self.sections else b''
+        return self.data[name]
+
+    def _int(self, data, pos, size):
+        return int.from_bytes(data[pos:pos + size], self.endianess)
+
+    def _string(self, data, pos):
+        end = data.index(b'\0', pos)
+        return data[pos:end].decode('utf-8', 'surrogateescape'), end + 1
+
+    def _readUnits(self):
+        info = self._section('.debug_info')
+        offset = 0
+        while offset + 11 <= len(info):
+            length = self._int(info, offset, 4)
+            pos = offset + 4
+            offsetSize = 4
+            if length == 0xffffffff:
+                length = self._int(info, pos, 8)
+                pos += 8
+                offsetSize = 8
+            end = pos + length
+            version = self._int(info, pos, 2)
+            pos += 2
+            if version < 2 or version > 5:
+                raise Exception(f'unsupported DWARF version {version} in {self.elf.path}')
+            if version >= 5:
+                unitType = info[pos]
+                addressSize = info[pos + 1]
+                abbrevOffset = self._int(info, pos + 2, offsetSize)
+                pos += 2 + offsetSize
+                if unitType in [4, 5]:
+                    pos += 8
+                elif unitType in [2, 6]:
+                    pos += 8 + offsetSize
+            else:
+                abbrevOffset = self._int(info, pos, offsetSize)
+                addressSize = info[pos + offsetSize]
+                pos += offsetSize + 1
+            unit = {
+                'offset': offset, 'end': end, 'die': pos, 'version': version, 'offsetSize': offsetSize, 'addressSize': addressSize,
+                'abbrevOffset': abbrevOffset, 'language': 0, 'compDir': None, 'stmtList': None, 'base': 0, 'ranges': [],
+                'strOffsetsBase': 0, 'addrBase': 0,
+            }
+            self.units.append(unit)
+            self._readUnitEntry(unit)
+            offset = end
+        self.unitOffsets = [x['offset'] for x in self.units]
+
+    def _abbrevs(self, unit):
+        # Abbreviations are compiled per unit shape, attributes with a fixed
+        # size can be skipped without decoding them
+        key = (unit['abbrevOffset'], unit['addressSize'], unit['offsetSize'], unit['version'])
+        if key in self.abbrevTables:
+            return self.abbrevTables[key]
+        data = self._section('.debug_abbrev')
+        table = {}
+        pos = unit['abbrevOffset']
+        while True:
+            code, pos = _uleb128(data, pos)
+            if code == 0:
+                break
+            tag, pos = _uleb128(data, pos)
+            hasChildren = data[pos] != 0
+            pos += 1
+            specs = []
+            while True:
+                attribute, pos = _uleb128(data, pos)
+                form, pos = _uleb128(data, pos)
+                implicit = None
+                if form == self.DW_FORM_implicit_const:
+                    implicit, pos = _sleb128(data, pos)
+                if attribute == 0 and form == 0:
+                    break
+                specs.append((attribute, form, implicit))
+            plan = []
+            sibling = None
+            fixed = 0
+            for (attribute, form, implicit) in specs:
+                size = self._formSize(unit, form)
+                if attribute == self.DW_AT_sibling and sibling is None and all(x >= 0 for x in plan):
+                    sibling = (fixed, form)
+                if size is not None:
+                    fixed += size
+                    if len(plan) > 0 and plan[-1] >= 0:
+                        plan[-1] += size
+                    else:
+                        plan.append(size)
+                else:
+                    plan.append(-form)
+            if sibling is not None and (tag in self.scopeTags or not hasChildren):
+                sibling = None
+            table[code] = (tag, hasChildren, specs, plan, sibling)
+        self.abbrevTables[key] = table
+        return table
+
+    def _formSize(self, unit, form):
+        if form in [0x0b, 0x0c, 0x11, 0x25, 0x29]:
+            return 1
+        if form in [0x05, 0x12, 0x26, 0x2a]:
+            return 2
+        if form in [0x27, 0x2b]:
+            return 3
+        if form in [0x06, 0x13, 0x1c, 0x28, 0x2c]:
+            return 4
+        if form in [0x07, 0x14, 0x20, 0x24]:
+            return 8
+        if form == 0x1e:
+            return 16
+        if form in [0x0e, 0x17, 0x1f, 0x1d, 0x1f20, 0x1f21]:
+            return unit['offsetSize']
+        if form == 0x01:
+            return unit['addressSize']
+        if form == 0x10:
+            return unit['addressSize'] if unit['version'] <= 2 else unit['offsetSize']
+        if form in [0x19, 0x21]:
+            return 0
+        return None
+
+    def _skipForm(self, unit, form, pos):
+        data = self.info
+        if form in [0x0f, 0x0d, 0x15, 0x1a, 0x1b, 0x22, 0x23, 0x1f01, 0x1f02]:
+            while data[pos] & 0x80:
+                pos += 1
+            return pos + 1
+        if form == 0x08:
+            return data.index(b'\0', pos) + 1
+        if form in [0x09, 0x18]:
+            length, pos = _uleb128(data, pos)
+            return pos + length
+        if form == 0x0a:
+            return pos + 1 + data[pos]
+        if form == 0x03:
+            return pos + 2 + self._int(data, pos, 2)
+        if form == 0x04:
+            return pos + 4 + self._int(data, pos, 4)
+        if form == 0x16:
+            form, pos = _uleb128(data, pos)
+            size = self._formSize(unit, form)
+            return pos + size if size is not None else self._skipForm(unit, form, pos)
+        raise Exception(f'unsupported DWARF form 0x{form:x} in {self.elf.path}')
+
+    def _skipAttribute(self, unit, form, pos):
+        size = self._formSize(unit, form)
+        return pos + size if size is not None else self._skipForm(unit, form, pos)
+
+    def _readForm(self, unit, form, pos, implicit=None):
+        # Returns the decoded value, references are made absolute and
+        # unsupported values are None
+        data = self.info
+        if form == 0x16:
+            form, pos = _uleb128(data, pos)
+        size = self._formSize(unit, form)
+        if form in [0x11, 0x12, 0x13, 0x14]:
+            return unit['offset'] + self._int(data, pos, size), pos + size
+        if form == 0x15:
+            value, pos = _uleb128(data, pos)
+            return unit['offset'] + value, pos
+        if form == 0x08:
+            return self._string(data, pos)
+        if form in [0x0e, 0x1f]:
+            strings = self._section('.debug_str' if form == 0x0e else '.debug_line_str')
+            return self._string(strings, self._int(data, pos, size))[0], pos + size
+        if form in [0x1a, 0x25, 0x26, 0x27, 0x28]:
+            if form == 0x1a:
+                index, pos = _uleb128(data, pos)
+            else:
+                index = self._int(data, pos, size)
+                pos += size
+            offsets = self._section('.debug_str_offsets')
+            offset = self._int(offsets, unit['strOffsetsBase'] + index * unit['offsetSize'], unit['offsetSize'])
+            return self._string(self._section('.debug_str'), offset)[0], pos
+        if form in [0x1b, 0x29, 0x2a, 0x2b, 0x2c]:
+            if form == 0x1b:
+                index, pos = _uleb128(data, pos)
+            else:
+                index = self._int(data, pos, size)
+                pos += size
+            return self._int(self._section('.debug_addr'), unit['addrBase'] + index * unit['addressSize'], unit['addressSize']), pos
+        if form == 0x0d:
+            return _sleb128(data, pos)
+        if form in [0x0f, 0x22, 0x23]:
+            return _uleb128(data, pos)
+        if form == self.DW_FORM_implicit_const:
+            return implicit, pos
+        if form == 0x19:
+            return 1, pos
+        if size is not None:
+            if form in [0x1d, 0x1f20, 0x1f21]:
+                raise Exception(f'supplementary debug information is not supported in {self.elf.path}')
+            return self._int(data, pos, size), pos + size
+        return None, self._skipForm(unit, form, pos)
+
+    def _skipEntry(self, unit, plan, pos):
+        for step in plan:
+            if step >= 0:
+                pos += step
+            else:
+                pos = self._skipForm(unit, -step, pos)
+        return pos
+
+    def _rangeList(self, unit, ranges, offset, form=None):
+        if form == self.DW_FORM_rnglistx:
+            raise Exception(f'indexed range lists are not supported in {self.elf.path}')
+        addressSize = unit['addressSize']
+        base = unit['base']
+        if unit['version'] <= 4:
+            data = self._section('.debug_ranges')
+            maximum = (1 << (8 * addressSize)) - 1
+            pos = offset
+            while pos + 2 * addressSize <= len(data):
+                low = self._int(data, pos, addressSize)
+                high = self._int(data, pos + addressSize, addressSize)
+                pos += 2 * addressSize
+                if low == 0 and high == 0:
+                    break
+                if low == maximum and high != maximum:
+                    base = high
+                else:
+                    _arangeAdd(ranges, (base + low) & 0xffffffffffffffff, (base + high) & 0xffffffffffffffff)
+            return
+        data = self._section('.debug_rnglists')
+        pos = offset
+        while pos < len(data):
+            entry = data[pos]
+            pos += 1
+            if entry == 0:
+                return
+            elif entry == 5:
+                base = self._int(data, pos, addressSize)
+                pos += addressSize
+                continue
+            elif entry == 7:
+                low = self._int(data, pos, addressSize)
+                length, pos = _uleb128(data, pos + addressSize)
+                high = low + length
+            elif entry == 4:
+                low, pos = _uleb128(data, pos)
+                high, pos = _uleb128(data, pos)
+                low += base
+                high += base
+            elif entry == 6:
+                low = self._int(data, pos, addressSize)
+                high = self._int(data, pos + addressSize, addressSize)
+                pos += 2 * addressSize
+            else:
+                raise Exception(f'unsupported range list entry {entry} in {self.elf.path}')
+            _arangeAdd(ranges, low & 0xffffffffffffffff, high & 0xffffffffffffffff)
+
+    @property
+    def info(self):
+        return self._section('.debug_info')
+
+    def _readUnitEntry(self, unit):
+        abbrevs = self._abbrevs(unit)
+        code, pos = _uleb128(self.info, unit['die'])
+        if code == 0 or code not in abbrevs:
+            return
+        (tag, _, specs, _, _) = abbrevs[code]
+        # Bases are needed to decode indexed attributes of the unit entry itself
+        start = pos
+        for (attribute, form, implicit) in specs:
+            if attribute in [self.DW_AT_str_offsets_base, self.DW_AT_addr_base]:
+                value, pos = self._readForm(unit, form, pos, implicit)
+                unit['strOffsetsBase' if attribute == self.DW_AT_str_offsets_base else 'addrBase'] = value
+            else:
+                pos = self._skipAttribute(unit, form, pos)
+        pos = start
+        low = 0
+        high = 0
+        relative = False
+        for (attribute, form, implicit) in specs:
+            value, pos = self._readForm(unit, form, pos, implicit)
+            if attribute == self.DW_AT_stmt_list:
+                unit['stmtList'] = value
+            elif attribute == self.DW_AT_language:
+                unit['language'] = value
+            elif attribute == self.DW_AT_comp_dir and form in self.stringForms:
+                # Irix cc prefixes the compilation directory with the host name
+                separator = value.find(':')
+                if separator > 0 and value[separator - 1] == '.' and value[separator + 1:separator + 2] == '/':
+                    value = value[separator + 1:]
+                unit['compDir'] = value
+            elif attribute == self.DW_AT_low_pc and form in self.integerForms:
+                low = value
+                if tag == self.DW_TAG_compile_unit:
+                    unit['base'] = value
+            elif attribute == self.DW_AT_high_pc and form in self.integerForms:
+                high = value
+                relative = form != self.DW_FORM_addr
+            elif attribute == self.DW_AT_ranges and form in self.integerForms:
+                self._rangeList(unit, unit['ranges'], value, form)
+        if high != 0:
+            _arangeAdd(unit['ranges'], low, high + low if relative else high)
+
+    def _unitAt(self, offset):
+        return self.units[bisect.bisect_right(self.unitOffsets, offset) - 1]
+
+    def _abstractInstance(self, offset, depth=0):
+        # Name and linkage of the entry an abstract origin or specification refers to
+        if offset in self.abstractInstances:
+            return self.abstractInstances[offset]
+        if depth > 100:
+            raise Exception(f'DWARF abstract instances nested too deep in {self.elf.path}')
+        unit = self._unitAt(offset)
+        abbrevs = self._abbrevs(unit)
+        name = None
+        linkage = False
+        code, pos = _uleb128(self.info, offset)
+        if code != 0:
+            (_, _, specs, _, _) = abbrevs[code]
+            for (attribute, form, implicit) in specs:
+                if attribute == self.DW_AT_name:
+                    value, pos = self._readForm(unit, form, pos, implicit)
+                    if name is None and form in self.stringForms:
+                        name = value
+                        if unit['language'] in self.plainLanguages:
+                            linkage = True
+                elif attribute == self.DW_AT_specification:
+                    value, pos = self._readForm(unit, form, pos, implicit)
+                    if form in self.integerForms:
+                        (name, nestedLinkage) = self._abstractInstance(value, depth + 1)
+                        linkage = linkage or nestedLinkage
+                elif attribute in [self.DW_AT_linkage_name, self.DW_AT_MIPS_linkage_name]:
+                    value, pos = self._readForm(unit, form, pos, implicit)
+                    if form in self.stringForms:
+                        name = value
+                        linkage = True
+                else:
+                    pos = self._skipAttribute(unit, form, pos)
+        self.abstractInstances[offset] = (name, linkage)
+        return (name, linkage)
+
+    def _entryFormats(self, table, unit, data, pos, offsetSize):
+        count = data[pos]
+        pos += 1
+        formats = []
+        for _ in range(count):
+            contentType, pos = _uleb128(data, pos)
+            form, pos = _uleb128(data, pos)
+            formats.append((contentType, form))
+        count, pos = _uleb128(data, pos)
+        entries = []
+        lineUnit = dict(unit, offsetSize=offsetSize)
+        for _ in range(count):
+            entry = {'name': None, 'dir': 0}
+            for (contentType, form) in formats:
+                if form in [0x08, 0x0e, 0x1f]:
+                    if form == 0x08:
+                        value, pos = self._string(data, pos)
+                    else:
+                        strings = self._section('.debug_str' if form == 0x0e else '.debug_line_str')
+                        value = self._string(strings, self._int(data, pos, offsetSize))[0]
+                        pos += offsetSize
+                elif form in [0x0f]:
+                    value, pos = _uleb128(data, pos)
+                elif form in [0x0b, 0x05, 0x06, 0x07, 0x1e]:
+                    size = self._formSize(lineUnit, form)
+                    value = self._int(data, pos, size)
+                    pos += size
+                elif form == 0x09:
+                    length, pos = _uleb128(data, pos)
+                    value = None
+                    pos += length
+                else:
+                    raise Exception(f'unsupported line table form 0x{form:x} in {self.elf.path}')
+                if contentType == 1:
+                    entry['name'] = value
+                elif contentType == 2:
+                    entry['dir'] = value
+            entries.append(entry)
+        return entries, pos
+
+    def _fileName(self, table, index):
+        # Same path construction as binutils (concat_filename)
+        if index in table['names']:
+            return table['names'][index]
+        file = index
+        if not table['fileZero']:
+            file -= 1
+        if index == 0 and not table['fileZero'] or file >= len(table['files']) or table['files'][file]['name'] is None:
+            name = '<unknown>'
+        else:
+            name = table['files'][file]['name']
+            if not name.startswith('/'):
+                folder = table['files'][file]['dir']
+                if not table['fileZero']:
+                    folder -= 1
+                subFolder = table['dirs'][folder] if 0 <= folder < len(table['dirs']) else None
+                baseFolder = None
+                if subFolder is None or not subFolder.startswith('/'):
+                    baseFolder = table['compDir']
+                if baseFolder is None:
+                    baseFolder = subFolder
+                    subFolder = None
+                if baseFolder is not None:
+                    name = f'{baseFolder}/{subFolder}/{name}' if subFolder is not None else f'{baseFolder}/{name}'
+        table['names'][index] = name
+        return name
+
+    def lineTable(self, unit):
+        # Decodes the line program of a unit into sorted, non overlapping
+        # sequences flattened to arrays of row addresses, files and lines
+        key = unit['offset']
+        if key in self.lineTables:
+            return self.lineTables[key]
+        if unit['stmtList'] is None:
+            self.lineTables[key] = None
+            return None
+        data = self._section('.debug_line')
+        pos = unit['stmtList']
+        length = self._int(data, pos, 4)
+        pos += 4
+        offsetSize = 4
+        if length == 0xffffffff:
+            length = self._int(data, pos, 8)
+            pos += 8
+            offsetSize = 8
+        end = pos + length
+        version = self._int(data, pos, 2)
+        pos += 2
+        if version >= 5:
+            # Address and segment selector size, addresses are sized by their opcode length
+            pos += 2
+        headerLength = self._int(data, pos, offsetSize)
+        pos += offsetSize
+        program = pos + headerLength
+        minimumInstructionLength = data[pos]
+        pos += 1
+        if version >= 4:
+            pos += 1
+        pos += 1
+        lineBase = data[pos] - 256 if data[pos] >= 128 else data[pos]
+        lineRange = data[pos + 1]
+        opcodeBase = data[pos + 2]
+        opcodeLengths = [0] + list(data[pos + 3:pos + 2 + opcodeBase])
+        pos += 2 + opcodeBase
+        table = {'fileZero': version >= 5, 'compDir': unit['compDir'], 'dirs': [], 'files': [], 'names': {}}
+        if version >= 5:
+            dirs, pos = self._entryFormats(table, unit, data, pos, offsetSize)
+            table['dirs'] = [x['name'] for x in dirs]
+            table['files'], pos = self._entryFormats(table, unit, data, pos, offsetSize)
+        else:
+            while data[pos] != 0:
+                folder, pos = self._string(data, pos)
+                table['dirs'].append(folder)
+            pos += 1
+            while data[pos] != 0:
+                name, pos = self._string(data, pos)
+                folder, pos = _uleb128(data, pos)
+                _, pos = _uleb128(data, pos)
+                _, pos = _uleb128(data, pos)
+                table['files'].append({'name': name, 'dir': folder})
+            pos += 1
+
+        constAddPc = ((255 - opcodeBase) // lineRange) * minimumInstructionLength if lineRange > 0 else 0
+        sequences = []
+        rows = []
+        firstFile = 0 if version >= 5 else 1
+        address = 0
+        file = firstFile
+        line = 1
+        pos = program
+        while pos < end:
+            opcode = data[pos]
+            pos += 1
+            if opcode >= opcodeBase:
+                opcode -= opcodeBase
+                address += (opcode // lineRange) * minimumInstructionLength
+                line += lineBase + opcode % lineRange
+                row = (address, file, line & 0xffffffff, False)
+            elif opcode == 0:
+                length, pos = _uleb128(data, pos)
+                next = pos + length
+                if length == 0:
+                    continue
+                opcode = data[pos]
+                if opcode == 1:
+                    row = (address, file, line & 0xffffffff, True)
+                elif opcode == 2:
+                    address = self._int(data, pos + 1, length - 1)
+                    pos = next
+                    continue
+                elif opcode == 3:
+                    name, p = self._string(data, pos + 1)
+                    folder, p = _uleb128(data, p)
+                    table['files'].append({'name': name, 'dir': folder})
+                    pos = next
+                    continue
+                else:
+                    pos = next
+                    continue
+                pos = next
+            elif opcode == 1:
+                row = (address, file, line & 0xffffffff, False)
+            elif opcode == 2:
+                value, pos = _uleb128(data, pos)
+                address += value * minimumInstructionLength
+                continue
+            elif opcode == 3:
+                value, pos = _sleb128(data, pos)
+                line += value
+                continue
+            elif opcode == 4:
+                file, pos = _uleb128(data, pos)
+                continue
+            elif opcode == 8:
+                address += constAddPc
+                continue
+            elif opcode == 9:
+                address += self._int(data, pos, 2)
+                pos += 2
+                continue
+            else:
+                for _ in range(opcodeLengths[opcode] if opcode < len(opcodeLengths) else 0):
+                    _, pos = _uleb128(data, pos)
+                continue
+
+            # Rows of a sequence are kept sorted, the last row of an address wins
+            address &= 0xffffffffffffffff
+            row = (address, row[1], row[2], row[3])
+            if len(rows) > 0 and rows[-1][0] == address and rows[-1][3] == row[3]:
+                rows[-1] = row
+            elif len(rows) == 0 or row[3] or rows[-1][0] < address:
+                rows.append(row)
+            else:
+                rows.insert(bisect.bisect_left([x[0] for x in rows], address), row)
+            if row[3]:
+                sequences.append((rows[0][0], rows[-1][0], len(sequences), rows))
+                rows = []
+                address = 0
+                file = firstFile
+                line = 1
+
+        # Sort sequences by start, largest first, and drop nested or trim overlapping ones
+        sequences.sort(key=lambda x: (x[0], -x[1], x[2]))
+        addresses = []
+        files = []
+        lines = []
+        starts = []
+        ends = []
+        lastEnd = None
+        for (low, high, _, rows) in sequences:
+            if lastEnd is not None and low < lastEnd:
+                if high <= lastEnd:
+                    continue
+                low = lastEnd
+            lastEnd = high
+            first = 0
+            while first + 1 < len(rows) and rows[first + 1][0] <= low:
+                first += 1
+            starts.append(low)
+            ends.append(high)
+            for i in range(first, len(rows)):
+                addresses.append(low if i == first else rows[i][0])
+                files.append(rows[i][1])
+                lines.append(rows[i][2])
+        result = {
+            'table': table,
+            'starts': numpy.array(starts, dtype=numpy.uint64),
+            'ends': numpy.array(ends, dtype=numpy.uint64),
+            'addresses': numpy.array(addresses, dtype=numpy.uint64),
+            'files': files,
+            'lines': lines,
+        }
+        self.lineTables[key] = result
+        return result
+
+    def functions(self, unit):
+        # All functions, inlined subroutines and entry points of a unit in the
+        # order binutils reads them, callers are the closest enclosing function
+        info = self.info
+        abbrevs = self._abbrevs(unit)
+        functions = []
+        nested = [None]
+        depth = 0
+        pos = unit['die']
+        end = unit['end']
+        plainLanguage = unit['language'] in self.plainLanguages
+        while pos < end:
+            code = info[pos]
+            if code < 0x80:
+                pos += 1
+            else:
+                code, pos = _uleb128(info, pos)
+            if code == 0:
+                depth -= 1
+                continue
+            (tag, hasChildren, specs, plan, sibling) = abbrevs[code]
+            if tag in self.functionTags and depth > 0:
+                function = {'tag': tag, 'name': None, 'linkage': False, 'ranges': [], 'caller': None, 'callFile': None, 'callLine': 0}
+                if tag == self.DW_TAG_inlined_subroutine:
+                    for i in range(depth - 1, -1, -1):
+                        if nested[i] is not None:
+                            function['caller'] = nested[i]
+                            break
+                nested[depth] = len(functions)
+                low = 0
+                high = 0
+                relative = False
+                for (attribute, form, implicit) in specs:
+                    if attribute in [self.DW_AT_abstract_origin, self.DW_AT_specification]:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            (function['name'], linkage) = self._abstractInstance(value)
+                            function['linkage'] = function['linkage'] or linkage
+                    elif attribute == self.DW_AT_name:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if function['name'] is None and form in self.stringForms:
+                            function['name'] = value
+                            if plainLanguage:
+                                function['linkage'] = True
+                    elif attribute == self.DW_AT_linkage_name or attribute == self.DW_AT_MIPS_linkage_name:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.stringForms:
+                            function['name'] = value
+                            function['linkage'] = True
+                    elif attribute == self.DW_AT_low_pc:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            low = value
+                    elif attribute == self.DW_AT_high_pc:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            high = value
+                            relative = form != self.DW_FORM_addr
+                    elif attribute == self.DW_AT_ranges:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            self._rangeList(unit, function['ranges'], value, form)
+                    elif attribute == self.DW_AT_call_file:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            function['callFile'] = value
+                    elif attribute == self.DW_AT_call_line:
+                        value, pos = self._readForm(unit, form, pos, implicit)
+                        if form in self.integerForms:
+                            function['callLine'] = value
+                    else:
+                        pos = self._skipAttribute(unit, form, pos)
+                if high != 0:
+                    _arangeAdd(function['ranges'], low, (high + low) & 0xffffffffffffffff if relative else high)
+                functions.append(function)
+            else:
+                nested[depth] = None
+                if sibling is not None:
+                    # Subtrees without functions are skipped entirely
+                    (offset, form) = sibling
+                    target, _ = self._readForm(unit, form, pos + offset)
+                    if target > pos:
+                        pos = target
+                        continue
+                if len(plan) == 1 and plan[0] >= 0:
+                    pos += plan[0]
+                else:
+                    pos = self._skipEntry(unit, plan, pos)
+            if hasChildren:
+                depth += 1
+                if depth == len(nested):
+                    nested.append(None)
+                else:
+                    nested[depth] = None
+        return functions
+
+    def candidates(self, pcs):
+        # Units are tried in order, the ones without ranges for every address
+        primary = numpy.full(len(pcs), -1, dtype=numpy.int64)
+        extra = {}
+        unranged = []
+        for index, unit in enumerate(self.units):
+            if unit['stmtList'] is None:
+                continue
+            if len(unit['ranges']) == 0:
+                unranged.append(index)
+                continue
+            for (low, high) in unit['ranges']:
+                a = numpy.searchsorted(pcs, numpy.uint64(low), 'left')
+                b = numpy.searchsorted(pcs, numpy.uint64(high), 'left')
+                if a >= b:
+                    continue
+                window = primary[a:b]
+                for i in numpy.nonzero((window != -1) & (window != index))[0]:
+                    i = int(a + i)
+                    if index not in extra.setdefault(i, []):
+                        extra[i].append(index)
+                window[window == -1] = index
+        return primary, extra, unranged
+
+    def lookup(self, index, pcs, unwindInline, symbols):
+        # Resolves sorted addresses inside one unit, addresses the unit has
+        # neither lines nor functions for are returned as unresolved
+        unit = self.units[index]
+        lines = self.lineTable(unit)
+        if lines is None:
+            return [], pcs
+        found = numpy.zeros(len(pcs), dtype=bool)
+        rows = numpy.full(len(pcs), -1, dtype=numpy.int64)
+        if len(lines['starts']) > 0:
+            sequence = numpy.searchsorted(lines['starts'], pcs, 'right') - 1
+            valid = (sequence >= 0) & (pcs < lines['ends'][numpy.maximum(sequence, 0)])
+            rows[valid] = numpy.searchsorted(lines['addresses'], pcs[valid], 'right') - 1
+            found |= valid
+
+        functions = self.functions(unit)
+        innermost = numpy.full(len(pcs), -1, dtype=numpy.int64)
+        ranges = [(high - low, i, low, high) for i, function in enumerate(functions) for (low, high) in function['ranges'] if low < high]
+        if len(ranges) > 0:
+            # Paint ranges from the largest to the smallest, on equal size the
+            # later function wins like in binutils
+            bounds = numpy.unique(numpy.array([x[2] for x in ranges] + [x[3] for x in ranges], dtype=numpy.uint64))
+            best = numpy.full(len(bounds), -1, dtype=numpy.int64)
+            ranges.sort(key=lambda x: (-x[0], x[1]))
+            for (_, i, low, high) in ranges:
+                best[numpy.searchsorted(bounds, numpy.uint64(low)):numpy.searchsorted(bounds, numpy.uint64(high))] = i
+            segment = numpy.searchsorted(bounds, pcs, 'right') - 1
+            inside = segment >= 0
+            innermost[inside] = best[segment[inside]]
+            found |= innermost != -1
+
+        table = lines['table']
+        result = []
+        for (pc, row, f) in zip(pcs[found].tolist(), rows[found].tolist(), innermost[found].tolist()):
+            file = self._fileName(table, lines['files'][row]) if row >= 0 else None
+            line = lines['lines'][row] if row >= 0 else 0
+            function = functions[f] if f >= 0 else None
+            if function is not None and function['linkage']:
+                name = function['name']
+            else:
+                symbol = symbols.find(pc)
+                name = None
+                if symbol is not None:
+                    name = symbol[0]
+                    if row < 0:
+                        file = symbol[1]
+                if function is not None:
+                    if symbol is None:
+                        name = function['name']
+                    elif len(function['ranges']) > 0 and symbol[2] == function['ranges'][0][0]:
+                        function['name'] = symbol[0]
+                    function['linkage'] = True
+            if not unwindInline and function is not None and function['tag'] == self.DW_TAG_inlined_subroutine:
+                while function['caller'] is not None:
+                    file = self._fileName(table, function['callFile']) if function['callFile'] is not None else None
+                    line = function['callLine']
+                    function = functions[function['caller']]
+                    name = function['name']
+            result.append((pc, file, name, line))
+        return result, pcs[~found]
+
+
+_dwarfInfos = {}
+
+
+def _elfLineShard(elf: str, tasks: list, unwindInline: bool):
+    # Every task is a unit with the sorted addresses to look up in it, the
+    # addresses of the task without unit only use the symbol table
+    fingerprint = _fileFingerprint(elf)
+    if fingerprint not in _dwarfInfos:
+        _dwarfInfos.clear()
+        dwarf = dwarfInfo(elfFile(elf))
+        _dwarfInfos[fingerprint] = (dwarf, elfSymbolFinder(dwarf.elf))
+    (dwarf, symbols) = _dwarfInfos[fingerprint]
+    result = []
+    unresolved = []
+    for (index, pcs) in tasks:
+        if index is None:
+            for pc in pcs.tolist():
+                symbol = symbols.find(pc)
+                result.append((pc, symbol[1], symbol[0], 0) if symbol is not None else (pc, None, None, 0))
+        else:
+            found, missing = dwarf.lookup(index, pcs, unwindInline, symbols)
+            result.extend(found)
+            unresolved.append(missing)
+    return result, numpy.concatenate(unresolved) if len(unresolved) > 0 else numpy.array([], dtype=numpy.uint64)
+
+
+def _demangle(names: set):
+    # Names are demangled like addr2line does, a leading dot and a version
+    # suffix are not part of the mangled name
+    global crossCompile
+    parts = {}
+    for name in names:
+        core = name.lstrip('.$')
+        prefix = name[:len(name) - len(core)]
+        suffix = ''
+        if '@' in core:
+            suffix = core[core.index('@'):]
+            core = core[:core.index('@')]
+        if re.match(r'^_[A-Za-z0-9_$.]+$', core):
+            parts[name] = (prefix, core, suffix)
+    if len(parts) == 0:
+        return {}
+    cores = sorted({x[1] for x in parts.values()})
+    pDemangle = subprocess.run(f'{crossCompile}c++filt -i -r', shell=True, input='\n'.join(cores) + '\n', stdout=subprocess.PIPE, universal_newlines=True)
+    pDemangle.check_returncode()
+    demangled = dict(zip(cores, pDemangle.stdout.split('\n')))
+    return {name: prefix + demangled[core] + suffix for name, (prefix, core, suffix) in parts.items() if demangled[core] != core}
+
+
+def _elfLines(elf: str, pcs: list, unwindInline: bool, pool, jobs: int):
+    # In process replacement for the addr2line stage, returns the same
+    # (pc, file, function, line) tuples as _addr2lineShard
+    dwarf = dwarfInfo(elfFile(elf))
+    if not dwarf.supported:
+        return None
+    pending = numpy.array(sorted(pcs), dtype=numpy.uint64)
+    primary, extra, unranged = dwarf.candidates(pending)
+    position = numpy.zeros(len(pending), dtype=numpy.int64)
+    results = []
+    while len(pending) > 0:
+        # Addresses that are not resolved by a unit move on to their next candidate
+        units = numpy.full(len(pending), -1, dtype=numpy.int64)
+        direct = (position == 0) & (primary != -1)
+        units[direct] = primary[direct]
+        if len(extra) > 0 or len(unranged) > 0:
+            for i in numpy.nonzero(~direct)[0].tolist():
+                options = ([int(primary[i])] if primary[i] != -1 else []) + extra.get(i, []) + unranged
+                if position[i] < len(options):
+                    units[i] = options[position[i]]
+        tasks = [(None, pending[units == -1])] if (units == -1).any() else []
+        for index in numpy.unique(units[units != -1]):
+            tasks.append((int(index), pending[units == index]))
+        # Tasks are grouped into balanced shards by their address count
+        shardCount = max(1, min(len(tasks), jobs * 4))
+        shards = [[] for _ in range(shardCount)]
+        sizes = [0] * shardCount
+        for task in sorted(tasks, key=lambda x: -len(x[1])):
+            smallest = sizes.index(min(sizes))
+            shards[smallest].append(task)
+            sizes[smallest] += len(task[1])
+        shards = [x for x in shards if len(x) > 0]
+        unresolved = []
+        for (found, missing) in pool.map(_elfLineShard, [elf] * len(shards), shards, [unwindInline] * len(shards)):
+            results.extend(found)
+            unresolved.append(missing)
+        unresolved = numpy.sort(numpy.concatenate(unresolved))
+        index = numpy.searchsorted(pending, unresolved)
+        pending = unresolved
+        primary = primary[index]
+        position = position[index] + 1
+        extra = {int(j): extra[int(i)] for j, i in enumerate(index) if int(i) in extra}
+
+    names = _demangle({x[2] for x in results if x[2] is not None})
+    decoded = []
+    for (pc, file, function, line) in results:
+        if function is not None:
+            function = names.get(function, function)
+        decoded.append((pc,
+                        file if file is not None and len(file.strip('?')) != 0 else None,
+                        function if function is not None and len(function.strip('?')) != 0 else None,
+                        line if line != 0 else None))
+    return decoded
+
+
+def _sharedCachePrefix(folder: str):
+    # Segments of one cache folder share a prefix so that the cacheManager can
+    # find them, names stay short enough for the limits of every platform
+    return 'pperf_' + hashlib.md5(os.path.abspath(folder).encode('utf-8')).hexdigest()[:12] + '_'
+
+
+def _sharedCacheName(cacheFile: str):
+    cacheFile = os.path.abspath(cacheFile)
+    return _sharedCachePrefix(os.path.dirname(cacheFile)) + hashlib.md5(cacheFile.encode('utf-8')).hexdigest()[:16]
+
+
+def _sharedCachePath(cacheFile: str):
+    global sharedMemoryFolder
+    return f'{sharedMemoryFolder}/{_sharedCacheName(cacheFile)}'
+
+
+def _unlinkSharedCache(cacheFile: str):
+    # Segments outlive the publishing process, they are released when the cache
+    # is rebuilt or evicted. Existing mappings stay valid after the unlink
+    try:
+        os.remove(_sharedCachePath(cacheFile))
+    except FileNotFoundError:
+        pass
+
+
+class cacheManager:
+    # Keeps the cache folder below a size limit by evicting the least recently
+    # used elf caches and build stages. The last access of a file is its
+    # modification time, which is refreshed on every hit. Tables in the content
+    # store are removed once no cache or stage references them anymore.
+    #
+    # Statistics are accumulated over all processes in the json file 'stats',
+    # counters are buffered per process and written once when it exits.
+    #
+    # Caches published into shared memory are counted with their cache file and
+    # evicted together with it, segments without a cache file are garbage.
+    #
+    # Lock files are never removed, a process waiting on a removed lock file
+    # would hold a lock nobody else sees
+    storeGracePeriod = 3600
+    ignored = ['digests', 'stats']
+    pendingStats = {}
+    pendingLock = threading.Lock()
+
+    def __init__(self, folder=None, limit=None):
+        global cacheFolder
+        global cacheSize
+        self.folder = os.path.abspath(cacheFolder if folder is None else folder)
+        self.limit = parseSize(cacheSize if limit is None else limit)
+        self.statsFile = f'{self.folder}/stats'
+
+    @staticmethod
+    def touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _readStatistics(self):
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'evictedBytes': 0}
+        if os.path.isfile(self.statsFile):
+            try:
+                stats.update(json.load(open(self.statsFile, 'r')))
+            except Exception:
+                pass
+        return stats
+
+    def statistics(self):
+        self.flush()
+        return self._readStatistics()
+
+    def record(self, **counters):
+        with self.pendingLock:
+            pending = self.pendingStats.setdefault(self.folder, {})
+            for key, value in counters.items():
+                pending[key] = pending.get(key, 0) + value
+
+    @classmethod
+    def flush(cls):
+        # Writes the counters buffered by this process into the stats files
+        with cls.pendingLock:
+            pending = dict(cls.pendingStats)
+            cls.pendingStats.clear()
+        for folder, counters in pending.items():
+            manager = cls(folder)
+            if not os.path.isdir(manager.folder):
+                continue
+            with FileLock(manager.statsFile + '.lock'):
+                stats = manager._readStatistics()
+                for key, value in counters.items():
+                    stats[key] = stats.get(key, 0) + value
+                tmpStatsFile = f'{manager.statsFile}.{os.getpid()}.tmp'
+                json.dump(stats, open(tmpStatsFile, 'w'))
+                os.replace(tmpStatsFile, manager.statsFile)
+
+    @classmethod
+    def _afterFork(cls):
+        # Counters of the parent are written by the parent
+        cls.pendingStats = {}
+        cls.pendingLock = threading.Lock()
+
+    def size(self):
+        total = sum(x[1] for x in self._sharedSegments().values())
+        for folder in [self.folder, f'{self.folder}/store']:
+            if os.path.isdir(folder):
+                total += sum(x.stat().st_size for x in os.scandir(folder) if x.is_file())
+        return total
+
+    def _sharedSegments(self):
+        # Published segments of this cache folder by name, segments that are
+        # still written are skipped
+        global sharedMemoryFolder
+        segments = {}
+        prefix = _sharedCachePrefix(self.folder)
+        if not os.path.isdir(sharedMemoryFolder):
+            return segments
+        for entry in os.scandir(sharedMemoryFolder):
+            if entry.name.startswith(prefix) and not entry.name.endswith('.tmp') and entry.is_file():
+                try:
+                    segments[entry.name] = [entry.path, entry.stat().st_size]
+                except OSError:
+                    pass
+        return segments
+
+    def _references(self, path):
+        # Store tables referenced by a cache or a source stage
+        try:
+            columnar = columnarFile(path)
+        except Exception:
+            return []
+        references = [columnar.meta['asm']] if 'asm' in columnar.meta else []
+        if 'source.digest' in columnar.columns:
+            strings = columnar.strings('strings')
+            references.extend(strings[x] for x in columnar.column('source.digest').tolist() if x >= 0)
+        columnar.close()
+        return references
+
+    def _remove(self, path):
+        # Caches are only removed under their lock, busy caches are skipped
+        lock = FileLock(path + '.lock', timeout=0) if os.path.isfile(path + '.lock') else None
+        try:
+            if lock is not None:
+                lock.acquire()
+        except Timeout:
+            return False
+        try:
+            os.remove(path)
+            _unlinkSharedCache(path)
+        except OSError:
+            return False
+        finally:
+            if lock is not None:
+                lock.release()
+        return True
+
+    def collect(self, limit=None):
+        limit = self.limit if limit is None else parseSize(limit)
+        if not os.path.isdir(self.folder):
+            return []
+        entries = []
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name in self.ignored or entry.name.endswith('.tmp') or entry.name.endswith('.lock'):
+                continue
+            stat = entry.stat()
+            entries.append([stat.st_mtime, stat.st_size, entry.path])
+
+        # Segments are accounted to their cache file, the rest is dropped
+        evicted = {}
+        segments = self._sharedSegments()
+        for entry in entries:
+            segment = segments.pop(_sharedCacheName(entry[2]), None)
+            if segment is not None:
+                entry[1] += segment[1]
+        for path, size in segments.values():
+            try:
+                os.remove(path)
+                evicted[path] = size
+            except OSError:
+                pass
+
+        storeFolder = f'{self.folder}/store'
+        tables = {}
+        if os.path.isdir(storeFolder):
+            for entry in os.scandir(storeFolder):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    tables[entry.name] = [stat.st_mtime, stat.st_size, entry.path]
+        references = {}
+        for entry in entries:
+            entry.append(self._references(entry[2]))
+            for digest in entry[3]:
+                references[digest] = references.get(digest, 0) + 1
+
+        total = sum(x[1] for x in entries) + sum(x[1] for x in tables.values()) + sum(evicted.values())
+        now = datetime.now().timestamp()
+
+        def release(digests):
+            # Tables written very recently might belong to a cache that is still created
+            for digest in digests:
+                references[digest] = references.get(digest, 0) - 1
+                if references[digest] <= 0 and digest in tables and now - tables[digest][0] > self.storeGracePeriod:
+                    try:
+                        os.remove(tables[digest][2])
+                        evicted[tables[digest][2]] = tables[digest][1]
+                    except OSError:
+                        pass
+                    del tables[digest]
+
+        # Tables that are not referenced at all are garbage regardless of the limit
+        release([x for x in tables if x not in references])
+
+        if limit > 0 and total - sum(evicted.values()) > limit:
+            for (mtime, size, path, digests) in sorted(entries, key=lambda x: x[0]):
+                if total - sum(evicted.values()) <= limit:
+                    break
+                if self._remove(path):
+                    evicted[path] = size
+                    release(digests)
+
+        if len(evicted) > 0:
+            self.record(evictions=len(evicted), evictedBytes=sum(evicted.values()))
+        return list(evicted)
+
+
+# Pool workers exit through the finalizers of multiprocessing instead of atexit
+os.register_at_fork(after_in_child=cacheManager._afterFork)
+atexit.register(cacheManager.flush)
+multiprocessing.util.Finalize(None, cacheManager.flush, exitpriority=0)
+
+
 class elfCache:
     # Basic Block Reconstruction:
     # currently requires support through dynamic branch analysis which
@@ -119,15 +2579,25 @@ class elfCache:
         }
     }
 
-    caches = {}
-    cacheFiles = {}
+    # Loaded cache files are read only and shared by all elfCache sessions of
+    # a process, keyed by the path, inode and size of the cache file
+    loadedCaches = {}
+    loadedLock = threading.Lock()
+
+    # Header of a shared cache segment, the cache file follows at offset 64
+    # [ 8 bytes ] magic
+    # [ 8 bytes ] inode of the published cache file, rebuilt caches replace the file
+    # [ 8 bytes ] size of the published cache file
+    # Segments are written to a temporary file and renamed once complete
+    sharedHeader = struct.Struct('<8sQQ')
+    sharedMagic = b'PPERFSHM'
 
     def __init__(self):
         global cacheFolder
         if not os.path.isdir(cacheFolder):
-            os.makedirs(cacheFolder)
-    
-
+            os.makedirs(cacheFolder, exist_ok=True)
+        self.caches = {}
+        self.cacheFiles = {}
 
     def getRawCache(self, name):
         global cacheFolder
@@ -137,7 +2607,7 @@ class elfCache:
         lock.acquire()
         lock.release()
         if os.path.isfile(name):
-            return pickle.load(open(name, mode="rb"))
+            return elfCacheFile(name)
         else:
             raise Exception(f'could not find requested elf cache {name}')
 
@@ -146,10 +2616,7 @@ class elfCache:
             return self.cacheFiles[elf]
         global cacheFolder
         global unwindInline
-        hasher = hashlib.md5()
-        with open(elf, 'rb') as afile:
-            hasher.update(afile.read())
-        return os.path.abspath(f"{cacheFolder}/{os.path.basename(elf)}_{'i' if unwindInline else ''}{hasher.hexdigest()}")
+        return os.path.abspath(f"{cacheFolder}/{os.path.basename(elf)}_{'i' if unwindInline else ''}{getElfDigest(elf)}")
 
     def getCache(self, elf):
         self.openOrCreateCache(elf)
@@ -175,6 +2642,49 @@ class elfCache:
         else:
             return self.caches[elf]['cache'][pc]
 
+    def openSharedCache(self, elf: str, cacheFile: str):
+        # Must be called while holding the lock of the cache file
+        stat = os.stat(cacheFile)
+        path = _sharedCachePath(cacheFile)
+        mapping = self._mapSharedCache(path, stat)
+        if mapping is None:
+            tmpPath = f'{path}.{os.getpid()}.tmp'
+            try:
+                _unlinkSharedCache(cacheFile)
+                with open(tmpPath, 'wb') as segment, open(cacheFile, 'rb') as fp:
+                    segment.write(self.sharedHeader.pack(self.sharedMagic, stat.st_ino, stat.st_size).ljust(64, b'\0'))
+                    shutil.copyfileobj(fp, segment, 1 << 24)
+                os.replace(tmpPath, path)
+                mapping = self._mapSharedCache(path, stat)
+            except OSError as e:
+                print(f"WARNING: could not publish cache of {elf} into shared memory, {e}", file=sys.stderr)
+                try:
+                    os.remove(tmpPath)
+                except OSError:
+                    pass
+            if mapping is None:
+                return elfCacheFile(cacheFile)
+        # The segment is attached through a read only mapping that lives as long as the cache
+        return elfCacheFile(buffer=memoryview(mapping)[64:])
+
+    def _mapSharedCache(self, path: str, stat):
+        # Segments published from an older cache file are not used
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.fstat(fd).st_size != 64 + stat.st_size:
+                return None
+            mapping = mmap.mmap(fd, 64 + stat.st_size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, inode, size = self.sharedHeader.unpack_from(mapping)
+        if magic != self.sharedMagic or inode != stat.st_ino or size != stat.st_size:
+            mapping.close()
+            return None
+        return mapping
+
     def cacheAvailable(self, elf: str, load=True):
         if elf in self.caches:
             return True
@@ -188,23 +2698,94 @@ class elfCache:
         lock.acquire()
         lock.release()
         if os.path.isfile(cacheFile):
-            cache = pickle.load(open(cacheFile, mode="rb"))
-            if 'version' not in cache or cache['version'] != cacheVersion:
+            # Only the header is read here, the cache data is mapped on access.
+            # Files that are not columnar were written by older versions
+            try:
+                version = columnarFile.readMeta(cacheFile).get('version')
+            except OSError:
+                raise
+            except Exception:
+                version = None
+            if version != cacheVersion:
                 raise Exception(f"wrong version of cache for {elf} located at {cacheFile}!")
+            stat = os.stat(cacheFile)
+            key = (cacheFile, stat.st_ino, stat.st_size)
+            with self.loadedLock:
+                cache = self.loadedCaches.get(key) if load else None
+                if cache is None and load:
+                    if sharedCache:
+                        with lock:
+                            cache = self.openSharedCache(elf, cacheFile)
+                    else:
+                        cache = elfCacheFile(cacheFile)
+                    for stale in [x for x in self.loadedCaches if x[0] == cacheFile]:
+                        del self.loadedCaches[stale]
+                    self.loadedCaches[key] = cache
+                    # The last access is refreshed once per process that maps the cache
+                    cacheManager.touch(cacheFile)
+            # Probes without loading are neither hits nor misses
             if load:
                 self.cacheFiles[elf] = cacheFile
                 self.caches[elf] = cache
+                cacheManager().record(hits=1)
             return True
         else:
+            if load:
+                cacheManager().record(misses=1)
             return False
 
     def closeCache(self, elf):
         if elf in self.cacheFiles:
             del self.cacheFiles[elf]
         if elf in self.caches:
+            # Cache files might still be used by other sessions, their mappings are released with the last reference
+            cache = self.caches[elf]
             del self.caches[elf]
+            with self.loadedLock:
+                for loaded in [k for k, v in self.loadedCaches.items() if v is cache]:
+                    del self.loadedCaches[loaded]
+
+
+    def getStageFile(self, elf: str, stage: str, key: dict):
+        global cacheFolder
+        keyDigest = hashlib.md5(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.abspath(f"{cacheFolder}/{os.path.basename(elf)}_{getElfDigest(elf)}.{stage}_{keyDigest}")
 
-    def createCache(self, elf: str, name=None, sourceSearchPaths=[], dynmapfile=None, includeSource=True, basicblockReconstruction=True, verbose=True):
+    def loadStage(self, elf: str, stage: str, key: dict):
+        global disableCache
+        if disableCache:
+            return None
+        stageFile = self.getStageFile(elf, stage, key)
+        if not os.path.isfile(stageFile):
+            return None
+        try:
+            columnar = columnarFile(stageFile)
+        except Exception:
+            return None
+        if columnar.meta.get('version') != cacheVersion or columnar.meta.get('stage') != stage or columnar.meta.get('key') != key:
+            columnar.close()
+            return None
+        cacheManager.touch(stageFile)
+        return columnar
+
+    def storeStage(self, elf: str, stage: str, key: dict, columns: dict):
+        global disableCache
+        if disableCache:
+            return
+        # Columns passed as lists are interned into the string table of the stage
+        strings = {None: -1}
+        for column, values in columns.items():
+            if isinstance(values, list):
+                columns[column] = numpy.array([strings.setdefault(x, len(strings) - 1) for x in values], dtype=numpy.int32)
+        columns['strings.offsets'], columns['strings.data'] = columnarFile.encodeStrings(list(strings)[1:])
+        columnarFile.write(self.getStageFile(elf, stage, key), {'version': cacheVersion, 'stage': stage, 'key': key}, columns)
+
+    @staticmethod
+    def _stageStrings(stage: columnarFile, column: str):
+        strings = stage.strings('strings')
+        return [strings[x] for x in stage.column(column).tolist()]
+
+    def createCache(self, elf: str, name=None, sourceSearchPaths=[], dynmapfile=None, includeSource=True, basicblockReconstruction=True, verbose=True, jobs=None, backend=None, incremental=True):
         global cacheVersion
         global crossCompile
         global unwindInline
@@ -212,6 +2793,12 @@ class elfCache:
 
         if name is None:
             name = os.path.basename(elf)
+        if jobs is None:
+            jobs = cacheJobs
+        if backend is None:
+            backend = cacheBackend
+        if backend not in ['binutils', 'elf']:
+            raise Exception(f'unknown cache backend {backend}')
 
         if not disableCache:
             cacheFile = self.getCacheFile(elf)
@@ -244,254 +2831,312 @@ class elfCache:
                 if verbose:
                     print(f"WARNING: disabling basic block reconstruction due to unknown architecture {cache['arch']}")
 
-            sPreObjdump = f"{crossCompile}objdump -wh {elf}"
-            pPreObjdump = subprocess.Popen(sPreObjdump, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-            for sectionLine in pPreObjdump.stdout:
-                sectionLine = re.sub(r', ', ',', sectionLine)
-                sectionList = re.sub(r'[\t ]+', ' ', sectionLine).strip().split(' ')
-                # Check whether we write, allocate or execute a section
-                if len(sectionList) < 7 or 'CODE' not in sectionList[7]:
-                    continue
-                section = sectionList[1]
-
-                # First step is creating an object dump of the elf file
-                # We disassemble much more than needed however its necesarry for some profilers
-                sObjdump = f"{crossCompile}objdump -Dwz --prefix-addresses --show-raw-insn -j {section} {elf}"
-                # sObjdump = f"{crossCompile}objdump -Dz --prefix-addresses -j {section} {elf}"
-                pObjdump = subprocess.Popen(sObjdump, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-                # Remove trailing additional data that begins with '//'
-                # sObjdump = re.sub('[ \t]+(// ).+\n','\n', sObjdump)
-                # Remove trailing additional data that begins with '#'
-                # sObjdump = re.sub('[ \t]+(# ).+\n','\n', sObjdump)
-
-                for line in pObjdump.stdout:
-                    objdumpLine = re.compile(r'([0-9a-fA-F]+) <([^+]+)?\+?(0x[0-9a-f-A-F]+)?> ([0-9a-fA-F ]+)[\t]+([^<\t ]+)?(.+)?')
-                    match0 = objdumpLine.match(line)
-                    if match0:
-                        meta = META.normalInstruction
-                        if match0.group(3) is None:
-                            meta |= META.functionHead | META.basicblockHead
-                            functionCounter += 1
-
-                        pc = int(match0.group(1), 16)
-                        instr = match0.group(5).rstrip('\n').strip()
-                        opcode = match0.group(4).replace(' ', '').strip()
-                        func = match0.group(1).strip()
-
-                        sample = [pc, name, None, func, f'f{functionCounter}', None, instr, opcode, meta]
-                        asm = instr
-                        if match0.group(6) is not None:
-                            asm += match0.group(6).rstrip('\n').rstrip()
-                        cache['asm'][pc] = asm
-                        cache['cache'][pc] = sample
-                pObjdump.stdout.close()
-                returnCode = pObjdump.wait()
-                if returnCode:
-                    raise subprocess.CalledProcessError(returnCode, sObjdump)
-
-            pPreObjdump.stdout.close()
-            returnCode = pPreObjdump.wait()
-            if returnCode:
-                raise subprocess.CalledProcessError(returnCode, sPreObjdump)
-
-            if (len(cache['cache']) == 0):
-                raise Exception(f'Could not parse any instructions from {elf}')
-
-            # Second Step, correlate addresses to function/files
-            tmpfile, tmpfilename = tempfile.mkstemp()
-            try:
-                addr2lineDecode = re.compile('^(0x[0-9a-fA-F]+)\n(.+?)\n(.+)?:(([0-9]+)|(\?)).*$')
-                with os.fdopen(tmpfile, 'w') as tmp:
-                    tmp.write('\n'.join(map(lambda x: f'0x{x:x}', cache['cache'].keys())) + '\n')
-                    tmp.close()
-                    # addr2line by default outputs the file/line where the instruction originates from
-                    # the -i option lets it print the chain of inlining which might be multiple files/lines
-                    # We are only intersted in one result per address. We want either the function the
-                    # address ends up in or the function it came from (when inlined). It will return the origin
-                    # without -i and when -i is passed, the last result will be always the function this
-                    # address was inlined to. That means this option is logically inverted for this script
-                    # as we only take the last result per address.
-                    pAddr2line = subprocess.run(f"{crossCompile}addr2line -Cafr{'i' if not unwindInline else ''} -e {elf} @{tmpfilename}", shell=True, stdout=subprocess.PIPE)
-                    pAddr2line.check_returncode()
-                    sAddr2line = pAddr2line.stdout.decode('utf-8').split("\n0x")
-                    for entry in sAddr2line:
-                        matchEntry = (entry if entry.startswith('0x') else '0x' + entry).split('\n')
-                        while len(matchEntry) > 3 and len(matchEntry[-1]) == 0:
-                            matchEntry.pop()
-                        matchEntry = '\n'.join([matchEntry[0], matchEntry[-2], matchEntry[-1]])
-
-                        match = addr2lineDecode.match(matchEntry)
-                        if match:
-                            iAddr = int(match.group(1), 16)
-                            if iAddr not in cache['cache']:
-                                raise Exception(f'Got an unknown address from addr2line: {match.group(1)}')
-                            if match.group(3) is not None and len(match.group(3).strip('?')) != 0:
-                                cache['cache'][iAddr][SAMPLE.file] = match.group(3)
-                            if match.group(2) is not None and len(match.group(2).strip('?')) != 0:
-                                # If we do source correlation save the absolute path for the moment
-                                cache['cache'][iAddr][SAMPLE.function] = match.group(2)
-                            if match.group(4) is not None and len(match.group(4).strip('?')) != 0 and int(match.group(4)) != 0:
-                                cache['cache'][iAddr][SAMPLE.line] = int(match.group(4))
-                        else:
-                            raise Exception(f'Could not decode the following addr2line entry\n{entry}')
-            finally:
-                os.remove(tmpfilename)
+            # Every stage is persisted in the cache folder and keyed by its own
+            # inputs, a rebuild only reruns the stages whose inputs changed
+            objdumpKey = {'digest': getElfDigest(elf), 'toolchain': cache['toolchain']}
+            linesKey = dict(objdumpKey, unwindInline=unwindInline)
+
+            with _workerPool(jobs) as pool:
+                # First step is creating an object dump of the elf file, sections are split
+                # into shards at function boundaries which are disassembled in parallel
+                stage = self.loadStage(elf, 'objdump', objdumpKey) if incremental else None
+                if stage is not None:
+                    instructions = list(zip(stage.column('pc').tolist(), stage.column('head').tolist(), *[self._stageStrings(stage, x) for x in ['instruction', 'opcode', 'function', 'asm']]))
+                    stage.close()
+                else:
+                    shards = []
+                    sPreObjdump = f"{crossCompile}objdump -wh {elf}"
+                    pPreObjdump = subprocess.Popen(sPreObjdump, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+                    for sectionLine in pPreObjdump.stdout:
+                        sectionLine = re.sub(r', ', ',', sectionLine)
+                        sectionList = re.sub(r'[\t ]+', ' ', sectionLine).strip().split(' ')
+                        # Check whether we write, allocate or execute a section
+                        if len(sectionList) < 7 or 'CODE' not in sectionList[7]:
+                            continue
+                        shards.extend(_shardSection(elf, sectionList[1], int(sectionList[3], 16), int(sectionList[2], 16), jobs))
+
+                    pPreObjdump.stdout.close()
+                    returnCode = pPreObjdump.wait()
+                    if returnCode:
+                        raise subprocess.CalledProcessError(returnCode, sPreObjdump)
+
+                    # Shards are merged in submission order which is the order of a single objdump run
+                    instructions = [x for shard in (pool.map(_objdumpShard, *zip(*shards)) if len(shards) > 0 else []) for x in shard]
+                    if len(instructions) > 0:
+                        self.storeStage(elf, 'objdump', objdumpKey, {
+                            'pc': numpy.array([x[0] for x in instructions], dtype=numpy.uint64),
+                            'head': numpy.array([x[1] for x in instructions], dtype=numpy.uint8),
+                            'instruction': [x[2] for x in instructions],
+                            'opcode': [x[3] for x in instructions],
+                            'function': [x[4] for x in instructions],
+                            'asm': [x[5] for x in instructions],
+                        })
+
+                for (pc, functionHead, instr, opcode, func, asm) in instructions:
+                    meta = META.normalInstruction
+                    if functionHead:
+                        meta |= META.functionHead | META.basicblockHead
+                        functionCounter += 1
+                    cache['asm'][pc] = asm
+                    cache['cache'][pc] = [pc, name, None, func, f'f{functionCounter}', None, instr, opcode, meta]
+                del instructions
+
+                if (len(cache['cache']) == 0):
+                    raise Exception(f'Could not parse any instructions from {elf}')
+
+                # Second Step, correlate addresses to function/files
+                stage = self.loadStage(elf, 'lines', linesKey) if incremental else None
+                if stage is not None:
+                    lines = list(zip(stage.column('pc').tolist(), self._stageStrings(stage, 'file'), self._stageStrings(stage, 'function'), [x if x != 0 else None for x in stage.column('line').tolist()]))
+                    stage.close()
+                else:
+                    pcs = list(cache['cache'].keys())
+                    lines = None
+                    if backend == 'elf':
+                        try:
+                            lines = _elfLines(elf, pcs, unwindInline, pool, jobs)
+                        except Exception as e:
+                            if verbose:
+                                print(f"WARNING: falling back to addr2line for {elf}, {e}", file=sys.stderr)
+                    if lines is None:
+                        chunkSize = max(-(-len(pcs) // (jobs * 4)), 4096)
+                        chunks = [pcs[i:i + chunkSize] for i in range(0, len(pcs), chunkSize)]
+                        lines = [x for chunk in pool.map(_addr2lineShard, [elf] * len(chunks), chunks, [unwindInline] * len(chunks)) for x in chunk]
+                    self.storeStage(elf, 'lines', linesKey, {
+                        'pc': numpy.array([x[0] for x in lines], dtype=numpy.uint64),
+                        'file': [x[1] for x in lines],
+                        'function': [x[2] for x in lines],
+                        'line': numpy.array([x[3] or 0 for x in lines], dtype=numpy.uint32),
+                    })
+                for (iAddr, sourceFile, function, line) in lines:
+                    if iAddr not in cache['cache']:
+                        raise Exception(f'Got an unknown address from addr2line: 0x{iAddr:x}')
+                    if sourceFile is not None:
+                        cache['cache'][iAddr][SAMPLE.file] = sourceFile
+                    if function is not None:
+                        cache['cache'][iAddr][SAMPLE.function] = function
+                    if line is not None:
+                        cache['cache'][iAddr][SAMPLE.line] = line
+                del lines
 
             # Third Step, read in source code
             if includeSource:
-                # Those encondings will be tried
-                all_encodings = ['utf_8', 'latin_1', 'ascii', 'utf_16', 'utf_32', 'iso8859_2', 'utf_8_sig' 'utf_16_be', 'utf_16_le', 'utf_32_be', 'utf_32_le',
-                                 'iso8859_3', 'iso8859_4', 'iso8859_5', 'iso8859_6', 'iso8859_7', 'iso8859_8', 'iso8859_9', 'iso8859_10', 'iso8859_11', 'iso8859_12',
-                                 'iso8859_13', 'iso8859_14', 'iso8859_15', 'iso8859_16']
-                for pc in cache['cache']:
-                    if cache['cache'][pc][SAMPLE.file] is not None and cache['cache'][pc][SAMPLE.file] not in cache['source']:
-                        targetFile = None
-                        sourcePath = cache['cache'][pc][SAMPLE.file]
-                        searchPath = pathlib.Path(sourcePath)
-                        cache['source'][sourcePath] = None
-                        if (os.path.isfile(sourcePath)):
-                            targetFile = sourcePath
-                        elif len(sourceSearchPaths) > 0:
-                            if searchPath.is_absolute():
-                                searchPath = pathlib.Path(*searchPath.parts[1:])
-                            found = False
-                            for search in sourceSearchPaths:
-                                currentSearchPath = searchPath
-                                while not found and len(currentSearchPath.parts) > 0:
-                                    if os.path.isfile(search / currentSearchPath):
-                                        targetFile = search / currentSearchPath
-                                        found = True
+                sourceKey = dict(linesKey, searchPaths=[str(x) for x in sourceSearchPaths])
+                store = contentStore()
+                stage = self.loadStage(elf, 'source', sourceKey) if incremental else None
+                if stage is not None:
+                    # Sources are only reused if none of the located files changed since
+                    targets = self._stageStrings(stage, 'source.target')
+                    for target, mtime in zip(targets, stage.column('source.mtime').tolist()):
+                        if target is not None and (not os.path.isfile(target) or os.stat(target).st_mtime_ns != mtime):
+                            stage.close()
+                            stage = None
+                            break
+                if stage is not None:
+                    for path, digest in zip(self._stageStrings(stage, 'source.path'), self._stageStrings(stage, 'source.digest')):
+                        cache['source'][path] = None if digest is None else list(store.get(digest))
+                    stage.close()
+                else:
+                    sourceTargets = {}
+                    # Those encondings will be tried
+                    all_encodings = ['utf_8', 'latin_1', 'ascii', 'utf_16', 'utf_32', 'iso8859_2', 'utf_8_sig' 'utf_16_be', 'utf_16_le', 'utf_32_be', 'utf_32_le',
+                                     'iso8859_3', 'iso8859_4', 'iso8859_5', 'iso8859_6', 'iso8859_7', 'iso8859_8', 'iso8859_9', 'iso8859_10', 'iso8859_11', 'iso8859_12',
+                                     'iso8859_13', 'iso8859_14', 'iso8859_15', 'iso8859_16']
+                    for pc in cache['cache']:
+                        if cache['cache'][pc][SAMPLE.file] is not None and cache['cache'][pc][SAMPLE.file] not in cache['source']:
+                            targetFile = None
+                            sourcePath = cache['cache'][pc][SAMPLE.file]
+                            searchPath = pathlib.Path(sourcePath)
+                            cache['source'][sourcePath] = None
+                            if (os.path.isfile(sourcePath)):
+                                targetFile = sourcePath
+                            elif len(sourceSearchPaths) > 0:
+                                if searchPath.is_absolute():
+                                    searchPath = pathlib.Path(*searchPath.parts[1:])
+                                found = False
+                                for search in sourceSearchPaths:
+                                    currentSearchPath = searchPath
+                                    while not found and len(currentSearchPath.parts) > 0:
+                                        if os.path.isfile(search / currentSearchPath):
+                                            targetFile = search / currentSearchPath
+                                            found = True
+                                            break
+                                        currentSearchPath = pathlib.Path(*currentSearchPath.parts[1:])
+                                    if found:
+                                        break
+
+                            if targetFile is not None:
+                                sourceTargets[sourcePath] = str(targetFile)
+                                decoded = False
+                                for enc in all_encodings:
+                                    try:
+                                        with open(targetFile, 'r', encoding=enc) as fp:
+                                            cache['source'][sourcePath] = []
+                                            for i, line in enumerate(fp):
+                                                cache['source'][sourcePath].append(line.strip('\r\n'))
+                                        # print(f"Opened file {targetFile} with encoding {enc}")
+                                        decoded = True
                                         break
-                                    currentSearchPath = pathlib.Path(*currentSearchPath.parts[1:])
-                                if found:
-                                    break
-
-                        if targetFile is not None:
-                            decoded = False
-                            for enc in all_encodings:
-                                try:
-                                    with open(targetFile, 'r', encoding=enc) as fp:
-                                        cache['source'][sourcePath] = []
-                                        for i, line in enumerate(fp):
-                                            cache['source'][sourcePath].append(line.strip('\r\n'))
-                                    # print(f"Opened file {targetFile} with encoding {enc}")
-                                    decoded = True
-                                    break
-                                except Exception:
-                                    pass
-                            if not decoded:
-                                cache['source'][sourcePath] = None
-                                raise Exception(f"could not decode source code {sourcePath}")
-                        elif verbose:
-                            print(f"WARNING: could not find source code for {os.path.basename(sourcePath)}", file=sys.stderr)
+                                    except Exception:
+                                        pass
+                                if not decoded:
+                                    cache['source'][sourcePath] = None
+                                    raise Exception(f"could not decode source code {sourcePath}")
+                            elif verbose:
+                                print(f"WARNING: could not find source code for {os.path.basename(sourcePath)}", file=sys.stderr)
+
+                    if not disableCache:
+                        self.storeStage(elf, 'source', sourceKey, {
+                            'source.path': list(cache['source']),
+                            'source.digest': [None if x is None else store.put(x) for x in cache['source'].values()],
+                            'source.target': [sourceTargets.get(x) for x in cache['source']],
+                            'source.mtime': numpy.array([os.stat(sourceTargets[x]).st_mtime_ns if x in sourceTargets else 0 for x in cache['source']], dtype=numpy.int64),
+                        })
 
             # Fourth Step, basic block reconstruction
             if basicblockReconstruction:
-                # If a dynmap file is provided, read it in and add the dynamic branch informations
-                dynmap = {}
                 if dynmapfile is None and os.path.isfile(elf + '.dynmap'):
                     dynmapfile = elf + '.dynmap'
+                dynmapDigest = None
                 if dynmapfile is not None and os.path.isfile(dynmapfile):
                     try:
-                        with open(dynmapfile, "r") as fDynmap:
-                            csvDynmap = csv.reader(fDynmap)
-                            for row in csvDynmap:
-                                try:
-                                    fromPc = int(row[0], 0)
-                                    toPc = int(row[1], 0)
-                                except Exception:
-                                    continue
-                                if fromPc not in dynmap:
-                                    dynmap[fromPc] = [toPc]
-                                else:
-                                    dynmap[fromPc].append(toPc)
+                        with open(dynmapfile, 'rb') as fDynmap:
+                            dynmapDigest = hashlib.md5(fDynmap.read()).hexdigest()
                     except Exception:
-                        if verbose:
-                            print(f"WARNING: could not read dynamic branch information from {dynmapfile}", file=sys.stderr)
-
-                # pcs = sorted(cache['cache'].keys())
-                unresolvedBranches = []
-                # First pass to identify branches
-                for pc in cache['cache']:
-                    instruction = cache['cache'][pc][SAMPLE.instruction].lower()
-                    if instruction in self.archBranches[cache['arch']]['all']:
-                        cache['cache'][pc][SAMPLE.meta] |= META.branchInstruction
-                        asm = cache['asm'][pc].split('\t')
-                        if instruction not in self.archBranches[cache['arch']]['remote'] and len(asm) >= 2:
-                            branched = False
-                            for argument in reversed(re.split(', |,| ', asm[1])):
-                                try:
-                                    branchTarget = int(argument.strip(), 16)
-                                    if branchTarget in cache['cache']:
-                                        cache['cache'][branchTarget][SAMPLE.meta] |= META.branchTarget
-                                        branched = True
-                                        break
-                                except Exception:
-                                    pass
-                            if not branched and verbose:
-                                # Might be a branch that has dynmap information or comes from the plt
-                                if pc not in dynmap and not (cache['cache'][pc][SAMPLE.function].endswith('.plt') or cache['cache'][pc][SAMPLE.function].endswith('@plt')):
-                                    unresolvedBranches.append(pc)
-
-                # Parse dynmap to complete informations
-                newBranchTargets = []
-                knownBranchTargets = []
-                for pc in dynmap:
-                    if pc not in cache['cache']:
-                        raise Exception(f'address 0x{pc:x} from dynamic branch informations is unknown in file {elf}')
-                    if not cache['cache'][pc][SAMPLE.meta] & META.branchInstruction:
-                        raise Exception(f'dynamic branch information provided an unknown branch at 0x{pc:x} in file {elf}')
-                    # With the Exception this is unecessary
-                    # cache['cache'][pc][SAMPLE.meta] |= META.branchInstruction
-                    for target in dynmap[pc]:
-                        if target not in cache['cache']:
-                            raise Exception(f'target address 0x{target:x} from dynamic branch informations is unknown in file {elf}')
-                        if not cache['cache'][target][SAMPLE.meta] & META.branchTarget and not cache['cache'][target][SAMPLE.meta] & META.functionHead:
-                            newBranchTargets.append(target)
-                        else:
-                            knownBranchTargets.append(target)
-                        cache['cache'][target][SAMPLE.meta] |= META.dynamicBranchTarget
-                if verbose and len(newBranchTargets) > 0:
-                    print(f"INFO: {len(newBranchTargets)} new branch targets were identified with dynamic branch information ({', '.join([f'0x{x:x}' for x in newBranchTargets])})", file=sys.stderr)
-                if verbose and len(knownBranchTargets) > 0:
-                    print(f"INFO: {len(knownBranchTargets)} branch targets from dynamic branch information were already known ({', '.join([f'0x{x:x}' for x in knownBranchTargets])})", file=sys.stderr)
-
-                if verbose and len(unresolvedBranches) > 0:
-                    print(f"WARNING: {len(unresolvedBranches)} dynamic branches might not be resolved! ({', '.join([f'0x{x:x}' for x in unresolvedBranches])})", file=sys.stderr)
-                    # print('\n'.join([cache['asm'][x] for x in unresolvedBranches]))
-
-                # Second pass to resolve the basic blocks
-                basicblockCount = 0
-                prevPc = None
-                for pc in cache['cache']:
-                    # If function head, we reset the basicblock counter to zero (functions are already a basicblock)
-                    if cache['cache'][pc][SAMPLE.meta] & META.functionHead:
-                        basicblockCount = 0
-                        cache['cache'][pc][SAMPLE.meta] |= META.basicblockHead
-                        if prevPc is not None:
-                            cache['cache'][prevPc][SAMPLE.meta] |= META.functionBack | META.basicblockBack
-                    # Else, if instruction is a branch target or the previous is a branch we increase the basicblock counter
-                    elif (cache['cache'][pc][SAMPLE.meta] & META.branchTarget) or (cache['cache'][pc][SAMPLE.meta] & META.dynamicBranchTarget) or (prevPc is not None and cache['cache'][prevPc][SAMPLE.meta] & META.branchInstruction):
-                        basicblockCount += 1
-                        cache['cache'][pc][SAMPLE.meta] |= META.basicblockHead
-                        if prevPc is not None:
-                            cache['cache'][prevPc][SAMPLE.meta] |= META.basicblockBack
-
-                    cache['cache'][pc][SAMPLE.basicblock] += f'b{basicblockCount}'
-                    prevPc = pc
+                        pass
+                blocksKey = dict(objdumpKey, dynmap=dynmapDigest)
+                stage = self.loadStage(elf, 'blocks', blocksKey) if incremental else None
+                if stage is not None and stage.columns['meta']['count'] != len(cache['cache']):
+                    stage.close()
+                    stage = None
+                if stage is not None:
+                    for pc, meta, block in zip(cache['cache'], stage.column('meta').tolist(), stage.column('block').tolist()):
+                        cache['cache'][pc][SAMPLE.meta] = meta
+                        cache['cache'][pc][SAMPLE.basicblock] += f'b{block}'
+                    stage.close()
+                else:
+                    self._reconstructBasicblocks(elf, cache, dynmapfile, verbose)
+                    self.storeStage(elf, 'blocks', blocksKey, {
+                        'meta': numpy.array([x[SAMPLE.meta] for x in cache['cache'].values()], dtype=numpy.uint16),
+                        'block': numpy.array([int(x[SAMPLE.basicblock].rsplit('b', 1)[1]) for x in cache['cache'].values()], dtype=numpy.uint32),
+                    })
 
             if not disableCache:
-                pickle.dump(cache, open(cacheFile, "wb"), pickle.HIGHEST_PROTOCOL)
+                elfCacheFile.create(cacheFile, cache)
+                # Segments published from the replaced cache file are released
+                _unlinkSharedCache(cacheFile)
+                cache = elfCacheFile(cacheFile)
             self.caches[elf] = cache
         finally:
             if not disableCache:
                 lock.release()
 
+        if not disableCache:
+            manager = cacheManager()
+            if manager.limit > 0:
+                manager.collect()
+
+    def _reconstructBasicblocks(self, elf: str, cache: dict, dynmapfile, verbose):
+        # If a dynmap file is provided, read it in and add the dynamic branch informations
+        dynmap = {}
+        if dynmapfile is not None and os.path.isfile(dynmapfile):
+            try:
+                with open(dynmapfile, "r") as fDynmap:
+                    csvDynmap = csv.reader(fDynmap)
+                    for row in csvDynmap:
+                        try:
+                            fromPc = int(row[0], 0)
+                            toPc = int(row[1], 0)
+                        except Exception:
+                            continue
+                        if fromPc not in dynmap:
+                            dynmap[fromPc] = [toPc]
+                        else:
+                            dynmap[fromPc].append(toPc)
+            except Exception:
+                if verbose:
+                    print(f"WARNING: could not read dynamic branch information from {dynmapfile}", file=sys.stderr)
+
+        # pcs = sorted(cache['cache'].keys())
+        unresolvedBranches = []
+        # First pass to identify branches
+        for pc in cache['cache']:
+            instruction = cache['cache'][pc][SAMPLE.instruction].lower()
+            if instruction in self.archBranches[cache['arch']]['all']:
+                cache['cache'][pc][SAMPLE.meta] |= META.branchInstruction
+                asm = cache['asm'][pc].split('\t')
+                if instruction not in self.archBranches[cache['arch']]['remote'] and len(asm) >= 2:
+                    branched = False
+                    for argument in reversed(re.split(', |,| ', asm[1])):
+                        try:
+                            branchTarget = int(argument.strip(), 16)
+                            if branchTarget in cache['cache']:
+                                cache['cache'][branchTarget][SAMPLE.meta] |= META.branchTarget
+                                branched = True
+                                break
+                        except Exception:
+                            pass
+                    if not branched and verbose:
+                        # Might be a branch that has dynmap information or comes from the plt
+                        if pc not in dynmap and not (cache['cache'][pc][SAMPLE.function].endswith('.plt') or cache['cache'][pc][SAMPLE.function].endswith('@plt')):
+                            unresolvedBranches.append(pc)
+
+        # Parse dynmap to complete informations
+        newBranchTargets = []
+        knownBranchTargets = []
+        for pc in dynmap:
+            if pc not in cache['cache']:
+                raise Exception(f'address 0x{pc:x} from dynamic branch informations is unknown in file {elf}')
+            if not cache['cache'][pc][SAMPLE.meta] & META.branchInstruction:
+                raise Exception(f'dynamic branch information provided an unknown branch at 0x{pc:x} in file {elf}')
+            # With the Exception this is unecessary
+            # cache['cache'][pc][SAMPLE.meta] |= META.branchInstruction
+            for target in dynmap[pc]:
+                if target not in cache['cache']:
+                    raise Exception(f'target address 0x{target:x} from dynamic branch informations is unknown in file {elf}')
+                if not cache['cache'][target][SAMPLE.meta] & META.branchTarget and not cache['cache'][target][SAMPLE.meta] & META.functionHead:
+                    newBranchTargets.append(target)
+                else:
+                    knownBranchTargets.append(target)
+                cache['cache'][target][SAMPLE.meta] |= META.dynamicBranchTarget
+        if verbose and len(newBranchTargets) > 0:
+            print(f"INFO: {len(newBranchTargets)} new branch targets were identified with dynamic branch information ({', '.join([f'0x{x:x}' for x in newBranchTargets])})", file=sys.stderr)
+        if verbose and len(knownBranchTargets) > 0:
+            print(f"INFO: {len(knownBranchTargets)} branch targets from dynamic branch information were already known ({', '.join([f'0x{x:x}' for x in knownBranchTargets])})", file=sys.stderr)
+
+        if verbose and len(unresolvedBranches) > 0:
+            print(f"WARNING: {len(unresolvedBranches)} dynamic branches might not be resolved! ({', '.join([f'0x{x:x}' for x in unresolvedBranches])})", file=sys.stderr)
+            # print('\n'.join([cache['asm'][x] for x in unresolvedBranches]))
+
+        # Second pass to resolve the basic blocks
+        basicblockCount = 0
+        prevPc = None
+        for pc in cache['cache']:
+            # If function head, we reset the basicblock counter to zero (functions are already a basicblock)
+            if cache['cache'][pc][SAMPLE.meta] & META.functionHead:
+                basicblockCount = 0
+                cache['cache'][pc][SAMPLE.meta] |= META.basicblockHead
+                if prevPc is not None:
+                    cache['cache'][prevPc][SAMPLE.meta] |= META.functionBack | META.basicblockBack
+            # Else, if instruction is a branch target or the previous is a branch we increase the basicblock counter
+            elif (cache['cache'][pc][SAMPLE.meta] & META.branchTarget) or (cache['cache'][pc][SAMPLE.meta] & META.dynamicBranchTarget) or (prevPc is not None and cache['cache'][prevPc][SAMPLE.meta] & META.branchInstruction):
+                basicblockCount += 1
+                cache['cache'][pc][SAMPLE.meta] |= META.basicblockHead
+                if prevPc is not None:
+                    cache['cache'][prevPc][SAMPLE.meta] |= META.basicblockBack
+
+            cache['cache'][pc][SAMPLE.basicblock] += f'b{basicblockCount}'
+            prevPc = pc
 
-class listmapper:
-    maps = {}
 
+
+class listmapper:
+    # Interns the values of selected list positions to ids. Every map keeps
+    # the id -> value list, which is the serialized form, and a value -> id
+    # dictionary beside it
     def __init__(self, mapping=None):
+        self.maps = {}
+        self.ids = {}
         if mapping is not None:
             self.addMaping(mapping)
 
@@ -502,10 +3147,12 @@ class listmapper:
                     raise Exception('class listmapper must be used with integer maps')
                 if m in self.maps:
                     del self.maps[m]
-        elif isinstance(mapping, int):
+                    del self.ids[m]
+        elif not isinstance(mapping, int):
             raise Exception('class listmapper must be used with integer maps')
         elif mapping in self.maps:
             del self.maps[mapping]
+            del self.ids[mapping]
 
     def addMaping(self, mapping):
         if isinstance(mapping, list):
@@ -514,22 +3161,40 @@ class listmapper:
                     raise Exception('class listmapper must be used with integer maps')
                 if m not in self.maps:
                     self.maps[m] = []
-        elif isinstance(m, int):
+                    self.ids[m] = {}
+        elif not isinstance(mapping, int):
             raise Exception('class listmapper must be used with integer maps')
         elif mapping not in self.maps:
             self.maps[mapping] = []
+            self.ids[mapping] = {}
 
     def mapValues(self, values: list):
         mapped = []
         for i, val in enumerate(values):
-            if i in self.maps:
-                if val not in self.maps[i]:
+            if i in self.ids:
+                ids = self.ids[i]
+                if val not in ids:
+                    ids[val] = len(self.maps[i])
                     self.maps[i].append(val)
-                mapped.append(self.maps[i].index(val))
+                mapped.append(ids[val])
             else:
                 mapped.append(val)
         return mapped
 
+    def mapColumn(self, index: int, values: list):
+        # Maps many values of a single column at once
+        if index not in self.ids:
+            raise Exception(f'listmapper has no map {index}')
+        ids = self.ids[index]
+        column = self.maps[index]
+        mapped = []
+        for val in values:
+            if val not in ids:
+                ids[val] = len(column)
+                column.append(val)
+            mapped.append(ids[val])
+        return mapped
+
     def remapValues(self, values: list):
         remapped = []
         for i, val in enumerate(values):
@@ -543,25 +3208,212 @@ class listmapper:
 
     def setMaps(self, maps: dict):
         self.maps = maps
+        # The first occurrence of a value owns its id, like a search through the list would find
+        self.ids = {}
+        for i, values in maps.items():
+            self.ids[i] = {}
+            for j, val in enumerate(values):
+                self.ids[i].setdefault(val, j)
 
     def retrieveMaps(self):
         return self.maps
 
 
-class sampleParser:
-    cache = elfCache()
-    # Mapper will compress the samples down to a numeric list
-    mapper = listmapper([SAMPLE.binary, SAMPLE.file, SAMPLE.function, SAMPLE.basicblock, SAMPLE.instruction])
-    cacheMap = {}
+class lruCache:
+    # Bounded mapping that evicts the least recently used entry, a capacity
+    # of 0 never evicts. Lookups are counted to size the capacity
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.capacity > 0 and len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def statistics(self):
+        return {'capacity': self.capacity, 'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class kallsymsIndex:
+    # Kernel symbols sorted by address for bisect lookups. Every position holds
+    # the symbol listed last in kallsyms at or below its address, the same one
+    # a search through the reversed symbol list finds
+    def __init__(self, addresses, names, strings, start: int, end: int):
+        self.addresses = addresses
+        self.names = names
+        self.strings = strings
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return len(self.addresses)
+
+    @classmethod
+    def fromBuffer(cls, buffer: str):
+        addresses = []
+        names = []
+        for symbol in buffer.split('\n'):
+            s = symbol.split(" ")
+            if len(s) >= 3:
+                addresses.append(int(s[0], 16))
+                names.append(s[2])
+        if len(addresses) == 0:
+            return cls(numpy.empty(0, dtype=numpy.uint64), numpy.empty(0, dtype=numpy.int32), [], 0, 0)
+        strings = {}
+        ids = numpy.array([strings.setdefault(x, len(strings)) for x in names], dtype=numpy.int32)
+        order = numpy.argsort(numpy.array(addresses, dtype=numpy.uint64), kind='stable')
+        # The symbol listed last among all addresses up to a position wins
+        latest = numpy.maximum.accumulate(order)
+        return cls(numpy.array(addresses, dtype=numpy.uint64)[order], ids[latest], list(strings), addresses[0], addresses[-1])
+
+    @classmethod
+    def fromFile(cls, path: str):
+        columnar = columnarFile(path)
+        if columnar.meta.get('version') != cacheVersion:
+            raise Exception(f"wrong version of kallsyms index located at {path}!")
+        return cls(columnar.column('address'), columnar.column('name'), columnar.strings('strings'), columnar.meta['start'], columnar.meta['end'])
+
+    def write(self, path: str):
+        columns = {'address': self.addresses, 'name': self.names}
+        columns['strings.offsets'], columns['strings.data'] = columnarFile.encodeStrings(list(self.strings))
+        columnarFile.write(path, {'version': cacheVersion, 'start': self.start, 'end': self.end}, columns)
+
+    def find(self, pc: int):
+        # pc is relative to the first symbol like the kernel binary range
+        address = pc + self.start
+        if address < 0 or address >= 1 << 64:
+            return None
+        i = int(numpy.searchsorted(self.addresses, numpy.uint64(address), side='right')) - 1
+        if i < 0:
+            return None
+        return self.strings[int(self.names[i])]
+
+
+class correlationMemo:
+    # Persistent memo of the values resolved from an elf cache, stored next to
+    # the cache and keyed by the cache file and the selected fields. Records are
+    # appended as json lines [srcpc, values], the first line identifies the
+    # cache file by its name and creation date so memos of rebuilt caches are
+    # dropped. Only the header of the cache file is read for that
+    def __init__(self, cacheFile: str, selector: list):
+        global disableCache
+        self.memoFile = f"{cacheFile}.memo_{hashlib.md5(json.dumps(selector).encode('utf-8')).hexdigest()}"
+        self.values = {}
+        self.pending = []
+        self.identity = None
+        if disableCache or not os.path.isfile(cacheFile):
+            return
+        try:
+            header = columnarFile(cacheFile)
+            self.identity = [os.path.basename(cacheFile), header.meta['date']]
+            header.close()
+        except Exception:
+            return
+        if os.path.isfile(self.memoFile):
+            self._load()
+            # The cache stays in use while its memo is
+            cacheManager.touch(self.memoFile)
+            cacheManager.touch(cacheFile)
+
+    def _load(self):
+        with open(self.memoFile, 'r') as fp:
+            if self._readHeader(fp) != self.identity:
+                return
+            for line in fp:
+                # A process might have died while appending the last record
+                try:
+                    srcpc, values = json.loads(line)
+                except ValueError:
+                    continue
+                self.values[srcpc] = values
 
-    binaries = []
-    kallsyms = []
-    searchPaths = []
+    @staticmethod
+    def _readHeader(fp):
+        try:
+            return json.loads(fp.readline())
+        except ValueError:
+            return None
 
-    _localSampleCache = {}
+    def __contains__(self, srcpc):
+        return srcpc in self.values
+
+    def __getitem__(self, srcpc):
+        return self.values[srcpc]
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, srcpc: int, values: list):
+        if self.identity is None or srcpc in self.values:
+            return
+        self.values[srcpc] = values
+        self.pending.append(json.dumps([srcpc, values]) + '\n')
+
+    def store(self):
+        if len(self.pending) == 0:
+            return
+        with FileLock(self.memoFile + '.lock'):
+            header = None
+            if os.path.isfile(self.memoFile):
+                with open(self.memoFile, 'r') as fp:
+                    header = self._readHeader(fp)
+            if header != self.identity:
+                # Memo of another build of the cache, it is replaced by everything known so far
+                tmpMemoFile = f'{self.memoFile}.{os.getpid()}.tmp'
+                with open(tmpMemoFile, 'w') as fp:
+                    fp.write(json.dumps(self.identity) + '\n')
+                    fp.writelines(json.dumps([k, v]) + '\n' for k, v in self.values.items())
+                os.replace(tmpMemoFile, self.memoFile)
+            else:
+                with open(self.memoFile, 'a') as fp:
+                    fp.writelines(self.pending)
+        self.pending = []
 
-    def __init__(self):
-        pass
+
+class sampleParser:
+    # Every parser is a session with its own vmmap, kernel symbols and
+    # mappings, loaded cache files are shared between sessions read only
+    def __init__(self, sampleCacheCapacity=None, memo=None):
+        global sampleCacheSize
+        global sampleMemo
+        self.cache = elfCache()
+        # Mapper will compress the samples down to a numeric list
+        self.mapper = listmapper([SAMPLE.binary, SAMPLE.file, SAMPLE.function, SAMPLE.basicblock, SAMPLE.instruction])
+        self.cacheMap = {}
+
+        self.binaries = []
+        self.kallsyms = None
+        self.searchPaths = []
+
+        self._binaryBounds = []
+        self._binaryOwners = []
+        self._binaryCount = 0
+        self._localSampleCache = lruCache(sampleCacheSize if sampleCacheCapacity is None else sampleCacheCapacity)
+        self.memo = sampleMemo if memo is None else memo
+        self.memos = {}
 
     def addSearchPath(self, path):
         if not isinstance(path, list):
@@ -580,30 +3432,28 @@ class sampleParser:
         if (fromFile):
             fromBuffer = xopen.xopen(fromFile, "r").read()
 
+        # Every label is located once, the elf headers are parsed in process and
+        # memoized by file for later vmmaps
+        layouts = {}
         for line in fromBuffer.split("\n"):
             if (len(line) > 2):
                 (addr, size, label,) = line.split(" ", 2)
                 addr = int(addr, 16)
                 size = int(size, 16)
 
-                found = False
-                static = False
-                for searchPath in self.searchPaths:
-                    path = f"{searchPath}/{label}"
-                    if (os.path.isfile(path)):
-                        readelf = subprocess.run(f"readelf -h {path}", shell=True, stdout=subprocess.PIPE)
-                        readelfsection = subprocess.run(f"readelf -lW {path} 2>/dev/null | awk '$0 ~ /LOAD.+ R.E 0x/ {{print $3\":\"$6}}'", shell=True, stdout=subprocess.PIPE)
-                        try:
-                            readelf.check_returncode()
-                            readelfsection.check_returncode()
-                            static = True if re.search("Type:[ ]+EXEC", readelf.stdout.decode('utf-8'), re.M) else False
-                            offset = int(readelfsection.stdout.decode('utf-8').split('\n')[:-1][0].split(":")[0], 0)
-                            found = True
-                            break
-                        except Exception:
-                            pass
-
+                if label not in layouts:
+                    layouts[label] = None
+                    for searchPath in self.searchPaths:
+                        path = f"{searchPath}/{label}"
+                        if (os.path.isfile(path)):
+                            layout = getElfLayout(path)
+                            if layout is not None:
+                                layouts[label] = (path,) + layout
+                                break
+
+                found = layouts[label] is not None
                 if found:
+                    (path, static, offset) = layouts[label]
                     # Not seen so far but a binary could have multiple code sections which wouldn't work with that structure so far:
                     # print(f"Using offset {offset:x} for {label}")
                     self.binaries.append({
@@ -627,65 +3477,97 @@ class sampleParser:
         if (fromFile):
             fromBuffer = xopen.xopen(fromFile, "r").read()
 
-        for symbol in fromBuffer.split('\n'):
-            s = symbol.split(" ")
-            if len(s) >= 3:
-                self.kallsyms.append([int(s[0], 16), s[2]])
+        global cacheFolder
+        global disableCache
+        # The parsed index is kept in the cache folder, keyed by the digest of the kallsyms
+        indexFile = os.path.abspath(f"{cacheFolder}/kallsyms_{hashlib.md5(fromBuffer.encode('utf-8', 'surrogateescape')).hexdigest()}")
+        self.kallsyms = None
+        if not disableCache and os.path.isfile(indexFile):
+            try:
+                self.kallsyms = kallsymsIndex.fromFile(indexFile)
+                cacheManager.touch(indexFile)
+            except Exception:
+                self.kallsyms = None
+        if self.kallsyms is None:
+            self.kallsyms = kallsymsIndex.fromBuffer(fromBuffer)
+            if not disableCache and os.path.isdir(cacheFolder):
+                self.kallsyms.write(indexFile)
 
         if len(self.kallsyms) <= 0:
             return
 
-        kstart = self.kallsyms[0][0]
-
         self.binaries.append({
             'binary': '_kernel',
             'path': '_kernel',
             'kernel': True,
             'static': False,
-            'start': kstart,
+            'start': self.kallsyms.start,
             'offset': 0,
-            'size': self.kallsyms[-1][0] - kstart,
-            'end': self.kallsyms[-1][0]
+            'size': self.kallsyms.end - self.kallsyms.start,
+            'end': self.kallsyms.end
         })
 
-        self.kallsyms = [[x - kstart, y] for (x, y) in self.kallsyms]
-        self.kallsyms.reverse()
-
     def isPCKnown(self, pc):
         if self.getBinaryFromPC(pc) is False:
             return False
         return True
 
+    def _indexBinaries(self):
+        # The address space is split into segments at every range boundary, each
+        # segment belongs to the first binary in the list that covers it
+        bounds = sorted({x['start'] for x in self.binaries} | {x['end'] + 1 for x in self.binaries})
+        owners = [-1] * len(bounds)
+        for i in reversed(range(len(self.binaries))):
+            for j in range(bisect.bisect_left(bounds, self.binaries[i]['start']), bisect.bisect_left(bounds, self.binaries[i]['end'] + 1)):
+                owners[j] = i
+        self._binaryBounds = bounds
+        self._binaryOwners = owners
+        self._binaryCount = len(self.binaries)
+
     def getBinaryFromPC(self, pc):
-        for binary in self.binaries:
-            if (pc >= binary['start'] and pc <= binary['end']):
-                return binary
-        return False
+        # Binaries may be appended directly to the list, the index follows lazily
+        if self._binaryCount != len(self.binaries):
+            self._indexBinaries()
+        i = bisect.bisect_right(self._binaryBounds, pc) - 1
+        if i < 0 or self._binaryOwners[i] == -1:
+            return False
+        return self.binaries[self._binaryOwners[i]]
 
-    def getSampleFromPC(self, pc):
+    def resolvePC(self, pc):
+        # Returns the binary of a pc and the pc inside of the binary, or False and None
         binary = self.getBinaryFromPC(pc)
+        if binary is False:
+            return False, None
+        # Static pc is used as is
+        # dynamic pc points into a virtual memory range which was mapped according to the vmmap
+        # the binary on e.g. x86 are typically mapped using an offset to the actual code section
+        # in the binary meaning the read pc value must be treated with the offset for correlation
+        return binary, pc if binary['static'] else (pc - binary['start']) + binary['offset']
+
+    def getSampleFromPC(self, pc):
+        binary, srcpc = self.resolvePC(pc)
         sample = None
 
         if binary is not False:
-            # Static pc is used as is
-            # dynamic pc points into a virtual memory range which was mapped according to the vmmap
-            # the binary on e.g. x86 are typically mapped using an offset to the actual code section
-            # in the binary meaning the read pc value must be treated with the offset for correlation
-            srcpc = pc if binary['static'] else (pc - binary['start']) + binary['offset']
-
             if binary['kernel']:
                 sample = copy(SAMPLE.invalid)
                 sample[SAMPLE.pc] = srcpc
                 sample[SAMPLE.binary] = binary['binary']
-                for f in self.kallsyms:
-                    if f[0] <= srcpc:
-                        sample[SAMPLE.function] = f[1]
-                        break
+                sample[SAMPLE.function] = self.kallsyms.find(srcpc)
             else:
-                sample = self.cache.getSampleFromPC(binary['path'], srcpc)
-                if sample is not None:
+                memo = self.getMemo(binary['path'])
+                if memo is not None and srcpc in memo:
+                    # Memoized samples are resolved without loading the cache
+                    sample = memo[srcpc]
                     if sample[SAMPLE.binary] not in self.cacheMap:
-                        self.cacheMap[sample[SAMPLE.binary]] = os.path.basename(self.cache.getCacheFile(binary['path']))
+                        self.cacheMap[sample[SAMPLE.binary]] = memo.identity[0]
+                else:
+                    sample = self.cache.getSampleFromPC(binary['path'], srcpc)
+                    if sample is not None:
+                        if memo is not None and srcpc in self.cache.caches[binary['path']]['cache']:
+                            memo.add(srcpc, list(sample))
+                        if sample[SAMPLE.binary] not in self.cacheMap:
+                            self.cacheMap[sample[SAMPLE.binary]] = os.path.basename(self.cache.getCacheFile(binary['path']))
 
         if sample is None:
             sample = copy(SAMPLE.invalid)
@@ -694,8 +3576,9 @@ class sampleParser:
         return sample
 
     def parsePC(self, pc):
-        if pc in self._localSampleCache:
-            return self._localSampleCache[pc]
+        result = self._localSampleCache.get(pc)
+        if result is not None:
+            return result
 
         sample = self.getSampleFromPC(pc)
         result = self.mapper.mapValues(sample)
@@ -703,6 +3586,112 @@ class sampleParser:
         self._localSampleCache[pc] = result
         return result
 
+    def parsePCs(self, pcs, tids=None):
+        # Batch version of parsePC, resolves an array of pcs into arrays of
+        # mapped ids. Lines are 0 and meta is -1 where they are unknown. Every
+        # distinct pc is resolved once, pcs of a binary with a single lookup
+        pcs = numpy.asarray(pcs, dtype=numpy.uint64)
+        unique, inverse = numpy.unique(pcs, return_inverse=True)
+        mappedColumns = [SAMPLE.binary, SAMPLE.file, SAMPLE.function, SAMPLE.basicblock, SAMPLE.instruction]
+        invalid = self.mapper.mapValues(copy(SAMPLE.invalid))
+        columns = {SAMPLE.names[x]: numpy.full(len(unique), invalid[x], dtype=numpy.int64) for x in mappedColumns}
+        columns['line'] = numpy.zeros(len(unique), dtype=numpy.uint32)
+        columns['meta'] = numpy.full(len(unique), -1, dtype=numpy.int32)
+
+        if self._binaryCount != len(self.binaries):
+            self._indexBinaries()
+        if len(self._binaryBounds) > 0:
+            bounds = numpy.array([min(x, (1 << 64) - 1) for x in self._binaryBounds], dtype=numpy.uint64)
+            segments = numpy.searchsorted(bounds, unique, side='right') - 1
+            owners = numpy.where(segments >= 0, numpy.array(self._binaryOwners + [-1], dtype=numpy.int64)[segments], -1)
+        else:
+            owners = numpy.full(len(unique), -1, dtype=numpy.int64)
+
+        for owner in numpy.unique(owners[owners != -1]).tolist():
+            binary = self.binaries[owner]
+            indices = numpy.nonzero(owners == owner)[0]
+            srcpcs = unique[indices] if binary['static'] else (unique[indices] - numpy.uint64(binary['start'])) + numpy.uint64(binary['offset'])
+
+            if binary['kernel']:
+                columns['binary'][indices] = self.mapper.mapColumn(SAMPLE.binary, [binary['binary']])[0]
+                names, inverseNames = numpy.unique([self.kallsyms.find(int(x)) or '' for x in srcpcs], return_inverse=True)
+                mapped = numpy.array(self.mapper.mapColumn(SAMPLE.function, [x if len(x) > 0 else None for x in names.tolist()]), dtype=numpy.int64)
+                columns['function'][indices] = mapped[inverseNames]
+                continue
+
+            memo = self.getMemo(binary['path'])
+            if memo is not None:
+                known = numpy.array([x in memo for x in srcpcs.tolist()], dtype=bool)
+                if known.any():
+                    samples = [memo[x] for x in srcpcs[known].tolist()]
+                    for x in mappedColumns:
+                        columns[SAMPLE.names[x]][indices[known]] = self.mapper.mapColumn(x, [sample[x] for sample in samples])
+                    columns['line'][indices[known]] = [sample[SAMPLE.line] or 0 for sample in samples]
+                    columns['meta'][indices[known]] = [sample[SAMPLE.meta] if sample[SAMPLE.meta] is not None else -1 for sample in samples]
+                    if samples[0][SAMPLE.binary] not in self.cacheMap:
+                        self.cacheMap[samples[0][SAMPLE.binary]] = memo.identity[0]
+                # Only pcs that are not memoized yet need the cache
+                indices = indices[~known]
+                srcpcs = srcpcs[~known]
+                if len(indices) == 0:
+                    continue
+
+            cache = self.cache.getCache(binary['path'])
+            if not isinstance(cache, elfCacheFile):
+                # In memory caches are resolved one pc at a time
+                for index in indices.tolist():
+                    sample = self.mapper.mapValues(self.getSampleFromPC(int(unique[index])))
+                    for x in mappedColumns:
+                        columns[SAMPLE.names[x]][index] = sample[x]
+                    columns['line'][index] = sample[SAMPLE.line] or 0
+                    columns['meta'][index] = sample[SAMPLE.meta] if sample[SAMPLE.meta] is not None else -1
+                continue
+
+            if cache['name'] not in self.cacheMap:
+                self.cacheMap[cache['name']] = os.path.basename(self.cache.getCacheFile(binary['path']))
+            columns['binary'][indices] = self.mapper.mapColumn(SAMPLE.binary, [cache['name']])[0]
+            cachePcs = cache.column('pc')
+            rows = numpy.minimum(numpy.searchsorted(cachePcs, srcpcs), max(len(cachePcs) - 1, 0))
+            found = cachePcs[rows] == srcpcs if len(cachePcs) > 0 else numpy.zeros(len(srcpcs), dtype=bool)
+            for srcpc in srcpcs[~found].tolist():
+                print(f"WARNING: 0x{srcpc:x} does not exist in {binary['path']}", file=sys.stderr)
+            indices = indices[found]
+            rows = rows[found]
+            for x in mappedColumns[1:]:
+                ids, inverseIds = numpy.unique(cache.column(SAMPLE.names[x])[rows], return_inverse=True)
+                mapped = numpy.array(self.mapper.mapColumn(x, [cache.stringTable[i] for i in ids.tolist()]), dtype=numpy.int64)
+                columns[SAMPLE.names[x]][indices] = mapped[inverseIds]
+            columns['line'][indices] = cache.column('line')[rows]
+            columns['meta'][indices] = cache.column('meta')[rows]
+            if memo is not None:
+                for srcpc in srcpcs[found].tolist():
+                    memo.add(srcpc, list(cache['cache'][srcpc]))
+
+        self.storeMemos()
+        result = {'pc': pcs}
+        for name, values in columns.items():
+            result[name] = values[inverse]
+        if tids is not None:
+            result['tid'] = numpy.asarray(tids, dtype=numpy.uint32)
+            if len(result['tid']) != len(pcs):
+                raise Exception('pcs and tids must be of the same length')
+        return result
+
+    def getMemo(self, elf: str, selector=SAMPLE.names):
+        # Memo of the values selected from the cache of an elf, None if memos
+        # are disabled or the cache was not created yet
+        if not self.memo:
+            return None
+        key = (elf, tuple(selector))
+        if key not in self.memos:
+            self.memos[key] = correlationMemo(self.cache.getCacheFile(elf), selector)
+        return self.memos[key] if self.memos[key].identity is not None else None
+
+    def storeMemos(self):
+        # Appends newly resolved pcs to the memos on disk
+        for memo in self.memos.values():
+            memo.store()
+
     def parseFromSample(self, sample):
         return self.mapper.remapValues(sample)
 
@@ -712,15 +3701,43 @@ class sampleParser:
     def getCacheMap(self):
         return self.cacheMap
 
+    def getSampleCacheStatistics(self):
+        return self._localSampleCache.statistics()
+
     def getName(self, binary):
         self.cache.openOrCreateCache(binary)
         return self.cache.caches[binary]['name']
 
 
-class sampleFormatter():
-    mapper = listmapper()
+def _parseProfile(profile: dict):
+    parser = sampleParser()
+    if 'searchPaths' in profile:
+        parser.addSearchPath(profile['searchPaths'])
+    if 'vmmap' in profile:
+        parser.loadVMMap(profile['vmmap'])
+    if 'kallsyms' in profile:
+        parser.loadKallsyms(profile['kallsyms'])
+    return {
+        'samples': parser.parsePCs(profile['pcs'], profile.get('tids')),
+        'maps': parser.getMaps(),
+        'cacheMap': parser.getCacheMap(),
+    }
+
 
+def parseProfiles(profiles: list, jobs=None):
+    # Correlates profiles concurrently in a thread pool. A profile is a dict
+    # with 'pcs' and optionally 'tids', 'vmmap', 'kallsyms' and 'searchPaths',
+    # each one is resolved in its own sampleParser session
+    if jobs is None:
+        jobs = cacheJobs
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(_parseProfile, profiles))
+
+
+class sampleFormatter():
     def __init__(self, maps):
+        # Every formatter keeps its own maps, sessions are formatted independently
+        self.mapper = listmapper()
         self.mapper.setMaps(maps)
 
     def remapSample(self, sample):
@@ -0,0 +1,17 @@
+#!/bin/bash
+# Rebuilds the binaries the elf backend is compared against binutils with
+set -e
+cd "$(dirname "$0")"
+FLAGS="-O2 -nostdlib -static -ffreestanding -fno-asynchronous-unwind-tables -fno-pie -no-pie -Wl,--build-id=none -fdebug-prefix-map=$(pwd)=/pperf/tests"
+gcc $FLAGS -gdwarf-2 -gstrict-dwarf main.c shapes.c -o x86_64-dwarf2
+gcc $FLAGS -gdwarf-4 main.c shapes.c -o x86_64-dwarf4
+gcc $FLAGS -gdwarf-4 -gz=zlib-gnu main.c shapes.c -o x86_64-dwarf4-zdebug
+gcc $FLAGS -gdwarf-5 main.c shapes.c -o x86_64-dwarf5
+gcc $FLAGS -gdwarf-5 -gz=zlib main.c shapes.c -o x86_64-dwarf5-zlib
+gcc $FLAGS -gdwarf-5 -gz=zlib-gnu main.c shapes.c -o x86_64-dwarf5-zdebug
+# The split units are not shipped, only the skeleton units remain
+gcc $FLAGS -gdwarf-5 -gsplit-dwarf main.c shapes.c -o x86_64-dwarf5-split
+rm -f *.dwo
+gcc $FLAGS -m32 -gdwarf-4 main.c shapes.c -o i386-dwarf4
+gcc $FLAGS -m32 -gdwarf-5 main.c shapes.c -o i386-dwarf5
+gcc $FLAGS -m32 -gdwarf-5 -gz=zlib main.c shapes.c -o i386-dwarf5-zlib
@@ -0,0 +1,19 @@
+#include "shapes.h"
+
+volatile long result;
+
+static long __attribute__((noinline)) scale(long value, long factor)
+{
+    long scaled = 0;
+    while (factor-- > 0) {
+        scaled += square(value);
+    }
+    return scaled;
+}
+
+void _start(void)
+{
+    result = scale(sumShapes(result), 3) + cube(result);
+    for (;;) {
+    }
+}
@@ -0,0 +1,10 @@
+#include "shapes.h"
+
+long sumShapes(long n)
+{
+    long total = 0;
+    for (long i = 0; i < n; i++) {
+        total += cube(i) - square(i);
+    }
+    return total;
+}
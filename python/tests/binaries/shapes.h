@@ -0,0 +1,11 @@
+static inline __attribute__((always_inline)) long square(long x)
+{
+    return x * x;
+}
+
+static inline __attribute__((always_inline)) long cube(long x)
+{
+    return square(x) * x;
+}
+
+long sumShapes(long n);
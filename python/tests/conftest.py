@@ -0,0 +1,24 @@
+import os
+import sys
+import struct
+import subprocess
+
+scriptDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, scriptDir)
+
+
+def writeProfile(path, samples, vmmaps=[], magic=3, pmuFormat='d', wallTime=1000000, latencyTime=1000):
+    # samples are [wallTimeUs, pmu, [[tid, pc, cpuTimeNs], ...]], vmmaps [address, size, label]
+    parts = [struct.pack('=IQQQII', magic, wallTime, latencyTime, len(samples), struct.calcsize('=' + pmuFormat), len(vmmaps))]
+    for time, pmu, threads in samples:
+        parts.append(struct.pack('=Q' + pmuFormat + 'I', time, pmu, len(threads)))
+        for tid, pc, cpuTime in threads:
+            parts.append(struct.pack('=IQQ', tid, pc, cpuTime))
+    for address, size, label in vmmaps:
+        parts.append(struct.pack('=QQ256s', address, size, label.encode('utf-8')))
+    with open(path, 'wb') as fp:
+        fp.write(b''.join(parts))
+
+
+def runScript(name, *args):
+    return subprocess.run([sys.executable, os.path.join(scriptDir, name)] + [str(x) for x in args], check=True, capture_output=True, text=True).stdout
@@ -0,0 +1,161 @@
+import os
+import csv
+import random
+import shutil
+import pytest
+import profileLib
+from conftest import runScript
+
+binaryDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'binaries')
+binary = 'x86_64-dwarf5'
+
+
+def prepareCache(tmp_path, monkeypatch):
+    # Returns the pcs of the test binary
+    cacheFolder = str(tmp_path / 'cache')
+    monkeypatch.setenv('PPERF_CACHE', cacheFolder)
+    monkeypatch.setattr(profileLib, 'cacheFolder', cacheFolder)
+    elf = os.path.join(binaryDir, binary)
+    runScript('createCache.py', elf)
+    cache = profileLib.elfCache()
+    pcs = sorted(cache.getCache(elf)['cache'].keys())
+    cache.closeCache(elf)
+    return pcs
+
+
+def readCsv(path):
+    return list(csv.reader(open(path, newline=''), delimiter=';'))
+
+
+def test_columnar_matches_csv(tmp_path, monkeypatch):
+    pcs = prepareCache(tmp_path, monkeypatch) + [0x10]
+    # Only columns written exactly like numbers are numeric, the early rows of
+    # 'mixed' are integers and the later ones floats
+    with open(tmp_path / 'input.csv', 'w') as fp:
+        fp.write('time;tid;address;padded;signed;big;mixed;range\n')
+        for i in range(50):
+            fp.write(f"{i * 0.25};{i % 3};0x{pcs[i % len(pcs)]:x};{i:03d};+{i};{2**63 + i};{i if i < 10 else i + 0.5};{-1 if i == 0 else 2**64 - 1}\n")
+
+    runScript('correlateAddressCsv.py', tmp_path / 'input.csv', '-b', os.path.join(binaryDir, binary), '--address-column', 'address', '-o', tmp_path / 'correlated.csv')
+    runScript('correlateAddressCsv.py', tmp_path / 'input.csv', '-b', os.path.join(binaryDir, binary), '--address-column', 'address', '--format', 'columnar', '--chunk-rows', 4, '-o', tmp_path / 'correlated.col')
+    rows = readCsv(tmp_path / 'correlated.csv')
+    correlated = profileLib.correlatedFile(str(tmp_path / 'correlated.col'))
+    assert correlated.names() == rows[0]
+    assert len(correlated) == len(rows) - 1
+    decoded = [[f'0x{x:x}' if name == 'address' else ('' if x is None else str(x)) for name, x in zip(correlated.names(), row)] for row in correlated.rows()]
+    assert decoded == rows[1:]
+
+    assert correlated.column('time').dtype.kind == 'f'
+    assert correlated.column('tid').dtype.kind == 'i'
+    assert correlated.column('big').dtype.str == '<u8'
+    assert set(correlated.meta['strings']) >= {'padded', 'signed', 'mixed', 'range'}
+    assert 'line' not in correlated.meta['strings']
+    assert all(isinstance(x, int) for x in correlated.dictionary('line').tolist())
+    unknown = correlated.values('address').index(0x10)
+    assert correlated.column('line')[unknown] == -2
+    assert correlated.values('line')[unknown] == '_unknown'
+
+
+def test_jobs_keep_row_order(tmp_path, monkeypatch):
+    pcs = prepareCache(tmp_path, monkeypatch) + [0x10]
+    with open(tmp_path / 'vmmap', 'w') as fp:
+        fp.write(f'400000 3000 {binary}\n')
+    addresses = [f'0x{pcs[(i * 7) % len(pcs)]:x}' for i in range(200)]
+    with open(tmp_path / 'input.csv', 'w') as fp:
+        fp.write('row;address\n')
+        fp.write(''.join(f'{i};{x}\n' for i, x in enumerate(addresses)))
+
+    outputs = []
+    for jobs in [1, 3]:
+        output = tmp_path / f'jobs{jobs}.csv'
+        runScript('correlateAddressCsv.py', tmp_path / 'input.csv', '-v', tmp_path / 'vmmap', '-s', binaryDir, '--address-column', 'address', '--jobs', jobs, '--chunk-rows', 9, '-o', output)
+        outputs.append(open(output, 'rb').read())
+    assert outputs[0] == outputs[1]
+    rows = readCsv(tmp_path / 'jobs3.csv')[1:]
+    assert [x[0] for x in rows] == [str(i) for i in range(200)]
+    assert [x[1] for x in rows] == addresses
+
+
+@pytest.mark.parametrize('options', [[], ['--filter-unknown'], ['--only-filter-unknown'], ['--fill-addresses'], ['--selector', 'function', 'line', 'pc']])
+def test_block_matches_rows(options, tmp_path, monkeypatch):
+    pcs = prepareCache(tmp_path, monkeypatch)
+    elf32 = os.path.join(binaryDir, 'i386-dwarf5')
+    runScript('createCache.py', elf32)
+    cache = profileLib.elfCache()
+    pcs32 = sorted(cache.getCache(elf32)['cache'].keys())
+    cache.closeCache(elf32)
+    with open(tmp_path / 'vmmap', 'w') as fp:
+        fp.write(f'400000 3000 {binary}\n8048000 3000 i386-dwarf5\n')
+    with open(tmp_path / 'kallsyms', 'w') as fp:
+        fp.write('ffffffff81000000 T kernelA\nffffffff81000040 t kernelB\nffffffff81000100 T kernelEnd\n')
+    kernel = [0xffffffff81000000, 0xffffffff81000010, 0xffffffff81000050]
+    unknown = [0x10, 0x900000]
+    addresses = pcs + pcs32 + kernel + unknown
+    rand = random.Random(3)
+    rows = [f'{i};0x{rand.choice(addresses):x};{rand.random()}\n' for i in range(300)]
+
+    # A quote in a comment sends the chunk through the csv reader and writer
+    outputs = []
+    for name, comment in [('block', []), ('rows', ['# ""\n'])]:
+        with open(tmp_path / f'{name}.in.csv', 'w') as fp:
+            fp.write(''.join(['row;address;value\n'] + comment + rows))
+        runScript('correlateAddressCsv.py', tmp_path / f'{name}.in.csv', '-v', tmp_path / 'vmmap', '-ks', tmp_path / 'kallsyms', '-s', binaryDir, '--address-column', 'address', '-o', tmp_path / f'{name}.csv', *options)
+        outputs.append(open(tmp_path / f'{name}.csv', 'rb').read())
+    assert outputs[0] == outputs[1]
+    if '--only-filter-unknown' not in options and '--selector' not in options:
+        labels = {(x[2], x[3]) for x in readCsv(tmp_path / 'block.csv')[1:]}
+        assert {'_kernel', binary, 'i386-dwarf5'} <= {x[0] for x in labels}
+        assert ('_kernel', 'kernelB') in labels
+
+
+def correlateMemo(tmp_path, elf, name, *options):
+    with open(tmp_path / 'vmmap', 'w') as fp:
+        fp.write(f'400000 3000 {os.path.basename(elf)}\n')
+    runScript('correlateAddressCsv.py', tmp_path / 'input.csv', '-v', tmp_path / 'vmmap', '-s', os.path.dirname(elf), '--address-column', 'address', '-o', tmp_path / name, *options)
+    return open(tmp_path / name, 'rb').read()
+
+
+def memoInput(tmp_path, pcs):
+    with open(tmp_path / 'input.csv', 'w') as fp:
+        fp.write('row;address\n')
+        fp.write(''.join(f'{i};0x{pcs[i % len(pcs)]:x}\n' for i in range(100)))
+
+
+def test_memo_reused_across_runs(tmp_path, monkeypatch):
+    pcs = prepareCache(tmp_path, monkeypatch) + [0x10]
+    memoInput(tmp_path, pcs)
+    elf = os.path.join(binaryDir, binary)
+    reference = correlateMemo(tmp_path, elf, 'plain.csv')
+    assert correlateMemo(tmp_path, elf, 'first.csv', '--memo') == reference
+    assert len([x for x in os.listdir(profileLib.cacheFolder) if '.memo_' in x and not x.endswith('.lock')]) == 1
+    # Every address is memoized, the second run does not load the cache at all
+    hits = profileLib.cacheManager().statistics()['hits']
+    assert correlateMemo(tmp_path, elf, 'second.csv', '--memo') == reference
+    assert profileLib.cacheManager().statistics()['hits'] == hits
+
+
+def test_memo_dropped_for_other_digest(tmp_path, monkeypatch):
+    elf = str(tmp_path / 'binaries' / 'prog')
+    os.makedirs(os.path.dirname(elf))
+    shutil.copyfile(os.path.join(binaryDir, binary), elf)
+    prepareCache(tmp_path, monkeypatch)
+    runScript('createCache.py', elf)
+    cache = profileLib.elfCache()
+    pcs = sorted(cache.getCache(elf)['cache'].keys())
+    cache.closeCache(elf)
+    memoInput(tmp_path, pcs)
+    correlateMemo(tmp_path, elf, 'first.csv', '--memo')
+
+    # A memo that was edited by hand shows whether it is used
+    memoFile = [os.path.join(profileLib.cacheFolder, x) for x in os.listdir(profileLib.cacheFolder) if x.startswith('prog_') and '.memo_' in x and not x.endswith('.lock')][0]
+    memo = open(memoFile).read()
+    open(memoFile, 'w').write(memo.replace('sumShapes', 'memoized'))
+    assert b'memoized' in correlateMemo(tmp_path, elf, 'memoized.csv', '--memo')
+
+    # Another build of the binary under the same name has another digest
+    shutil.copyfile(os.path.join(binaryDir, 'x86_64-dwarf4'), elf)
+    assert profileLib.getElfDigest(elf) not in memoFile
+    runScript('createCache.py', elf)
+    reference = correlateMemo(tmp_path, elf, 'plain.csv')
+    assert b'memoized' not in reference
+    assert correlateMemo(tmp_path, elf, 'rebuilt.csv', '--memo') == reference
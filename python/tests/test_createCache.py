@@ -0,0 +1,78 @@
+import os
+import shutil
+import struct
+import pytest
+import profileLib
+
+binaryDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'binaries')
+
+pytestmark = pytest.mark.skipif(shutil.which(profileLib.crossCompile + 'objdump') is None, reason="binutils not installed")
+
+
+def buildCache(folder, elf, jobs, monkeypatch):
+    monkeypatch.setattr(profileLib, 'cacheFolder', str(folder))
+    cache = profileLib.elfCache()
+    cache.createCache(elf, includeSource=False, basicblockReconstruction=False, verbose=False, jobs=jobs, incremental=False)
+    entries = cache.getCache(elf)
+    return {pc: [list(entries['cache'][pc]), entries['asm'][pc]] for pc in entries['cache'].keys()}
+
+
+@pytest.mark.parametrize('binary', ['x86_64-dwarf5', 'i386-dwarf5'])
+def test_sharded_cache_matches_unsharded(binary, tmp_path, monkeypatch):
+    elf = os.path.join(binaryDir, binary)
+    monkeypatch.setattr(profileLib, 'shardSize', 16)
+    elfData = profileLib.elfFile(elf)
+    text = [x for x in elfData.sectionHeaders if elfData.sectionName(x) == '.text'][0]
+    assert len(profileLib._shardSection(elf, '.text', text['addr'], text['size'], 4)) > 1
+    unsharded = buildCache(tmp_path / 'unsharded', elf, 1, monkeypatch)
+    assert buildCache(tmp_path / 'sharded', elf, 4, monkeypatch) == unsharded
+
+
+def test_thumb_shards_start_at_even_addresses(tmp_path, monkeypatch):
+    # The test binary is relabeled as ARM, its functions as Thumb functions
+    elf = str(tmp_path / 'thumb')
+    data = bytearray(open(os.path.join(binaryDir, 'x86_64-dwarf5'), 'rb').read())
+    struct.pack_into('<H', data, 18, profileLib.elfFile.EM_ARM)
+    open(elf, 'wb').write(data)
+    symbols = profileLib.elfFile(elf).symbols()
+    monkeypatch.setattr(profileLib.elfFile, 'symbols', lambda self: [dict(x, value=x['value'] | 1) if x['type'] == profileLib.elfFile.STT_FUNC else x for x in symbols])
+    monkeypatch.setattr(profileLib, 'shardSize', 16)
+    shards = profileLib._shardSection(elf, '.text', 0x401000, 0x86, 4)
+    cuts = [x[2] for x in shards if x[2] is not None]
+    assert len(cuts) > 0
+    assert all(x % 2 == 0 for x in cuts)
+    assert set(cuts) <= {0x401010, 0x401050}
+
+
+def test_shared_caches_are_counted_and_evicted(tmp_path, monkeypatch):
+    elf = os.path.join(binaryDir, 'x86_64-dwarf5')
+    folder = tmp_path / 'caches'
+    monkeypatch.setattr(profileLib, 'sharedMemoryFolder', str(tmp_path / 'shm'))
+    os.makedirs(profileLib.sharedMemoryFolder)
+    monkeypatch.setattr(profileLib, 'sharedCache', True)
+    reference = buildCache(folder, elf, 1, monkeypatch)
+    # The cache built in this process is not published, a new session attaches it
+    monkeypatch.setattr(profileLib.elfCache, 'loadedCaches', {})
+    cache = profileLib.elfCache()
+    entries = cache.getCache(elf)
+    assert {pc: [list(entries['cache'][pc]), entries['asm'][pc]] for pc in entries['cache'].keys()} == reference
+    segments = os.listdir(profileLib.sharedMemoryFolder)
+    assert segments == [profileLib._sharedCacheName(cache.getCacheFile(elf))]
+    segmentSize = os.path.getsize(os.path.join(profileLib.sharedMemoryFolder, segments[0]))
+
+    manager = profileLib.cacheManager(str(folder), 0)
+    folderSize = sum(x.stat().st_size for x in os.scandir(folder) if x.is_file())
+    folderSize += sum(x.stat().st_size for x in os.scandir(folder / 'store') if x.is_file())
+    assert manager.size() == folderSize + segmentSize
+
+    # Segments of caches that no longer exist are garbage, evicted caches take their segment along
+    orphan = os.path.join(profileLib.sharedMemoryFolder, profileLib._sharedCacheName(str(folder / 'removed')))
+    open(orphan, 'wb').write(b'\0' * 64)
+    assert manager.size() == folderSize + segmentSize + 64
+    assert orphan in manager.collect()
+    assert os.listdir(profileLib.sharedMemoryFolder) == segments
+    cacheSize = os.path.getsize(cache.getCacheFile(elf))
+    manager.collect(1)
+    assert os.listdir(profileLib.sharedMemoryFolder) == []
+    stats = manager.statistics()
+    assert stats['evictedBytes'] >= 64 + cacheSize + segmentSize
@@ -0,0 +1,41 @@
+import os
+import shutil
+import pytest
+import profileLib
+
+binaryDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'binaries')
+binaries = ['x86_64-dwarf2', 'x86_64-dwarf4', 'x86_64-dwarf4-zdebug', 'x86_64-dwarf5', 'x86_64-dwarf5-zlib', 'x86_64-dwarf5-zdebug', 'x86_64-dwarf5-split', 'i386-dwarf4', 'i386-dwarf5', 'i386-dwarf5-zlib']
+# Binaries the elf backend leaves to binutils
+fallbacks = ['x86_64-dwarf5-zdebug', 'x86_64-dwarf5-split']
+
+pytestmark = pytest.mark.skipif(shutil.which(profileLib.crossCompile + 'addr2line') is None or shutil.which(profileLib.crossCompile + 'objdump') is None, reason="binutils not installed")
+
+
+def buildCache(folder, elf, backend, monkeypatch):
+    monkeypatch.setattr(profileLib, 'cacheFolder', str(folder))
+    cache = profileLib.elfCache()
+    cache.createCache(elf, includeSource=False, basicblockReconstruction=False, verbose=False, jobs=1, backend=backend, incremental=False)
+    entries = cache.getCache(elf)['cache']
+    return {pc: list(entries[pc]) for pc in entries.keys()}
+
+
+@pytest.mark.parametrize('unwindInline', [False, True])
+@pytest.mark.parametrize('binary', binaries)
+def test_elf_backend_matches_binutils(binary, unwindInline, tmp_path, monkeypatch):
+    elf = os.path.join(binaryDir, binary)
+    monkeypatch.setattr(profileLib, 'unwindInline', unwindInline)
+    reference = buildCache(tmp_path / 'binutils', elf, 'binutils', monkeypatch)
+    assert len(reference) > 0
+    assert buildCache(tmp_path / 'elf', elf, 'elf', monkeypatch) == reference
+
+
+@pytest.mark.parametrize('unwindInline', [False, True])
+@pytest.mark.parametrize('binary', [x for x in binaries if x not in fallbacks])
+def test_elf_lines_match_addr2line(binary, unwindInline, tmp_path, monkeypatch):
+    # The DWARF reader itself has to resolve these, without falling back
+    elf = os.path.join(binaryDir, binary)
+    monkeypatch.setattr(profileLib, 'unwindInline', unwindInline)
+    pcs = sorted(buildCache(tmp_path, elf, 'binutils', monkeypatch))
+    lines = profileLib._elfLines(elf, pcs, unwindInline, profileLib._serialPool(), 1)
+    assert lines is not None
+    assert sorted(lines) == sorted(profileLib._addr2lineShard(elf, pcs, unwindInline))
@@ -0,0 +1,116 @@
+import os
+import sys
+import csv
+import random
+import runpy
+import collections
+import profileLib
+from conftest import writeProfile, runScript
+
+binaryDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'binaries')
+binary = 'x86_64-dwarf5'
+
+
+def randomProfile(path, pcs):
+    # Threads come and go, some intervals have no cpu time and some samples share a wall time
+    rand = random.Random(7)
+    samples = []
+    time = 1000000
+    cpuTimes = {10: 0, 11: 0, 12: 0}
+    for i in range(3000):
+        time += rand.choice([0, 50, 100, 180])
+        threads = []
+        for tid in sorted(rand.sample(list(cpuTimes), rand.randint(1, 3))):
+            cpuTimes[tid] += rand.choice([0, 0, 20000, 90000])
+            threads.append([tid, rand.choice(pcs), cpuTimes[tid]])
+        samples.append([time, rand.uniform(1.0, 5.0), threads])
+    writeProfile(path, samples, [[0x400000, 0x3000, binary]], wallTime=time - 1000000)
+    return samples
+
+
+def aggregatePipeline(correlatedFile, samples, tids=None):
+    # Row by row aggregation of the correlated csv, rows follow the thread records of the profile.
+    # Intervals are split between all threads, also when only some are aggregated
+    rows = [x for x in csv.DictReader((x for x in open(correlatedFile) if not x.startswith('#')), delimiter=';')]
+    assert len(rows) == sum(len(x[2]) for x in samples)
+    aggregated = collections.defaultdict(lambda: [0.0, 0.0, 0.0, 0, 0])
+    lastCpuTime, lastLabel = {}, {}
+    lastTime = None
+    position = 0
+    for (time, pmu, threads) in samples:
+        wall = 0.0 if lastTime is None else (time - lastTime) / 1000000.0
+        lastTime = time
+        records = []
+        for row in rows[position:position + len(threads)]:
+            tid = int(row['thread_id'])
+            cpuTime = round(float(row['cpu_time']) * 1000000000.0)
+            label = row['binary'] + ':' + row['function']
+            records.append([label, max(cpuTime - lastCpuTime.get(tid, cpuTime), 0) / 1000000000.0, lastLabel.get(tid) != label, tids is None or tid in tids])
+            lastCpuTime[tid] = cpuTime
+            lastLabel[tid] = label
+        position += len(threads)
+        total = sum(x[1] for x in records)
+        for label, cpu, execution, selected in records:
+            if not selected:
+                continue
+            share = cpu / total if total > 0 else 1.0 / len(records)
+            entry = aggregated[label]
+            entry[0] += cpu
+            entry[1] += wall * share
+            entry[2] += wall * share * pmu
+            entry[3] += 1
+            entry[4] += execution
+    return {k: [v[0], v[2] / v[1] if v[1] > 0 else 0.0, v[2], v[3], v[4]] for k, v in aggregated.items()}
+
+
+def readAggregated(path):
+    rows = list(csv.reader(open(path), delimiter=';'))
+    assert rows[0] == ['label', 'time', 'power', 'energy', 'samples', 'execs']
+    return {x[0]: [float(x[1]), float(x[2]), float(x[3]), int(x[4]), int(x[5])] for x in rows[1:]}
+
+
+def assertAggregated(result, reference):
+    assert sorted(result) == sorted(reference)
+    for label in reference:
+        for value, expected in zip(result[label], reference[label]):
+            assert abs(value - expected) <= 1e-9 * max(1.0, abs(expected)), (label, result[label], reference[label])
+
+
+def test_pperf2agg_matches_pipeline(tmp_path, monkeypatch):
+    cacheFolder = str(tmp_path / 'cache')
+    monkeypatch.setenv('PPERF_CACHE', cacheFolder)
+    monkeypatch.setattr(profileLib, 'cacheFolder', cacheFolder)
+    elf = os.path.join(binaryDir, binary)
+    runScript('createCache.py', elf)
+    cache = profileLib.elfCache()
+    pcs = sorted(cache.getCache(elf)['cache'].keys()) + [0x10]
+    cache.closeCache(elf)
+
+    profile = str(tmp_path / 'profile.bin')
+    samples = randomProfile(profile, pcs)
+    runScript('pperf2csv.py', profile, '-o', tmp_path / 'profile.csv', '-v', tmp_path / 'profile.vmmap')
+    runScript('correlateAddressCsv.py', tmp_path / 'profile.csv', '-v', tmp_path / 'profile.vmmap', '-s', binaryDir, '--address-column', 'address', '-o', tmp_path / 'correlated.csv')
+    reference = aggregatePipeline(tmp_path / 'correlated.csv', samples)
+    assert len(reference) > 3
+
+    runScript('pperf2agg.py', profile, '-s', binaryDir, '-k', 'binary', 'function', '-o', tmp_path / 'aggregated.csv')
+    assertAggregated(readAggregated(tmp_path / 'aggregated.csv'), reference)
+
+    runScript('pperf2agg.py', profile, '-s', binaryDir, '-k', 'binary', 'function', '-t', 10, 12, '-o', tmp_path / 'threads.csv')
+    assertAggregated(readAggregated(tmp_path / 'threads.csv'), aggregatePipeline(tmp_path / 'correlated.csv', samples, [10, 12]))
+
+    # Small blocks carry the cpu times and labels of the threads across many batches
+    initialize = profileLib.profileReader.__init__
+    monkeypatch.setattr(profileLib.profileReader, '__init__', lambda self, *args, **kwargs: initialize(self, *args, **dict(kwargs, blockSize=1000)))
+    monkeypatch.setattr(sys, 'argv', ['pperf2agg.py', profile, '-s', binaryDir, '-k', 'binary', 'function', '-o', str(tmp_path / 'batched.csv')])
+    runpy.run_path(os.path.join(os.path.dirname(binaryDir), '..', 'pperf2agg.py'), run_name='__main__')
+    assertAggregated(readAggregated(tmp_path / 'batched.csv'), reference)
+
+
+def test_flat_thread_filter_keeps_shares(tmp_path):
+    profile = str(tmp_path / 'profile.bin')
+    randomProfile(profile, [0x401000, 0x401010, 0x401050, 0x10])
+    rows = [x.split(';') for x in runScript('pperf2csv.py', profile, '--type', 'flat', '--no-comment').splitlines()]
+    filtered = [x.split(';') for x in runScript('pperf2csv.py', profile, '--type', 'flat', '--no-comment', '-t', 11).splitlines()]
+    assert filtered[0] == rows[0]
+    assert filtered[1:] == [x for x in rows[1:] if x[2] == '11']
@@ -0,0 +1,107 @@
+import os
+import bz2
+import gzip
+import numpy
+import pytest
+import profileLib
+from conftest import writeProfile, runScript
+
+
+def tiedProfile(path):
+    # Samples 108 to 114 share their wall time, sample 111 is indexed with every 37
+    samples = []
+    time = 5000000
+    for i in range(200):
+        if not 108 < i <= 114:
+            time += 100
+        samples.append([time, float(i), [[1, 0x1000 + i, i * 1000], [2, 0x2000 + i, i * 500]]])
+    writeProfile(path, samples)
+    return samples
+
+
+def test_index_seek_before_tied_times(tmp_path):
+    path = str(tmp_path / 'tied.bin')
+    samples = tiedProfile(path)
+    fromTime = (samples[111][0] - samples[0][0]) / 1000000.0
+    plain = runScript('pperf2csv.py', path, '--from', fromTime, '--to', fromTime + 0.001)
+    assert not os.path.isfile(path + '.idx')
+    indexed = runScript('pperf2csv.py', path, '--build-index', '--index-every', 37, '--from', fromTime, '--to', fromTime + 0.001)
+    assert os.path.isfile(path + '.idx')
+    assert indexed == plain
+    assert len(plain.splitlines()) == 2 + 2 * (7 + 10)
+
+
+def test_index_batches_match_full_read(tmp_path):
+    path = str(tmp_path / 'tied.bin')
+    samples = tiedProfile(path)
+    profile = profileLib.profileReader(path, blockSize=1000)
+    profile.buildIndex(37)
+    for sample in [0, 37, 108, 111, 112, 150, 199]:
+        fromTime = samples[sample][0]
+        profile.rewind()
+        times = [int(x) for batch in profile.batches(fromTime) for x in batch['time']]
+        assert times == [x[0] for x in samples if x[0] >= fromTime]
+    profile.close()
+
+
+def test_mapped_and_compressed_reads_match(tmp_path):
+    path = str(tmp_path / 'profile.bin')
+    samples = []
+    for i in range(500):
+        samples.append([1000 + 7 * i, float(i) / 3, [[1 + j, 0x400000 + 16 * i + j, 1000 * i] for j in range(i % 4)]])
+    writeProfile(path, samples, [[0x400000, 0x1000, 'prog'], [0x7f0000000000, 0x2000, 'libc.so.6']])
+    data = open(path, 'rb').read()
+    with gzip.open(path + '.gz', 'wb') as fp:
+        fp.write(data)
+    with bz2.open(path + '.bz2', 'wb') as fp:
+        fp.write(data)
+
+    reference = None
+    for compressed in ['', '.gz', '.bz2']:
+        profile = profileLib.profileReader(path + compressed, blockSize=256)
+        assert (profile.mapping is not None) == (compressed == '')
+        batches = list(profile.batches())
+        decoded = {x: numpy.concatenate([batch[x] for batch in batches]) for x in ['time', 'pmu', 'threads', 'sample', 'tid', 'pc', 'cputime']}
+        decoded['vmmaps'] = profile.getVMMaps()
+        profile.close()
+        if reference is None:
+            reference = decoded
+        assert decoded['vmmaps'] == reference['vmmaps']
+        for name in ['time', 'pmu', 'threads', 'sample', 'tid', 'pc', 'cputime']:
+            assert numpy.array_equal(decoded[name], reference[name])
+    assert reference['time'].tolist() == [x[0] for x in samples]
+    assert reference['pc'].tolist() == [y[1] for x in samples for y in x[2]]
+
+    for options in [[], ['--from', 0.001, '--to', 0.002, '-t', 2]]:
+        outputs = [runScript('pperf2csv.py', path + x, '-v', str(tmp_path / 'vmmap'), *options) + open(tmp_path / 'vmmap').read() for x in ['', '.gz', '.bz2']]
+        assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_truncated_profiles_fail(tmp_path):
+    path = str(tmp_path / 'profile.bin')
+    writeProfile(path, [[1000 + i, 1.0, [[1, 0x1000, i]]] for i in range(100)])
+    data = open(path, 'rb').read()
+    for compressed in ['', '.gz']:
+        truncated = str(tmp_path / 'truncated.bin') + compressed
+        with (gzip.open if compressed else open)(truncated, 'wb') as fp:
+            fp.write(data[:-100])
+        profile = profileLib.profileReader(truncated, blockSize=256)
+        with pytest.raises(Exception, match='unexpected end of input file'):
+            list(profile.batches())
+        profile.close()
+
+
+def test_index_locates_vmmaps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'profile.bin')
+    writeProfile(path, [[1000 + i, 1.0, [[1, 0x1000 + i, i]] * (i % 3)] for i in range(300)], [[0x400000, 0x1000, 'prog']])
+    for compressed in ['', '.gz']:
+        if compressed:
+            with gzip.open(path + compressed, 'wb') as fp:
+                fp.write(open(path, 'rb').read())
+        profile = profileLib.profileReader(path + compressed, blockSize=256)
+        profile.buildIndex(16)
+        profile.close()
+        profile = profileLib.profileReader(path + compressed, blockSize=256)
+        monkeypatch.setattr(profile, '_blocks', lambda: pytest.fail('samples were scanned'))
+        assert profile.getVMMaps() == [[0x400000, 0x1000, 'prog']]
+        profile.close()
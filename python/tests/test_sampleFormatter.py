@@ -0,0 +1,9 @@
+import profileLib
+
+
+def test_formatters_keep_their_maps():
+    first = profileLib.sampleFormatter({profileLib.SAMPLE.binary: ['a.out'], profileLib.SAMPLE.function: ['main']})
+    second = profileLib.sampleFormatter({profileLib.SAMPLE.binary: ['libc.so.6'], profileLib.SAMPLE.function: ['printf']})
+    sample = [0x1000, 0, None, 0, None, None, None, None, None]
+    assert first.formatSample(first.remapSample(sample)) == 'a.out:main'
+    assert second.formatSample(second.remapSample(sample)) == 'libc.so.6:printf'